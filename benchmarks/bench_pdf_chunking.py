@@ -0,0 +1,78 @@
+import asyncio
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+# End-to-end latency of single-source vs chunked PDF ingestion against a live
+# NotebookLM account (requires `notebooklm login`). Each run creates and
+# deletes its own notebook. --extract-text adds a mode that submits the
+# locally extracted text layer instead (only the first run pays for the
+# extraction; later runs read it from the text cache).
+#
+#   python benchmarks/bench_pdf_chunking.py test.pdf --chunk-pages 5 --runs 3 --extract-text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from analysis_pipeline import ask_and_delete, create_notebook_with_file, local_file
+from nlm_resilience import ResilientClient
+
+PROMPT = "請用三點摘要這份文件的重點。"
+
+
+async def run_once(client, pdf_path, options):
+    started = time.perf_counter()
+    nb = await create_notebook_with_file(
+        client, f"Bench: {os.path.basename(pdf_path)}", local_file(pdf_path), wait_timeout=600.0, **options
+    )
+    ingested = time.perf_counter()
+    await ask_and_delete(client, nb, PROMPT)
+    finished = time.perf_counter()
+    return {"ingest_s": ingested - started, "ask_s": finished - ingested, "total_s": finished - started}
+
+
+def summarize(samples):
+    return {
+        key: {"median": statistics.median(s[key] for s in samples), "max": max(s[key] for s in samples)}
+        for key in ("ingest_s", "ask_s", "total_s")
+    }
+
+
+async def main(pdf_path, chunk_pages, runs, output, extract_text=False):
+    modes = {"single": {}, f"chunked_{chunk_pages}p": {"chunk_pages": chunk_pages}}
+    if extract_text:
+        modes["text"] = {"extract_text": True}
+    results = {mode: [] for mode in modes}
+    async with await ResilientClient.from_storage() as client:
+        # Interleave the modes so backend drift affects both equally.
+        for run in range(runs):
+            for mode, options in modes.items():
+                sample = await run_once(client, pdf_path, options)
+                results[mode].append(sample)
+                print(f"run {run + 1}/{runs} {mode:>14}: ingest {sample['ingest_s']:6.1f}s  "
+                      f"ask {sample['ask_s']:6.1f}s  total {sample['total_s']:6.1f}s")
+
+    report = {mode: summarize(samples) for mode, samples in results.items()}
+    print(f"\n{'mode':>14} | {'ingest med':>10} | {'ask med':>8} | {'total med':>9} | {'total max':>9}")
+    for mode, stats in report.items():
+        print(f"{mode:>14} | {stats['ingest_s']['median']:9.1f}s | {stats['ask_s']['median']:7.1f}s | "
+              f"{stats['total_s']['median']:8.1f}s | {stats['total_s']['max']:8.1f}s")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"pdf": pdf_path, "runs": runs, "samples": results, "summary": report}, f, indent=2)
+        print(f"\nSaved raw samples to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark single-source vs chunked PDF ingestion.")
+    parser.add_argument("pdf_path", nargs="?", default="test.pdf", help="PDF to ingest (default: test.pdf)")
+    parser.add_argument("--chunk-pages", type=int, default=5, help="Pages per chunk source (default: 5)")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per mode (default: 3)")
+    parser.add_argument("--extract-text", action="store_true", help="Also time the local text-extraction path")
+    parser.add_argument("--output", "-o", default=None, help="Write raw samples and summary as JSON")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.pdf_path, args.chunk_pages, args.runs, args.output, args.extract_text))
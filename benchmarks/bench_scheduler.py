@@ -0,0 +1,104 @@
+import asyncio
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# Offline simulation of nlm_scheduler: bulk workers keep the scheduler
+# saturated with slow fake operations while a chat user asks a question at a
+# steady rate. Compares interactive latency with every operation in one FIFO
+# class (what the servers did before the scheduler) against the default
+# priority classes.
+# No NotebookLM account is needed; operation times are simulated sleeps.
+#
+#   python benchmarks/bench_scheduler.py --bulk-workers 16 --asks 40
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from nlm_scheduler import DEFAULT_CLASSES, MAX_CONCURRENCY, PriorityClass, PriorityScheduler, priority
+
+# A single class: every caller falls back to it, so dispatch is first come, first served.
+FIFO_CLASSES = {"shared": PriorityClass(weight=1, max_concurrency=MAX_CONCURRENCY)}
+
+
+def p95(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(0.95 * len(values)))]
+
+
+async def fake_op(scheduler, seconds):
+    async with scheduler.slot("chat.ask"):
+        await asyncio.sleep(seconds)
+
+
+async def run_scenario(scheduler, bulk_workers, asks, ask_interval, op_seconds, seed):
+    rng = random.Random(seed)
+    latencies = []
+    chatting = True
+    bulk_done = 0
+
+    async def bulk_worker():
+        # Like analyze_urls.py / run_pipeline.py workers: keep submitting while the chat runs.
+        nonlocal bulk_done
+        while chatting:
+            await fake_op(scheduler, op_seconds * rng.uniform(0.5, 1.5))
+            bulk_done += 1
+
+    async def bulk():
+        with priority("bulk"):
+            await asyncio.gather(*(bulk_worker() for _ in range(bulk_workers)))
+
+    async def chat():
+        with priority("interactive"):
+            for _ in range(asks):
+                started = time.perf_counter()
+                await fake_op(scheduler, op_seconds * 0.5)
+                latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(ask_interval)
+
+    started = time.perf_counter()
+    bulk_task = asyncio.create_task(bulk())
+    await chat()
+    chatting = False
+    await bulk_task
+    elapsed = time.perf_counter() - started
+    return {
+        "interactive_p50_s": sorted(latencies)[len(latencies) // 2],
+        "interactive_p95_s": p95(latencies),
+        "interactive_max_s": max(latencies),
+        "bulk_ops_per_s": bulk_done / elapsed,
+    }
+
+
+async def main(bulk_workers, asks, ask_interval, op_seconds, output):
+    results = {}
+    for mode, classes in (("fifo", FIFO_CLASSES), ("priority", DEFAULT_CLASSES)):
+        scheduler = PriorityScheduler(classes=classes, max_concurrency=MAX_CONCURRENCY)
+        results[mode] = await run_scenario(scheduler, bulk_workers, asks, ask_interval, op_seconds, seed=1)
+
+    baseline = PriorityScheduler(classes=DEFAULT_CLASSES, max_concurrency=MAX_CONCURRENCY)
+    results["idle"] = await run_scenario(baseline, 0, asks, ask_interval, op_seconds, seed=1)
+
+    print(f"{'mode':>8} | {'ask p50':>8} | {'ask p95':>8} | {'ask max':>8} | {'bulk ops/s':>10}")
+    for mode, stats in results.items():
+        print(f"{mode:>8} | {stats['interactive_p50_s']:7.3f}s | {stats['interactive_p95_s']:7.3f}s | "
+              f"{stats['interactive_max_s']:7.3f}s | {stats['bulk_ops_per_s']:10.1f}")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"bulk_workers": bulk_workers, "asks": asks, "op_seconds": op_seconds, "results": results}, f, indent=2)
+        print(f"\nSaved results to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate interactive latency under a bulk job, FIFO vs priority classes.")
+    parser.add_argument("--bulk-workers", type=int, default=16, help="Concurrent bulk submitters (default: 16)")
+    parser.add_argument("--asks", type=int, default=40, help="Interactive asks (default: 40)")
+    parser.add_argument("--ask-interval", type=float, default=0.02, help="Pause between asks in seconds (default: 0.02)")
+    parser.add_argument("--op-seconds", type=float, default=0.05, help="Mean simulated operation time (default: 0.05)")
+    parser.add_argument("--output", "-o", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.bulk_workers, args.asks, args.ask_interval, args.op_seconds, args.output))
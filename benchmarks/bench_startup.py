@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# Cold-start cost of the CLI scripts and servers.
+#
+# "import" rows time a fresh interpreter that imports a module or runs a
+# script with --help (the interpreter's own startup is reported separately
+# as the baseline). With --serve, the FastAPI server is started under
+# uvicorn and polled until /healthz and /readyz answer; readiness needs a
+# live NotebookLM login (`notebooklm login`), otherwise it times out.
+#
+#   python benchmarks/bench_startup.py --runs 5 --serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT, "scripts")
+
+CASES = {
+    "python (baseline)": ["-c", "pass"],
+    "analyze_files.py --help": [os.path.join(SCRIPTS, "analyze_files.py"), "--help"],
+    "analyze_urls.py --help": [os.path.join(SCRIPTS, "analyze_urls.py"), "--help"],
+    "run_pipeline.py --help": [os.path.join(SCRIPTS, "run_pipeline.py"), "--help"],
+    "fastapi_client.py --help": [os.path.join(SCRIPTS, "fastapi_client.py"), "--help"],
+    "mcp_http_client.py --help": [os.path.join(SCRIPTS, "mcp_http_client.py"), "--help"],
+    "import fastapi_server": ["-c", "import fastapi_server"],
+    "import mcp_server": ["-c", "import mcp_server"],
+}
+
+
+def time_process(args, runs):
+    env = {**os.environ, "PYTHONPATH": SCRIPTS}
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=SCRIPTS, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        samples.append(time.perf_counter() - started)
+    return {"median_s": statistics.median(samples), "min_s": min(samples)}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.05)
+    return None
+
+
+def time_server(timeout):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fastapi_server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SCRIPTS, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = started + timeout
+        healthy = _wait_for(f"{base}/healthz", deadline)
+        ready = _wait_for(f"{base}/readyz", deadline) if healthy else None
+        warmup = None
+        if ready:
+            with urllib.request.urlopen(f"{base}/readyz") as r:
+                warmup = json.load(r).get("steps_s")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return {
+        "healthz_s": healthy - started if healthy else None,
+        "readyz_s": ready - started if ready else None,
+        "warmup_steps_s": warmup,
+    }
+
+
+def main(runs, serve, timeout, output):
+    results = {"imports": {}}
+    print(f"{'case':>28} | {'median':>8} | {'min':>8}")
+    for name, args in CASES.items():
+        stats = time_process(args, runs)
+        results["imports"][name] = stats
+        print(f"{name:>28} | {stats['median_s']:7.3f}s | {stats['min_s']:7.3f}s")
+
+    if serve:
+        server = time_server(timeout)
+        results["fastapi_server"] = server
+        fmt = lambda v: f"{v:.2f}s" if v is not None else f"not within {timeout:.0f}s"
+        print(f"\nfastapi_server: /healthz after {fmt(server['healthz_s'])}, /readyz after {fmt(server['readyz_s'])}")
+        if server["warmup_steps_s"]:
+            print(f"warm-up steps: {server['warmup_steps_s']}")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"runs": runs, "results": results}, f, indent=2)
+        print(f"\nSaved results to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import / startup time of the CLI scripts and servers.")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per case (default: 5)")
+    parser.add_argument("--serve", action="store_true", help="Also time FastAPI server startup until /healthz and /readyz")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for the server (default: 60)")
+    parser.add_argument("--output", "-o", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    main(args.runs, args.serve, args.timeout, args.output)
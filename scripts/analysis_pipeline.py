@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import urllib.request
+from typing import NamedTuple
+from urllib.parse import urlparse
+
+from media_preprocess import preprocess_media_async
+from nlm_resilience import is_not_found
+from nlm_tracing import span
+from pdf_chunking import is_pdf, split_pdf
+from text_extraction import extract_text_async, fetch_page, is_extractable, is_fetchable_url
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Shared analysis pipeline for fastapi_server.py and mcp_server.py
+#
+# Notebook creation does not depend on the file, so it is started at the same
+# time as the download/spool instead of after it. The upload starts from the
+# spooled file the moment both are ready, which takes one RPC round trip (plus
+# any download/spool overlap) off every request's critical path.
+#
+# With extract_text=True, PDFs, HTML and text files (and web pages, fetched
+# locally) are turned into text in a process pool and submitted as a text
+# source, so NotebookLM skips parsing the document. Inputs without usable
+# text fall back to the file upload / add_url path.
+# ---------------------------------------------------------------------------
+
+SOURCE_WAIT_TIMEOUT = 120.0
+CHUNK_UPLOAD_CONCURRENCY = 4
+URL_PROCESSING_DELAY = 5   # add_url returns before the page is indexed
+
+URL_PROMPT = (
+    "請針對這個網頁或影片進行深度分析，並以繁體中文與 Markdown 格式輸出詳細報告。內容應包含：\n"
+    "1. **講者個人想法**：分析講者/作者對主題的主觀看法、立場與態度。\n"
+    "2. **關鍵重要觀念**：列出內容中強調的核心理念或獨特見解（Golden Nuggets）。\n"
+    "3. **專案規劃與行動**：是否提到具體的專案、未來計畫或行動步驟？\n"
+    "4. **問題與解決方案**：討論中提到的挑戰及其對應解法。\n"
+    "5. **總結**：整部內容的精華摘要。"
+)
+
+
+def file_prompt(file_name: str) -> str:
+    return (
+        f"請針對這份檔案 ({file_name}) 進行深度分析，並以繁體中文與 Markdown 格式輸出詳細報告。內容應包含：\n"
+        "1. **核心摘要**：這份檔案的主要內容目的與結論。\n"
+        "2. **關鍵觀點與發現**：列出內容中最重要的數據、論點或洞察（Golden Nuggets）。\n"
+        "3. **作者/講者立場**：分析作者或講者的觀點與潛在意圖。\n"
+        "4. **問題與解決方案**：提到的主要挑戰及其對應解法。\n"
+        "5. **行動建議**：基於內容，讀者接下來可以採取的具體行動。\n"
+    )
+
+
+class SpoolError(Exception):
+    """The input file could not be downloaded or written to disk."""
+
+
+class TextSource(NamedTuple):
+    """Locally extracted text, uploaded with sources.add_text() instead of a file."""
+    title: str
+    text: str
+
+
+# ---------------------------------------------------------------------------
+# Spooling
+# ---------------------------------------------------------------------------
+
+def new_spool_dir() -> str:
+    """Private temp directory per request, so equal file names never collide."""
+    return tempfile.mkdtemp(prefix="notebooklm-")
+
+
+def remote_file_name(file_url: str, default: str = "downloaded_file.pdf") -> str:
+    file_name = os.path.basename(urlparse(file_url).path)
+    if not file_name or "." not in file_name:
+        return default
+    return file_name
+
+
+async def download_file(file_url: str, dest: str) -> str:
+    with span("download", url=file_url) as current:
+        try:
+            await asyncio.to_thread(urllib.request.urlretrieve, file_url, dest)
+        except Exception as e:
+            raise SpoolError(e) from e
+        current.set(bytes=os.path.getsize(dest))
+    return dest
+
+
+async def spool_upload(upload, dest: str) -> str:
+    """Stream a FastAPI UploadFile to `dest` without holding it all in memory."""
+    def copy():
+        upload.file.seek(0)
+        with open(dest, "wb") as f:
+            shutil.copyfileobj(upload.file, f, 1024 * 1024)
+
+    with span("spool", file_name=upload.filename) as current:
+        try:
+            await asyncio.to_thread(copy)
+        except Exception as e:
+            raise SpoolError(e) from e
+        current.set(bytes=os.path.getsize(dest))
+    return dest
+
+
+async def local_file(path: str) -> str:
+    return path
+
+
+async def link_file(src: str, dest: str) -> str:
+    """Make `src` available as `dest` (a hard link, or a copy across filesystems)."""
+    def link():
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copyfile(src, dest)
+
+    with span("spool", file_name=os.path.basename(dest)):
+        try:
+            await asyncio.to_thread(link)
+        except Exception as e:
+            raise SpoolError(e) from e
+    return dest
+
+
+# ---------------------------------------------------------------------------
+# Notebook stages
+# ---------------------------------------------------------------------------
+
+async def _extracted(path: str) -> TextSource | None:
+    with span("extract_text", file_name=os.path.basename(path)) as current:
+        try:
+            text = await extract_text_async(path)
+        except Exception as e:
+            # e.g. a worker process died; the file upload still works.
+            logger.warning("Text extraction failed for %s: %s", path, e)
+            text = None
+        current.set(chars=len(text) if text else 0, fallback=text is None)
+    return TextSource(os.path.basename(path), text) if text is not None else None
+
+
+async def _fetched_text(url: str) -> str | None:
+    """Readable text of `url` fetched and extracted locally, or None to let NotebookLM fetch it."""
+    spool_dir = new_spool_dir()
+    with span("extract_text", url=url) as current:
+        try:
+            path = await asyncio.to_thread(fetch_page, url, spool_dir)
+            text = await extract_text_async(path) if path else None
+        except Exception as e:
+            logger.warning("Local fetch of %s failed (%s); using add_url", url, e)
+            text = None
+        finally:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+        current.set(chars=len(text) if text else 0, fallback=text is None)
+    return text
+
+
+async def _prepared(spool, preprocess: bool, chunk_dir: str, chunk_pages: int | None,
+                    chunk_max_mb: float | None, extract_text: bool = False) -> list:
+    path = await spool
+    if extract_text and is_extractable(path):
+        extracted = await _extracted(path)
+        if extracted is not None:
+            return [extracted]
+    if preprocess:
+        with span("preprocess"):
+            path = await preprocess_media_async(path)
+    if (chunk_pages or chunk_max_mb) and is_pdf(path):
+        max_bytes = int(chunk_max_mb * 1024 ** 2) if chunk_max_mb else None
+        with span("pdf.split") as current:
+            try:
+                paths = await asyncio.to_thread(split_pdf, path, chunk_dir, chunk_pages, max_bytes)
+            except Exception as e:
+                # e.g. an encrypted or malformed PDF: let NotebookLM have the original.
+                logger.warning("Could not split %s (%s); uploading it as one source", path, e)
+                paths = [path]
+            current.set(chunks=len(paths))
+        return paths
+    return [path]
+
+
+async def _add_source(client, notebook_id: str, source, **kwargs):
+    if isinstance(source, TextSource):
+        return await client.sources.add_text(notebook_id, source.title, source.text, **kwargs)
+    return await client.sources.add_file(notebook_id, source, **kwargs)
+
+
+async def upload_files(client, notebook_id: str, paths: list, wait_timeout: float = SOURCE_WAIT_TIMEOUT):
+    """Upload one source per path (or TextSource) concurrently and wait until all are ready."""
+    if len(paths) == 1:
+        await _add_source(client, notebook_id, paths[0], wait=True, wait_timeout=wait_timeout)
+        return
+    semaphore = asyncio.Semaphore(CHUNK_UPLOAD_CONCURRENCY)
+
+    async def add(path):
+        async with semaphore:
+            return await _add_source(client, notebook_id, path)
+
+    sources = await asyncio.gather(*(add(path) for path in paths))
+    await client.sources.wait_for_sources(notebook_id, [s.id for s in sources], timeout=wait_timeout)
+
+
+async def create_notebook_with_file(client, nb_title: str, spool, *, preprocess: bool = False,
+                                    chunk_pages: int | None = None, chunk_max_mb: float | None = None,
+                                    extract_text: bool = False, wait_timeout: float = SOURCE_WAIT_TIMEOUT):
+    """Create a notebook while `spool` (an awaitable yielding a local path) runs, then upload.
+
+    With `chunk_pages` / `chunk_max_mb` a PDF is split into page-range chunks
+    that are uploaded as separate sources in parallel. With `extract_text`
+    a PDF / HTML / text file with a usable text layer is submitted as text
+    instead (chunking then does not apply). Returns the notebook once every
+    source is ready. If any stage fails the notebook is deleted before the
+    error propagates.
+    """
+    chunk_dir = tempfile.mkdtemp(prefix="notebooklm-chunks-")
+    nb_task = asyncio.ensure_future(client.notebooks.create(nb_title))
+    spool_task = asyncio.ensure_future(
+        _prepared(spool, preprocess, chunk_dir, chunk_pages, chunk_max_mb, extract_text)
+    )
+    nb = None
+    try:
+        # Whichever fails first (e.g. create rejected while a large spool is
+        # still running) fails the whole call right away.
+        done, _ = await asyncio.wait({nb_task, spool_task}, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+        nb = nb_task.result()
+        paths = spool_task.result()
+        await upload_files(client, nb.id, paths, wait_timeout)
+        return nb
+    except BaseException:
+        spool_task.cancel()
+        if nb is None:
+            # Let an in-flight create finish so the notebook can be removed
+            # rather than orphaned on the server.
+            try:
+                nb = await nb_task
+            except Exception:
+                nb = None
+        if nb is not None:
+            await _delete_quietly(client, nb.id)
+        raise
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+
+async def create_notebook_with_url(client, nb_title: str, url: str, *, extract_text: bool = False):
+    """Create a notebook holding `url`.
+
+    With `extract_text` a web page is fetched and extracted locally while the
+    notebook is created, then added as text and waited on, instead of
+    add_url plus the fixed URL_PROCESSING_DELAY. YouTube links and pages
+    without usable text go through add_url.
+    """
+    text_task = asyncio.ensure_future(_fetched_text(url)) if extract_text and is_fetchable_url(url) else None
+    nb = None
+    try:
+        nb = await client.notebooks.create(nb_title)
+        text = await text_task if text_task else None
+        if text is not None:
+            await client.sources.add_text(nb.id, url, text, wait=True, wait_timeout=SOURCE_WAIT_TIMEOUT)
+        else:
+            await client.sources.add_url(nb.id, url)
+            with span("wait.url_processing"):
+                await asyncio.sleep(URL_PROCESSING_DELAY)
+    except BaseException:
+        if text_task:
+            text_task.cancel()
+        if nb is not None:
+            await _delete_quietly(client, nb.id)
+        raise
+    return nb
+
+
+async def _delete_quietly(client, notebook_id: str):
+    try:
+        await client.notebooks.delete(notebook_id)
+    except Exception:
+        pass
+
+
+async def ask_and_delete(client, nb, prompt: str) -> str:
+    try:
+        result = await client.chat.ask(nb.id, prompt)
+    finally:
+        await _delete_quietly(client, nb.id)
+    return result.answer
+
+
+async def ask_shared_source(client, sources, key: tuple, create, prompt: str) -> str:
+    """Ask `prompt` against the registry's notebook for `key`, ingesting it via `create()` on a miss.
+
+    If the notebook was deleted behind the registry's back, the key is
+    discarded and the source ingested again, once.
+    """
+    for retry in (False, True):
+        with span("source.acquire", source=key[0]):
+            notebook_id = await sources.acquire(key, create)
+        gone = False
+        try:
+            result = await client.chat.ask(notebook_id, prompt)
+        except Exception as e:
+            if retry or not is_not_found(e):
+                raise
+            gone = True
+        finally:
+            sources.release(key, notebook_id)
+        if not gone:
+            return result.answer
+        logger.warning("Shared notebook %s for %r no longer exists; ingesting again", notebook_id, key)
+        sources.discard(key, notebook_id)
+
+
+async def analyze_file_source(client, nb_title: str, spool, prompt: str, *, preprocess: bool = False,
+                              chunk_pages: int | None = None, chunk_max_mb: float | None = None,
+                              extract_text: bool = False) -> str:
+    nb = await create_notebook_with_file(
+        client, nb_title, spool, preprocess=preprocess, chunk_pages=chunk_pages, chunk_max_mb=chunk_max_mb,
+        extract_text=extract_text,
+    )
+    return await ask_and_delete(client, nb, prompt)
+
+
+async def analyze_url_source(client, nb_title: str, url: str, prompt: str, *, extract_text: bool = False) -> str:
+    nb = await create_notebook_with_url(client, nb_title, url, extract_text=extract_text)
+    return await ask_and_delete(client, nb, prompt)
@@ -1,99 +1,251 @@
 
 import asyncio
+import argparse
 import os
 import json
+import random
 import re
-from notebooklm import NotebookLMClient
+from batch_manifest import DONE, FAILED, PENDING, Manifest, video_key
+from nlm_resilience import ResilientClient
+from nlm_scheduler import priority
+from nlm_tracing import span, trace
 
 # Configuration
 URLS_FILE = "video_urls.json"
 OUTPUT_DIR = "analysis_reports2"
+MANIFEST_FILE = os.path.join(OUTPUT_DIR, "manifest.sqlite3")
+
+# Retry policy: per-item attempts with exponential backoff, plus a budget of
+# retries shared by the whole run so a dead backend cannot stretch it forever.
+MAX_ATTEMPTS = 3
+RETRY_BUDGET = 20
+BACKOFF_BASE = 10   # seconds before the first retry
+BACKOFF_MAX = 300
 
 def sanitize_filename(name):
     """Sanitize filename to be safe for file systems."""
     return re.sub(r'[\\/*?:"<>|]', "", name).replace(" ", "_")
 
-async def analyze_single_video(client, video):
+QUERY = (
+    "請針對這部影片進行深度分析，並以繁體中文與 Markdown 格式輸出詳細報告。內容應包含：\n"
+    "1. **講者個人想法**：分析講者對主題的主觀看法、立場與態度。\n"
+    "2. **關鍵重要觀念**：列出講者強調的核心理念或獨特見解（Golden Nuggets）。\n"
+    "3. **專案規劃與行動**：講者是否提到具體的專案、未來計畫或行動步驟？\n"
+    "4. **問題與解決方案**：討論中提到的挑戰及其對應解法。\n"
+    "5. **總結**：整部影片的精華摘要。"
+    "6. **其他**：是否有提到講者參考甚麼youtube影片或是其他教學資源。"
+)
+
+def report_path(video):
+    return os.path.join(OUTPUT_DIR, f"{sanitize_filename(video['title'])}_{video_key(video)}_analysis_result.md")
+
+def legacy_report_path(video):
+    """Report name used before the manifest existed (title only)."""
+    return os.path.join(OUTPUT_DIR, f"{sanitize_filename(video['title'])}_analysis_result.md")
+
+def write_report(video, answer):
+    output_file = report_path(video)
+    with open(output_file, "w", encoding='utf-8') as f:
+        f.write(f"# 分析報告：{video['title']}\n\n")
+        f.write(f"**來源影片**: [{video['title']}]({video['url']})\n\n")
+        f.write(answer)
+    return output_file
+
+async def analyze_video(client, video, on_notebook=None):
+    """Run one video through a temporary notebook and return the answer text.
+
+    Uses the local audio file in `video['audio_path']` when present (see
+    utils/youtube/download_videos.py), otherwise adds the URL directly.
+    `on_notebook` is called with the notebook id once it exists and with None
+    once it has been deleted, so callers can track notebooks left behind.
+    """
     title = video['title']
-    url = video['url']
-    safe_title = sanitize_filename(title)
-    output_file = os.path.join(OUTPUT_DIR, f"{safe_title}_analysis_result.md")
-    
-    if os.path.exists(output_file):
-        print(f"Skipping {title} (Report already exists)")
-        return
 
-    print(f"--- Processing: {title} ---")
-    
+    # Create a new notebook for this SPECIFIC video
+    nb_title = f"Analysis: {title}"
+    print(f"Creating notebook: '{nb_title}'...")
+    nb = await client.notebooks.create(nb_title)
+    if on_notebook:
+        on_notebook(nb.id)
     try:
-        # Create a new notebook for this SPECIFIC video
-        nb_title = f"Analysis: {title}"
-        print(f"Creating notebook: '{nb_title}'...")
-        nb = await client.notebooks.create(nb_title)
-
         # Add source
-        print(f"Adding source: {url}...")
-        await client.sources.add_url(nb.id, url)
-        
-        # Wait for processing
-        print("Waiting for source processing (5s)...")
-        await asyncio.sleep(5)
+        if video.get('audio_path'):
+            print(f"Uploading audio: {video['audio_path']}...")
+            await client.sources.add_file(nb.id, video['audio_path'], wait=True, wait_timeout=300.0)
+        else:
+            print(f"Adding source: {video['url']}...")
+            await client.sources.add_url(nb.id, video['url'])
+
+            # Wait for processing
+            print("Waiting for source processing (5s)...")
+            await asyncio.sleep(5)
 
         # Query
-        query = (
-            "請針對這部影片進行深度分析，並以繁體中文與 Markdown 格式輸出詳細報告。內容應包含：\n"
-            "1. **講者個人想法**：分析講者對主題的主觀看法、立場與態度。\n"
-            "2. **關鍵重要觀念**：列出講者強調的核心理念或獨特見解（Golden Nuggets）。\n"
-            "3. **專案規劃與行動**：講者是否提到具體的專案、未來計畫或行動步驟？\n"
-            "4. **問題與解決方案**：討論中提到的挑戰及其對應解法。\n"
-            "5. **總結**：整部影片的精華摘要。"
-            "6. **其他**：是否有提到講者參考甚麼youtube影片或是其他教學資源。"
-        )
         print(f"Querying analysis...")
-        result = await client.chat.ask(nb.id, query)
-        
-        # Save result
-        with open(output_file, "w", encoding='utf-8') as f:
-            f.write(f"# 分析報告：{title}\n\n")
-            f.write(f"**來源影片**: [{title}]({url})\n\n")
-            f.write(result.answer)
-            
-        print(f"Saved report to: {output_file}")
-        
+        result = await client.chat.ask(nb.id, QUERY)
+        return result.answer
+    finally:
         # Cleanup: Delete notebook
         print(f"Deleting temporary notebook: {nb.id}...")
-        await client.notebooks.delete(nb.id)
-        print("Notebook deleted.")
-        
-    except Exception as e:
-        print(f"Error analyzing {title}: {e}")
+        try:
+            await client.notebooks.delete(nb.id)
+        except Exception as e:
+            # Keep the answer (or the real error); the notebook id stays in the
+            # manifest, so cleanup_orphaned_notebooks() deletes it on restart.
+            print(f"Could not delete notebook {nb.id}: {e}")
+        else:
+            if on_notebook:
+                on_notebook(None)
+            print("Notebook deleted.")
+
+class RetryBudget:
+    """Number of retries still allowed across the whole run."""
+
+    def __init__(self, total):
+        self.remaining = total
+
+    def take(self):
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+def backoff_delay(attempt):
+    """Exponential backoff with jitter for the given (1-based) failed attempt."""
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+async def analyze_with_retries(client, manifest, video, budget, max_attempts=MAX_ATTEMPTS):
+    """Analyze one video, recording every attempt in the manifest.
 
-async def main():
+    Returns the answer text, or re-raises the last error once the item's
+    attempts or the shared retry budget are exhausted.
+    """
+    video_id = video_key(video)
+    track = lambda notebook_id: manifest.set_notebook(video_id, notebook_id)
+    # One trace per item, covering every attempt and the backoff between them.
+    with trace("video", video_id=video_id, title=video["title"]) as root:
+        for attempt in range(1, max_attempts + 1):
+            root.set(attempts=attempt)
+            manifest.start(video_id)
+            try:
+                return await analyze_video(client, video, on_notebook=track)
+            except Exception as e:
+                manifest.fail(video_id, e)
+                print(f"Error analyzing {video['title']} (attempt {attempt}/{max_attempts}): {e}")
+                if attempt == max_attempts or not budget.take():
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"Retrying in {delay:.0f}s ({budget.remaining} retries left in budget)...")
+                with span("backoff", seconds=round(delay, 1)):
+                    await asyncio.sleep(delay)
+
+async def process_video(client, manifest, video, budget, max_attempts=MAX_ATTEMPTS):
+    print(f"--- Processing: {video['title']} ---")
+    try:
+        answer = await analyze_with_retries(client, manifest, video, budget, max_attempts)
+    except Exception:
+        return False
+    output_file = write_report(video, answer)
+    manifest.finish(video_key(video), output_file)
+    print(f"Saved report to: {output_file}")
+    return True
+
+async def cleanup_orphaned_notebooks(client, manifest):
+    """Delete notebooks left behind by items that were interrupted mid-run."""
+    for video_id, notebook_id in manifest.orphaned_notebooks():
+        print(f"Deleting leftover notebook {notebook_id} (video {video_id})...")
+        try:
+            await client.notebooks.delete(notebook_id)
+        except Exception as e:
+            print(f"Could not delete notebook {notebook_id}: {e}")
+            continue
+        manifest.set_notebook(video_id, None)
+
+def register_videos(manifest, video_data):
+    """Add videos to the manifest; reports written before it existed count as done.
+
+    A legacy report is named after the title only, so it is adopted only while
+    exactly one known video has that title; otherwise every such video is redone.
+    """
+    claims = {}
+    for video in [*manifest.items(), *video_data]:
+        claims.setdefault(legacy_report_path(video), set()).add(video_key(video))
+    for video in video_data:
+        legacy = legacy_report_path(video)
+        if len(claims[legacy]) == 1 and os.path.exists(legacy):
+            manifest.add(video, status=DONE, report_path=legacy)
+        else:
+            manifest.add(video)
+    # A title seen again after its legacy report was adopted: neither video owns it.
+    for row in manifest.items([DONE]):
+        if row["report_path"] == legacy_report_path(row) and len(claims.get(row["report_path"], ())) > 1:
+            manifest.reopen(row["video_id"])
+
+async def main(resume=False, max_attempts=MAX_ATTEMPTS, retry_budget=RETRY_BUDGET):
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
 
-    if not os.path.exists(URLS_FILE):
-        print(f"URLs file not found: {URLS_FILE}")
-        return
+    manifest = Manifest(MANIFEST_FILE)
+    manifest.reset_interrupted()
+
+    if resume:
+        # Only what the manifest still lists as pending or failed; no URLs file needed.
+        video_data = [
+            {'id': row['video_id'], 'title': row['title'], 'url': row['url']}
+            for row in manifest.items([PENDING, FAILED])
+        ]
+    else:
+        if not os.path.exists(URLS_FILE):
+            print(f"URLs file not found: {URLS_FILE}")
+            return
+
+        with open(URLS_FILE, 'r', encoding='utf-8') as f:
+            video_data = json.load(f)
+
+        register_videos(manifest, video_data)
+        skipped = [v for v in video_data if manifest.get(video_key(v))['status'] == DONE]
+        for video in skipped:
+            print(f"Skipping {video['title']} (already done)")
+        video_data = [v for v in video_data if v not in skipped]
 
-    with open(URLS_FILE, 'r', encoding='utf-8') as f:
-        video_data = json.load(f)
-    
     if not video_data:
         print("No URLs found to analyze.")
+        manifest.close()
         return
 
     print(f"Found {len(video_data)} videos to analyze individually.")
+    budget = RetryBudget(retry_budget)
 
     print("\nConnecting to NotebookLM...")
-    async with await NotebookLMClient.from_storage() as client:
+    async with await ResilientClient.from_storage() as client:
+        await cleanup_orphaned_notebooks(client, manifest)
+
         # Process videos one by one (or in small batches if needed)
         for i, video in enumerate(video_data):
             print(f"\n[{i+1}/{len(video_data)}]")
-            await analyze_single_video(client, video)
+            await process_video(client, manifest, video, budget, max_attempts)
             if i < len(video_data) - 1:
                 print("Cooling down (2s)...")
                 await asyncio.sleep(2)
 
+    print(f"\nManifest: {manifest.summary()}")
+    manifest.close()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Analyze every video in video_urls.json with NotebookLM.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Process only items the manifest lists as pending or failed")
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS,
+                        help=f"Attempts per video (default: {MAX_ATTEMPTS})")
+    parser.add_argument("--retry-budget", type=int, default=RETRY_BUDGET,
+                        help=f"Total retries allowed for the whole run (default: {RETRY_BUDGET})")
+    parser.add_argument("--digest", action="store_true",
+                        help="Afterwards, combine all finished reports into one digest (see digest_reports.py)")
+    args = parser.parse_args()
+
+    # The context variable is copied into asyncio.run's main task.
+    with priority("bulk"):
+        asyncio.run(main(args.resume, args.max_attempts, args.retry_budget))
+        if args.digest:
+            import digest_reports  # imports this module, so only load it when asked
+            asyncio.run(digest_reports.main())
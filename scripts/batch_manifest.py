@@ -0,0 +1,122 @@
+import hashlib
+import sqlite3
+import time
+from urllib.parse import parse_qs, urlparse
+
+# Durable per-video state for batch analysis (analyze_urls.py, run_pipeline.py).
+# Rows are keyed by video id rather than by title, so two videos whose titles
+# sanitize to the same filename no longer collide.
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    video_id     TEXT PRIMARY KEY,
+    title        TEXT NOT NULL,
+    url          TEXT NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'pending',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    notebook_id  TEXT,
+    report_path  TEXT,
+    last_error   TEXT,
+    started_at   REAL,
+    finished_at  REAL,
+    duration_s   REAL
+)
+"""
+
+
+def video_key(video):
+    """Return a stable id for a video: its YouTube id if known, else a URL hash."""
+    if video.get('id'):
+        return video['id']
+    parsed = urlparse(video['url'])
+    if parsed.hostname and parsed.hostname.endswith("youtu.be"):
+        return parsed.path.lstrip("/")
+    v = parse_qs(parsed.query).get("v")
+    if v:
+        return v[0]
+    return hashlib.sha1(video['url'].encode("utf-8")).hexdigest()[:16]
+
+
+class Manifest:
+    """SQLite-backed record of status, attempts, timings and notebook id per video."""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def _update(self, video_id, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._db.execute(f"UPDATE items SET {columns} WHERE video_id = ?", (*fields.values(), video_id))
+        self._db.commit()
+
+    def add(self, video, status=PENDING, report_path=None):
+        """Register a video if it is not known yet and return its id."""
+        video_id = video_key(video)
+        self._db.execute(
+            "INSERT OR IGNORE INTO items (video_id, title, url, status, report_path) VALUES (?, ?, ?, ?, ?)",
+            (video_id, video['title'], video['url'], status, report_path),
+        )
+        self._db.commit()
+        return video_id
+
+    def get(self, video_id):
+        row = self._db.execute("SELECT * FROM items WHERE video_id = ?", (video_id,)).fetchone()
+        return dict(row) if row else None
+
+    def items(self, statuses=None):
+        if statuses is None:
+            rows = self._db.execute("SELECT * FROM items ORDER BY rowid")
+        else:
+            marks = ", ".join("?" for _ in statuses)
+            rows = self._db.execute(f"SELECT * FROM items WHERE status IN ({marks}) ORDER BY rowid", tuple(statuses))
+        return [dict(row) for row in rows]
+
+    def start(self, video_id):
+        self._db.execute(
+            "UPDATE items SET status = ?, attempts = attempts + 1, started_at = ?, finished_at = NULL WHERE video_id = ?",
+            (RUNNING, time.time(), video_id),
+        )
+        self._db.commit()
+
+    def set_notebook(self, video_id, notebook_id):
+        self._update(video_id, notebook_id=notebook_id)
+
+    def finish(self, video_id, report_path):
+        now = time.time()
+        started = self.get(video_id)["started_at"] or now
+        self._update(video_id, status=DONE, report_path=report_path, last_error=None,
+                     finished_at=now, duration_s=now - started)
+
+    def fail(self, video_id, error):
+        now = time.time()
+        started = self.get(video_id)["started_at"] or now
+        self._update(video_id, status=FAILED, last_error=str(error), finished_at=now, duration_s=now - started)
+
+    def reopen(self, video_id):
+        """Mark a finished item pending again, dropping its report."""
+        self._update(video_id, status=PENDING, report_path=None, finished_at=None)
+
+    def orphaned_notebooks(self):
+        """Rows that still reference a notebook: interrupted or failed-to-delete items."""
+        rows = self._db.execute("SELECT video_id, notebook_id FROM items WHERE notebook_id IS NOT NULL")
+        return [(row["video_id"], row["notebook_id"]) for row in rows]
+
+    def reset_interrupted(self):
+        """Mark items left RUNNING by a killed process as pending again."""
+        self._db.execute("UPDATE items SET status = ? WHERE status = ?", (PENDING, RUNNING))
+        self._db.commit()
+
+    def summary(self):
+        rows = self._db.execute("SELECT status, COUNT(*) AS n FROM items GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
@@ -0,0 +1,148 @@
+import logging
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Chat sessions shared by fastapi_server.py and mcp_server.py
+#
+# A session is one source-backed notebook plus the conversation state needed
+# to ask follow-ups in it, so multi-turn analysis ingests the source once.
+# ---------------------------------------------------------------------------
+
+SESSION_TTL_SECONDS = 7200       # 2 hours
+CLEANUP_INTERVAL_SECONDS = 300   # check every 5 minutes
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    notebook_id: str
+    title: str
+    source_type: str
+    created_at: datetime
+    conversation_id: str | None = None
+    turn_count: int = 0
+    turns: list[dict] = field(default_factory=list)
+    # Set when the notebook is shared through a SourceRegistry.
+    source_key: tuple | None = None
+
+
+def session_to_info(s: ChatSession) -> dict:
+    return {
+        "session_id": s.session_id,
+        "notebook_id": s.notebook_id,
+        "title": s.title,
+        "source_type": s.source_type,
+        "created_at": s.created_at.isoformat(),
+        "turn_count": s.turn_count,
+    }
+
+
+class SessionRegistry:
+    """In-memory sessions, expired after `ttl_seconds` and optionally capped in number.
+
+    When `max_sessions` is set, the oldest sessions beyond the cap are treated
+    as expired by the next cleanup() so an agent cannot leak notebooks.
+    Sessions added with a `source_key` release their shared notebook to
+    `sources` on close instead of deleting it.
+    """
+
+    def __init__(self, ttl_seconds: float = SESSION_TTL_SECONDS, max_sessions: int | None = None,
+                 sources=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.sources = sources
+        self._sessions: dict[str, ChatSession] = {}
+
+    def add(self, notebook_id: str, title: str, source_type: str, source_key: tuple | None = None) -> ChatSession:
+        session = ChatSession(
+            session_id=str(uuid.uuid4()),
+            notebook_id=notebook_id,
+            title=title,
+            source_type=source_type,
+            created_at=datetime.now(timezone.utc),
+            source_key=source_key,
+        )
+        self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str) -> ChatSession | None:
+        return self._sessions.get(session_id)
+
+    def pop(self, session_id: str) -> ChatSession | None:
+        return self._sessions.pop(session_id, None)
+
+    def values(self) -> list[ChatSession]:
+        return list(self._sessions.values())
+
+    def expired(self) -> list[ChatSession]:
+        now = datetime.now(timezone.utc)
+        oldest_first = sorted(self._sessions.values(), key=lambda s: s.created_at)
+        over_cap = len(oldest_first) - self.max_sessions if self.max_sessions else 0
+        return [
+            s for i, s in enumerate(oldest_first)
+            if i < over_cap or (now - s.created_at).total_seconds() > self.ttl_seconds
+        ]
+
+    async def ask(self, client, session: ChatSession, question: str):
+        """Ask within the session's conversation and record the turn."""
+        # notebooklm-py >= 0.8 caches each turn on the client that asked it and
+        # reads the turn count back from the server, so a follow-up needs only
+        # the conversation id. Older releases expect the caller to seed the
+        # cache; clear it first, a long-lived client may already hold the turns.
+        core = getattr(client, "_core", None)
+        if session.conversation_id and session.turns and hasattr(core, "cache_conversation_turn"):
+            core.clear_conversation_cache(session.conversation_id)
+            for turn in session.turns:
+                core.cache_conversation_turn(
+                    session.conversation_id,
+                    turn["query"],
+                    turn["answer"],
+                    turn["turn_number"],
+                )
+
+        result = await client.chat.ask(
+            session.notebook_id,
+            question,
+            conversation_id=session.conversation_id,
+        )
+
+        session.conversation_id = result.conversation_id
+        session.turn_count = result.turn_number
+        session.turns.append({
+            "query": question,
+            "answer": result.answer,
+            "turn_number": result.turn_number,
+        })
+        return result
+
+    def discard(self, session_id: str) -> ChatSession | None:
+        """Forget the session and release its shared notebook, if any; needs no client."""
+        session = self.pop(session_id)
+        if session is not None and session.source_key is not None and self.sources is not None:
+            self.sources.release(session.source_key, session.notebook_id)
+        return session
+
+    async def close(self, client, session_id: str) -> ChatSession | None:
+        """Forget the session and delete (or release) its notebook (best effort)."""
+        session = self.discard(session_id)
+        if session is None:
+            return None
+        if session.source_key is not None and self.sources is not None:
+            return session
+        try:
+            await client.notebooks.delete(session.notebook_id)
+        except Exception as e:
+            logger.warning("Failed to delete notebook %s: %s", session.notebook_id, e)
+        return session
+
+    async def cleanup(self, client) -> int:
+        expired = self.expired()
+        for session in expired:
+            await self.close(client, session.session_id)
+        if expired:
+            logger.info("Cleaned up %d expired session(s)", len(expired))
+        return len(expired)
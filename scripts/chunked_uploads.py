@@ -0,0 +1,243 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Resumable chunked uploads for fastapi_server.py
+#
+# A client creates an upload with the total size, then PUTs fixed-size chunks
+# (in any order, in parallel) with a SHA-256 per chunk. Each chunk is written
+# straight to its offset in a pre-sized file, so assembly needs no extra copy.
+# The received-chunk list is persisted next to the data, so an interrupted
+# transfer (or a server restart) resumes with only the missing chunks.
+# A completed upload is a plain local file that /analyze/* and /chat/sessions
+# can use any number of times until it is deleted or expires. The bytes are
+# stored under a fixed name; the client's file name is only metadata, so it
+# can never clash with state.json.
+# ---------------------------------------------------------------------------
+
+UPLOAD_DIR = os.environ.get("NOTEBOOKLM_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "notebooklm-uploads"))
+DEFAULT_CHUNK_SIZE = 8 * 1024 ** 2
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 ** 2
+MAX_UPLOAD_BYTES = 10 * 1024 ** 3
+UPLOAD_TTL_SECONDS = 24 * 3600    # since the last chunk / use
+
+
+class UploadError(Exception):
+    """Invalid upload request (bad size, index or checksum)."""
+
+
+class UploadNotFoundError(UploadError):
+    pass
+
+
+class UploadStateError(UploadError):
+    """The upload is not in a state that allows the operation (e.g. incomplete)."""
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadStore:
+    """Disk-backed upload state: `<root>/<upload_id>/{state.json, data}`.
+
+    Methods do blocking file I/O; the server calls them via asyncio.to_thread.
+    """
+
+    def __init__(self, root: str = UPLOAD_DIR, ttl_seconds: float = UPLOAD_TTL_SECONDS):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()   # guards state.json read-modify-write and the two below
+        self._writing: dict[str, int] = {}   # upload id -> chunk writes in progress
+        self._completing: set[str] = set()
+        os.makedirs(root, exist_ok=True)
+
+    # -- state ---------------------------------------------------------------
+
+    def _dir(self, upload_id: str) -> str:
+        # upload ids are generated hex strings; reject anything else so the id
+        # can never escape the upload root.
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadNotFoundError(upload_id)
+        return os.path.join(self.root, upload_id)
+
+    def _load(self, upload_id: str) -> dict:
+        try:
+            with open(os.path.join(self._dir(upload_id), "state.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadNotFoundError(upload_id) from None
+
+    def _save(self, state: dict):
+        path = os.path.join(self._dir(state["upload_id"]), "state.json")
+        partial = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(partial, path)
+
+    def data_path(self, state: dict) -> str:
+        return os.path.join(self._dir(state["upload_id"]), "data")
+
+    @staticmethod
+    def info(state: dict) -> dict:
+        received = set(state["received"])
+        missing = [i for i in range(state["total_chunks"]) if i not in received]
+        # Bytes received contiguously from the start: where a sequential
+        # client resumes. Parallel clients use `missing` instead.
+        first_missing = missing[0] if missing else state["total_chunks"]
+        return {
+            "upload_id": state["upload_id"],
+            "file_name": state["file_name"],
+            "size": state["size"],
+            "chunk_size": state["chunk_size"],
+            "total_chunks": state["total_chunks"],
+            "received": sorted(received),
+            "missing": missing,
+            "offset": min(first_missing * state["chunk_size"], state["size"]),
+            "complete": state["complete"],
+            "sha256": state.get("sha256"),
+        }
+
+    # -- operations ------------------------------------------------------------
+
+    def create(self, file_name: str, size: int, chunk_size: int | None = None,
+               sha256: str | None = None) -> dict:
+        file_name = os.path.basename(file_name or "")
+        if "." not in file_name or not file_name.strip("."):
+            file_name = "uploaded_file.pdf"
+        if size <= 0 or size > MAX_UPLOAD_BYTES:
+            raise UploadError(f"size must be between 1 and {MAX_UPLOAD_BYTES} bytes")
+        chunk_size = min(max(chunk_size or DEFAULT_CHUNK_SIZE, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+        upload_id = uuid.uuid4().hex
+        state = {
+            "upload_id": upload_id,
+            "file_name": file_name,
+            "size": size,
+            "chunk_size": chunk_size,
+            "total_chunks": -(-size // chunk_size),
+            "received": [],
+            "expected_sha256": sha256.lower() if sha256 else None,
+            "sha256": None,
+            "complete": False,
+            "updated_at": time.time(),
+        }
+        os.makedirs(self._dir(upload_id))
+        with open(self.data_path(state), "wb") as f:
+            f.truncate(size)
+        self._save(state)
+        return self.info(state)
+
+    def get(self, upload_id: str) -> dict:
+        return self.info(self._load(upload_id))
+
+    def write_chunk(self, upload_id: str, index: int, data: bytes, sha256: str) -> dict:
+        state = self._load(upload_id)
+        if state["complete"]:
+            raise UploadStateError("upload is already complete")
+        if not 0 <= index < state["total_chunks"]:
+            raise UploadError(f"chunk index must be between 0 and {state['total_chunks'] - 1}")
+        offset = index * state["chunk_size"]
+        expected_len = min(state["chunk_size"], state["size"] - offset)
+        if len(data) != expected_len:
+            raise UploadError(f"chunk {index} must be {expected_len} bytes, got {len(data)}")
+        if hashlib.sha256(data).hexdigest() != (sha256 or "").lower():
+            raise UploadError(f"chunk {index} checksum mismatch")
+
+        # Chunks cover disjoint byte ranges, so parallel writes need no lock
+        # between them; they are only counted so complete() never hashes the
+        # file while one is in progress.
+        with self._lock:
+            # Re-check under the lock: complete() may have finished since the load above.
+            if self._load(upload_id)["complete"]:
+                raise UploadStateError("upload is already complete")
+            if upload_id in self._completing:
+                raise UploadStateError("upload is being completed")
+            self._writing[upload_id] = self._writing.get(upload_id, 0) + 1
+        try:
+            with open(self.data_path(state), "r+b") as f:
+                f.seek(offset)
+                f.write(data)
+            with self._lock:
+                state = self._load(upload_id)
+                if index not in state["received"]:
+                    state["received"].append(index)
+                state["updated_at"] = time.time()
+                self._save(state)
+        finally:
+            with self._lock:
+                self._writing[upload_id] -= 1
+                if not self._writing[upload_id]:
+                    del self._writing[upload_id]
+        return self.info(state)
+
+    def complete(self, upload_id: str) -> dict:
+        state = self._load(upload_id)
+        if state["complete"]:
+            return self.info(state)
+        with self._lock:
+            if self._writing.get(upload_id) or upload_id in self._completing:
+                raise UploadStateError("chunk writes are still in progress")
+            state = self._load(upload_id)
+            missing = self.info(state)["missing"]
+            if missing:
+                raise UploadStateError(f"{len(missing)} chunk(s) missing, first is {missing[0]}")
+            self._completing.add(upload_id)
+        try:
+            digest = _file_sha256(self.data_path(state))
+            if state["expected_sha256"] and digest != state["expected_sha256"]:
+                raise UploadError("file checksum mismatch")
+            with self._lock:
+                state = self._load(upload_id)
+                state.update(complete=True, sha256=digest, updated_at=time.time())
+                self._save(state)
+        finally:
+            with self._lock:
+                self._completing.discard(upload_id)
+        return self.info(state)
+
+    def completed_file(self, upload_id: str) -> tuple[str, str, str]:
+        """(path, sha256, file name) of a completed upload; refreshes its TTL."""
+        with self._lock:
+            state = self._load(upload_id)
+            if not state["complete"]:
+                raise UploadStateError("upload is not complete")
+            state["updated_at"] = time.time()
+            self._save(state)
+        return self.data_path(state), state["sha256"], state["file_name"]
+
+    def delete(self, upload_id: str):
+        path = self._dir(upload_id)
+        if not os.path.isdir(path):
+            raise UploadNotFoundError(upload_id)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def cleanup(self) -> int:
+        """Delete uploads idle for longer than ttl_seconds."""
+        removed = 0
+        now = time.time()
+        for upload_id in os.listdir(self.root):
+            try:
+                state = self._load(upload_id)
+            except (UploadError, ValueError, OSError):
+                continue
+            if now - state["updated_at"] > self.ttl_seconds:
+                shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info("Cleaned up %d expired upload(s)", removed)
+        return removed
@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import glob
+import hashlib
+import os
+import uuid
+
+import analyze_urls
+from analysis_pipeline import SOURCE_WAIT_TIMEOUT
+from batch_manifest import DONE, Manifest
+from nlm_resilience import ResilientClient
+from nlm_scheduler import priority
+from nlm_tracing import trace
+
+# ---------------------------------------------------------------------------
+# Map-reduce digest of the per-video reports written by analyze_urls.py /
+# run_pipeline.py
+#
+# Map: reports are grouped into batches of at most SOURCES_PER_NOTEBOOK, each
+# batch is added to a temporary notebook as text sources, and the group
+# summaries run concurrently. Reduce: summaries are combined FAN_IN at a time,
+# level by level, until a single digest remains.
+#
+# Every summary is cached on disk under a hash of its prompt and its inputs'
+# hashes. Reports are taken in manifest order (the order videos were first
+# registered), so new videos land in the last group: a rerun only recomputes
+# that group and the summaries above it. A changed report recomputes its own
+# branch; everything else is read from the cache.
+# ---------------------------------------------------------------------------
+
+SOURCES_PER_NOTEBOOK = 50     # NotebookLM's per-notebook source limit (standard accounts)
+FAN_IN = 8                    # summaries combined per reduce step
+MAX_WORKERS = 3               # summaries computed concurrently
+SOURCE_ADD_CONCURRENCY = 4    # add_text calls in flight per notebook
+
+CACHE_DIR = os.path.join(analyze_urls.OUTPUT_DIR, "digest_cache")
+DIGEST_FILE = os.path.join(analyze_urls.OUTPUT_DIR, "playlist_digest.md")
+REPORT_GLOB = "*_analysis_result.md"
+
+GROUP_PROMPT = (
+    "以下每個來源都是一部影片的分析報告。請整合這些報告，以繁體中文與 Markdown 格式輸出跨影片的綜合摘要。內容應包含：\n"
+    "1. **共同主題**：多部影片反覆出現的核心議題與觀點。\n"
+    "2. **關鍵重要觀念**：最值得記住的見解（Golden Nuggets），並註明出自哪部影片。\n"
+    "3. **不同觀點**：影片之間互相補充或矛盾的看法。\n"
+    "4. **專案與行動**：提到的具體專案、計畫或行動步驟。\n"
+    "5. **參考資源**：影片中提到的其他影片、工具或教學資源。"
+)
+
+REDUCE_PROMPT = (
+    "以下每個來源都是一組影片的綜合摘要。請合併成一份完整的播放清單總結，以繁體中文與 Markdown 格式輸出，"
+    "保留相同的段落結構（共同主題、關鍵重要觀念、不同觀點、專案與行動、參考資源），"
+    "去除重複內容，並保留各觀點出自哪部影片。"
+)
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def _report_node(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    first_line = text.split("\n", 1)[0]
+    title = first_line.lstrip("# ").strip() if first_line.startswith("#") else os.path.basename(path)
+    return {"key": _digest(text), "title": title, "text": text}
+
+
+def load_reports(manifest_path: str = analyze_urls.MANIFEST_FILE,
+                 reports_dir: str = analyze_urls.OUTPUT_DIR) -> list[dict]:
+    """Finished reports in a stable order: manifest order if there is one, else by file name."""
+    if os.path.exists(manifest_path):
+        manifest = Manifest(manifest_path)
+        try:
+            paths = [row["report_path"] for row in manifest.items([DONE]) if row["report_path"]]
+        finally:
+            manifest.close()
+    else:
+        paths = sorted(glob.glob(os.path.join(reports_dir, REPORT_GLOB)))
+    return [_report_node(path) for path in paths if os.path.exists(path)]
+
+
+def batches(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class DigestCache:
+    """Summaries stored as `<dir>/<key>.md`.
+
+    `<key>.notebook` holds the id of a notebook still being used for that
+    summary, so notebooks left behind by a killed run can be deleted.
+    """
+
+    def __init__(self, path: str = CACHE_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str, ext: str) -> str:
+        return os.path.join(self.path, f"{key}.{ext}")
+
+    def get(self, key: str) -> str | None:
+        try:
+            with open(self._file(key, "md"), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, text: str):
+        path = self._file(key, "md")
+        partial = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(partial, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(partial, path)
+
+    def track(self, key: str, notebook_id: str):
+        with open(self._file(key, "notebook"), "w", encoding="utf-8") as f:
+            f.write(notebook_id)
+
+    def untrack(self, key: str):
+        try:
+            os.remove(self._file(key, "notebook"))
+        except FileNotFoundError:
+            pass
+
+    def leftovers(self) -> list[tuple[str, str]]:
+        found = []
+        for path in glob.glob(os.path.join(self.path, "*.notebook")):
+            with open(path, "r", encoding="utf-8") as f:
+                found.append((os.path.basename(path)[:-len(".notebook")], f.read().strip()))
+        return found
+
+
+async def cleanup_leftover_notebooks(client, cache: DigestCache):
+    for key, notebook_id in cache.leftovers():
+        print(f"Deleting leftover digest notebook {notebook_id}...")
+        try:
+            await client.notebooks.delete(notebook_id)
+        except Exception as e:
+            print(f"Could not delete notebook {notebook_id}: {e}")
+            continue
+        cache.untrack(key)
+
+
+async def summarize(client, cache: DigestCache, title: str, prompt: str, children: list[dict],
+                    rebuild: bool = False) -> tuple[dict, bool]:
+    """Summarize `children` in one temporary notebook; returns (node, computed)."""
+    key = _digest(prompt, *(child["key"] for child in children))
+    cached = None if rebuild else cache.get(key)
+    if cached is not None:
+        return {"key": key, "title": title, "text": cached}, False
+
+    with trace("digest.summary", title=title, sources=len(children)):
+        nb = await client.notebooks.create(f"Digest: {title}")
+        cache.track(key, nb.id)
+        try:
+            semaphore = asyncio.Semaphore(SOURCE_ADD_CONCURRENCY)
+
+            async def add(child):
+                async with semaphore:
+                    return await client.sources.add_text(nb.id, child["title"], child["text"])
+
+            sources = await asyncio.gather(*(add(child) for child in children))
+            await client.sources.wait_for_sources(nb.id, [s.id for s in sources], timeout=SOURCE_WAIT_TIMEOUT)
+            result = await client.chat.ask(nb.id, prompt)
+        finally:
+            try:
+                await client.notebooks.delete(nb.id)
+                cache.untrack(key)
+            except Exception as e:
+                print(f"Could not delete notebook {nb.id}: {e}")
+    cache.put(key, result.answer)
+    return {"key": key, "title": title, "text": result.answer}, True
+
+
+async def build_digest(client, reports: list[dict], cache: DigestCache, group_size: int = SOURCES_PER_NOTEBOOK,
+                       fan_in: int = FAN_IN, workers: int = MAX_WORKERS, rebuild: bool = False) -> str:
+    """Reduce `reports` to one digest: group summaries first, then a tree of merges."""
+    semaphore = asyncio.Semaphore(max(1, workers))
+
+    async def run(title, prompt, children, merge):
+        # A lone summary has nothing to merge with; pass it up unchanged.
+        if merge and len(children) == 1:
+            return children[0], False
+        async with semaphore:
+            return await summarize(client, cache, title, prompt, children, rebuild)
+
+    async def level(name, prompt, nodes, size, merge=True):
+        # Let every summary of the level finish before raising, so the ones
+        # that succeeded are cached for the next run.
+        results = await asyncio.gather(*(
+            run(f"{name} {i + 1}", prompt, group, merge) for i, group in enumerate(batches(nodes, size))
+        ), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            print(f"{name}: {len(errors)} of {len(results)} summaries failed; rerun to retry them")
+            raise errors[0]
+        computed = sum(1 for _, fresh in results if fresh)
+        print(f"{name}: {len(results)} summaries ({computed} computed, {len(results) - computed} reused)")
+        return [node for node, _ in results]
+
+    nodes = await level("Group", GROUP_PROMPT, reports, max(1, group_size), merge=False)
+    depth = 1
+    while len(nodes) > 1:
+        nodes = await level(f"Merge L{depth}", REDUCE_PROMPT, nodes, max(2, fan_in))
+        depth += 1
+    return nodes[0]["text"]
+
+
+def write_digest(path: str, reports: list[dict], digest: str) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# 播放清單總結 ({len(reports)} 部影片)\n\n")
+        f.write(digest)
+        f.write("\n\n## 涵蓋的報告\n\n")
+        for report in reports:
+            f.write(f"- {report['title']}\n")
+    return path
+
+
+async def main(manifest_path=analyze_urls.MANIFEST_FILE, reports_dir=analyze_urls.OUTPUT_DIR,
+               output=DIGEST_FILE, group_size=SOURCES_PER_NOTEBOOK, fan_in=FAN_IN,
+               workers=MAX_WORKERS, rebuild=False):
+    reports = load_reports(manifest_path, reports_dir)
+    if not reports:
+        print("No finished reports found to digest.")
+        return
+    print(f"Digesting {len(reports)} reports "
+          f"({-(-len(reports) // max(1, group_size))} groups of up to {group_size}, fan-in {fan_in}).")
+
+    cache = DigestCache(os.path.join(reports_dir, "digest_cache"))
+    print("Connecting to NotebookLM...")
+    async with await ResilientClient.from_storage() as client:
+        await cleanup_leftover_notebooks(client, cache)
+        digest = await build_digest(client, reports, cache, group_size, fan_in, workers, rebuild)
+
+    print(f"Saved digest to: {write_digest(output, reports, digest)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Combine the per-video reports into one playlist digest (map-reduce).")
+    parser.add_argument("--manifest", default=analyze_urls.MANIFEST_FILE,
+                        help=f"Manifest listing finished reports (default: {analyze_urls.MANIFEST_FILE})")
+    parser.add_argument("--reports-dir", default=analyze_urls.OUTPUT_DIR,
+                        help=f"Report directory, used when there is no manifest; also holds the cache (default: {analyze_urls.OUTPUT_DIR})")
+    parser.add_argument("--output", "-o", default=DIGEST_FILE, help=f"Digest file (default: {DIGEST_FILE})")
+    parser.add_argument("--group-size", type=int, default=SOURCES_PER_NOTEBOOK,
+                        help=f"Reports per group notebook, at most the per-notebook source limit (default: {SOURCES_PER_NOTEBOOK})")
+    parser.add_argument("--fan-in", type=int, default=FAN_IN, help=f"Summaries merged per reduce step (default: {FAN_IN})")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help=f"Summaries computed concurrently (default: {MAX_WORKERS})")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore cached summaries and recompute everything")
+    args = parser.parse_args()
+
+    with priority("bulk"):
+        asyncio.run(main(args.manifest, args.reports_dir, args.output, args.group_size,
+                         args.fan_in, args.workers, args.rebuild))
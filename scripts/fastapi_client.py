@@ -1,18 +1,159 @@
 import requests
 import argparse
+import asyncio
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 API_URL = "http://localhost:52501"
+LOAD_OPS = ["upload", "url", "remote-file"]
 
-def analyze_local_file_via_api(file_path: str, custom_prompt: str = None):
+# 超過此大小的檔案自動改用可續傳的分段上傳 (/uploads)
+CHUNKED_THRESHOLD = 100 * 1024 ** 2
+CHUNK_SIZE_MB = 8
+CHUNK_PARALLEL = 4
+CHUNK_RETRIES = 3
+# 記錄「檔案 -> upload_id」，中斷後重新執行同一指令即可從缺少的段落續傳
+UPLOAD_STATE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "notebooklm-uploads.json")
+
+def _load_upload_state() -> dict:
+    try:
+        with open(UPLOAD_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_upload_state(state: dict):
+    os.makedirs(os.path.dirname(UPLOAD_STATE_FILE), exist_ok=True)
+    with open(UPLOAD_STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+def _upload_state_key(file_path: str) -> str:
+    st = os.stat(file_path)
+    return f"{API_URL}|{os.path.abspath(file_path)}|{st.st_size}|{st.st_mtime_ns}"
+
+def _put_chunk(file_path: str, upload_id: str, index: int, chunk_size: int):
+    with open(file_path, "rb") as f:
+        f.seek(index * chunk_size)
+        data = f.read(chunk_size)
+    headers = {"X-Chunk-Sha256": hashlib.sha256(data).hexdigest()}
+    for attempt in range(1, CHUNK_RETRIES + 1):
+        try:
+            response = requests.put(f"{API_URL}/uploads/{upload_id}/chunks/{index}", data=data, headers=headers)
+            response.raise_for_status()
+            return
+        except requests.exceptions.RequestException:
+            if attempt == CHUNK_RETRIES:
+                raise
+            time.sleep(2 ** attempt)
+
+def upload_file_chunked(file_path: str, chunk_size_mb: float = CHUNK_SIZE_MB, parallel: int = CHUNK_PARALLEL) -> str:
+    """
+    以分段、可續傳的方式將檔案上傳至 /uploads，回傳完成的 upload_id。
+    若先前同一檔案的上傳中斷，只會補傳伺服器尚未收到的段落。
+    """
+    state = _load_upload_state()
+    key = _upload_state_key(file_path)
+    upload = None
+    if key in state:
+        response = requests.get(f"{API_URL}/uploads/{state[key]}")
+        if response.status_code == 200:
+            upload = response.json()["upload"]
+            print(f"續傳上傳 {upload['upload_id']}：已完成 {len(upload['received'])}/{upload['total_chunks']} 段")
+    if upload is None:
+        response = requests.post(f"{API_URL}/uploads", json={
+            "file_name": os.path.basename(file_path),
+            "size": os.path.getsize(file_path),
+            "chunk_size": int(chunk_size_mb * 1024 ** 2),
+        })
+        response.raise_for_status()
+        upload = response.json()["upload"]
+        state[key] = upload["upload_id"]
+        _save_upload_state(state)
+        print(f"建立上傳 {upload['upload_id']}：共 {upload['total_chunks']} 段")
+
+    upload_id = upload["upload_id"]
+    if not upload["complete"]:
+        missing = upload["missing"]
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+            futures = [pool.submit(_put_chunk, file_path, upload_id, i, upload["chunk_size"]) for i in missing]
+            for future in futures:
+                future.result()
+                done += 1
+                print(f"\r上傳進度: {upload['total_chunks'] - len(missing) + done}/{upload['total_chunks']} 段", end="")
+        print()
+        response = requests.post(f"{API_URL}/uploads/{upload_id}/complete")
+        response.raise_for_status()
+
+    # 對應關係保留到分析成功為止，分析失敗或中斷時重新執行不需重傳
+    return upload_id
+
+def _finish_upload(file_path: str, upload_id: str):
+    """分析成功後刪除伺服器上的上傳檔與本地的續傳記錄。"""
+    state = _load_upload_state()
+    state.pop(_upload_state_key(file_path), None)
+    _save_upload_state(state)
+    try:
+        requests.delete(f"{API_URL}/uploads/{upload_id}")
+    except requests.exceptions.RequestException:
+        pass  # 伺服器會在 TTL 到期後自動清除
+
+def analyze_local_file_chunked(file_path: str, custom_prompt: str = None, preprocess: bool = False,
+                               chunk_size_mb: float = CHUNK_SIZE_MB, parallel: int = CHUNK_PARALLEL,
+                               extract_text: bool = False):
+    """
+    以分段上傳傳送大型檔案，再透過 /analyze/uploaded 進行分析。
+    """
+    print("=====================================")
+    print(f"分段上傳檔案中: {file_path}")
+    print(f"API 端點: {API_URL}/uploads")
+
+    try:
+        upload_id = upload_file_chunked(file_path, chunk_size_mb, parallel)
+        print(f"上傳完成 (upload_id: {upload_id})，開始分析，請稍候...")
+        response = requests.post(f"{API_URL}/analyze/uploaded", json={
+            "upload_id": upload_id,
+            "custom_prompt": custom_prompt,
+            "preprocess": preprocess,
+            "extract_text": extract_text,
+        })
+        response.raise_for_status()
+        _finish_upload(file_path, upload_id)
+
+        result = response.json()
+        print("\n✅ 分析完成！")
+        print("=====================================\n")
+        print(result.get("result", "找不到分析結果。"))
+
+    except requests.exceptions.HTTPError as err:
+        print(f"\n❌ API 錯誤: {err}")
+        try:
+            print(f"詳細錯誤訊息: {err.response.json()}")
+        except Exception:
+            pass
+        print("重新執行相同指令即可從中斷處續傳 (已上傳完成的檔案不會重傳)。")
+    except requests.exceptions.ConnectionError:
+        print(f"\n❌ 連線錯誤：無法連線至 {API_URL}。重新執行相同指令即可從中斷處續傳。")
+    except Exception as e:
+        print(f"\n❌ 發生未知的錯誤: {e}")
+
+def analyze_local_file_via_api(file_path: str, custom_prompt: str = None, preprocess: bool = False,
+                               chunked: bool = None, chunk_size_mb: float = CHUNK_SIZE_MB,
+                               parallel: int = CHUNK_PARALLEL, extract_text: bool = False):
     """
     將本地檔案上傳給 FastAPI Server 進行分析。
-    使用 multipart/form-data 格式。
+    使用 multipart/form-data 格式；大型檔案 (或 chunked=True) 改用可續傳的分段上傳。
     """
     if not os.path.exists(file_path):
         print(f"錯誤：找不到檔案 {file_path}")
         return
 
+    if chunked or (chunked is None and os.path.getsize(file_path) >= CHUNKED_THRESHOLD):
+        return analyze_local_file_chunked(file_path, custom_prompt, preprocess, chunk_size_mb, parallel, extract_text)
+
     url = f"{API_URL}/analyze/upload"
     
     print(f"=====================================")
@@ -25,6 +166,10 @@ def analyze_local_file_via_api(file_path: str, custom_prompt: str = None):
     data = {}
     if custom_prompt:
         data["custom_prompt"] = custom_prompt
+    if preprocess:
+        data["preprocess"] = "true"
+    if extract_text:
+        data["extract_text"] = "true"
         
     try:
         response = requests.post(url, files=files, data=data)
@@ -48,11 +193,70 @@ def analyze_local_file_via_api(file_path: str, custom_prompt: str = None):
     finally:
         files["file"].close()
 
+async def run_load_test(args):
+    """
+    以 --corpus 中的檔案與網址對 FastAPI Server 產生並行負載，量測延遲與吞吐量。
+    upload 使用本地檔案，url / remote-file 使用 http(s) 網址。
+    """
+    import httpx
+    from load_generator import LoadError, run_load
+
+    file_cache = {}
+
+    def read_file(path):
+        # 只讀一次磁碟，避免把本地 I/O 算進伺服器延遲
+        if path not in file_cache:
+            with open(path, "rb") as f:
+                file_cache[path] = f.read()
+        return file_cache[path]
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=None, limits=limits) as client:
+        async def send(op, target, prompt):
+            if op == "upload":
+                data = {"custom_prompt": prompt} if prompt else {}
+                if args.preprocess:
+                    data["preprocess"] = "true"
+                if args.extract_text:
+                    data["extract_text"] = "true"
+                files = {"file": (os.path.basename(target), read_file(target))}
+                response = await client.post("/analyze/upload", files=files, data=data)
+            elif op == "url":
+                body = {"url": target, "title": "Load Test", "custom_prompt": prompt, "extract_text": args.extract_text}
+                response = await client.post("/analyze/url", json=body)
+            else:
+                body = {"file_url": target, "custom_prompt": prompt, "preprocess": args.preprocess,
+                        "extract_text": args.extract_text}
+                response = await client.post("/analyze/remote-file", json=body)
+            if response.status_code >= 400:
+                raise LoadError(f"HTTP {response.status_code}")
+
+        await run_load(args, send, LOAD_OPS, args.prompt)
+
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="FastAPI NotebookLM 分析客戶端 (支援檔案上傳)")
-    parser.add_argument("file_path", help="要分析的本地檔案路徑 (例如: doc.pdf, video.mp4)")
+    from load_generator import add_load_arguments
+
+    parser = argparse.ArgumentParser(description="FastAPI NotebookLM 分析客戶端 (支援檔案上傳與負載測試)")
+    parser.add_argument("file_path", nargs="?", help="要分析的本地檔案路徑 (例如: doc.pdf, video.mp4)")
     parser.add_argument("--prompt", "-p", help="自訂分析指令 (選填)", default=None)
+    parser.add_argument("--preprocess", action="store_true", help="請伺服器先以 ffmpeg 抽出精簡音訊再上傳至 NotebookLM")
+    parser.add_argument("--extract-text", action="store_true",
+                        help="請伺服器在本機擷取 PDF / HTML / 文字檔的文字，以文字來源送至 NotebookLM")
+    parser.add_argument("--api-url", default=API_URL, help=f"FastAPI Server 位址 (預設 {API_URL})")
+    parser.add_argument("--chunked", action="store_true", default=None,
+                        help=f"使用可續傳的分段上傳 (檔案超過 {CHUNKED_THRESHOLD // 1024 ** 2} MB 時自動啟用)")
+    parser.add_argument("--no-chunked", dest="chunked", action="store_false", help="一律使用單一 multipart 上傳")
+    parser.add_argument("--chunk-size-mb", type=float, default=CHUNK_SIZE_MB, help="分段上傳每段大小 (MB)")
+    parser.add_argument("--parallel", type=int, default=CHUNK_PARALLEL, help="分段上傳同時傳送的段數")
+    add_load_arguments(parser, LOAD_OPS, default_mix="upload:1,url:1")
     
     args = parser.parse_args()
-    
-    analyze_local_file_via_api(args.file_path, args.prompt)
+    API_URL = args.api_url
+
+    if args.load:
+        asyncio.run(run_load_test(args))
+    elif args.file_path:
+        analyze_local_file_via_api(args.file_path, args.prompt, args.preprocess,
+                                   args.chunked, args.chunk_size_mb, args.parallel, args.extract_text)
+    else:
+        parser.error("請提供 file_path，或使用 --load --corpus 進行負載測試")
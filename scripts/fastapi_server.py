@@ -1,69 +1,120 @@
 import os
+import sys
 import asyncio
+import hashlib
 import logging
-import tempfile
-import urllib.request
-import uuid
+import shutil
+import time
 from contextlib import asynccontextmanager
-from dataclasses import dataclass, field
-from datetime import datetime, timezone
-from urllib.parse import urlparse
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, ConfigDict
-from notebooklm import NotebookLMClient
 import uvicorn
 
+# Allow `uvicorn scripts.fastapi_server:app` (Docker) to import sibling modules.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from analysis_pipeline import (
+    URL_PROMPT,
+    SpoolError,
+    ask_shared_source,
+    create_notebook_with_file,
+    create_notebook_with_url,
+    download_file,
+    file_prompt,
+    link_file,
+    new_spool_dir,
+    remote_file_name,
+    spool_upload,
+)
+from chunked_uploads import UploadError, UploadNotFoundError, UploadStateError, UploadStore
+from chat_sessions import (
+    CLEANUP_INTERVAL_SECONDS,
+    SESSION_TTL_SECONDS,
+    ChatSession,
+    SessionRegistry,
+    session_to_info as _session_to_info,
+)
+from nlm_resilience import CircuitOpenError
+from nlm_scheduler import priority, scheduler
+from nlm_tracing import trace
+from server_warmup import Readiness, SharedClient, warm_up
+from singleflight import SingleFlight
+from source_registry import SourceRegistry, canonical_url
+
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
 # Session state
 # ---------------------------------------------------------------------------
 
-SESSION_TTL_SECONDS = 7200       # 2 hours
-CLEANUP_INTERVAL_SECONDS = 300   # check every 5 minutes
+# One NotebookLM client for the whole process, opened by the startup warm-up.
+_clients = SharedClient()
+_readiness = Readiness()
+# Notebooks are shared by source (content hash / canonical URL) across
+# sessions and analyses; sessions release their reference when closed.
+_sources = SourceRegistry()
+_sessions = SessionRegistry(ttl_seconds=SESSION_TTL_SECONDS, sources=_sources)
+# Concurrent identical /analyze/* requests share one NotebookLM pipeline.
+_flights = SingleFlight()
+_uploads = UploadStore()
 
 
-@dataclass
-class ChatSession:
-    session_id: str
-    notebook_id: str
-    title: str
-    source_type: str
-    created_at: datetime
-    conversation_id: str | None = None
-    turn_count: int = 0
-    turns: list[dict] = field(default_factory=list)
+async def _cleanup_expired_sessions():
+    """Background task: delete sessions older than SESSION_TTL_SECONDS."""
+    while True:
+        await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
+        if not _sessions.expired():
+            continue
+        try:
+            async with _clients.use() as client:
+                await _sessions.cleanup(client)
+        except Exception as e:
+            logger.warning("Failed to cleanup sessions: %s", e)
 
 
-_sessions: dict[str, ChatSession] = {}
+async def _cleanup_expired_uploads():
+    """Background task: delete chunked uploads idle longer than UPLOAD_TTL_SECONDS."""
+    while True:
+        await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(_uploads.cleanup)
+        except Exception as e:
+            logger.warning("Failed to cleanup uploads: %s", e)
 
 
-async def _cleanup_expired_sessions():
-    """Background task: delete sessions older than SESSION_TTL_SECONDS."""
+async def _reclaim_idle_sources():
+    """Background task: delete shared notebooks unreferenced for SOURCE_IDLE_TTL_SECONDS."""
     while True:
         await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
-        now = datetime.now(timezone.utc)
-        expired = [
-            sid for sid, s in _sessions.items()
-            if (now - s.created_at).total_seconds() > SESSION_TTL_SECONDS
-        ]
-        for sid in expired:
-            try:
-                async with await NotebookLMClient.from_storage() as client:
-                    await client.notebooks.delete(_sessions[sid].notebook_id)
-            except Exception as e:
-                logger.warning("Failed to cleanup session %s: %s", sid, e)
-            _sessions.pop(sid, None)
-        if expired:
-            logger.info("Cleaned up %d expired session(s)", len(expired))
+        if not _sources.idle():
+            continue
+        try:
+            async with _clients.use() as client:
+                await _sources.reclaim(client)
+        except Exception as e:
+            logger.warning("Failed to reclaim shared sources: %s", e)
 
 
 @asynccontextmanager
 async def lifespan(_app):
-    task = asyncio.create_task(_cleanup_expired_sessions())
+    tasks = [
+        asyncio.create_task(warm_up(_clients, _readiness)),
+        asyncio.create_task(_cleanup_expired_sessions()),
+        asyncio.create_task(_cleanup_expired_uploads()),
+        asyncio.create_task(_reclaim_idle_sources()),
+    ]
     yield
-    task.cancel()
+    for task in tasks:
+        task.cancel()
+    if _sources.values():
+        # The registry lives in memory only, so its notebooks would be orphaned.
+        try:
+            async with _clients.use() as client:
+                await _sources.close_all(client)
+        except Exception as e:
+            logger.warning("Failed to delete shared sources: %s", e)
+    await _clients.close()
 
 
 # ---------------------------------------------------------------------------
@@ -77,9 +128,25 @@ app = FastAPI(
 )
 
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # One trace per request; NotebookLM calls made while serving it add their spans.
+    with trace(f"{request.method} {request.url.path}", **{"http.method": request.method}) as root:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            root.name = f"{request.method} {route.path}"
+        root.set(**{"http.route": getattr(route, "path", None), "http.status_code": response.status_code})
+        return response
+
+
 class AnalyzeFileRequest(BaseModel):
     file_url: str
     custom_prompt: str = None
+    preprocess: bool = False
+    chunk_pages: int | None = None
+    chunk_max_mb: float | None = None
+    extract_text: bool = False
 
     model_config = ConfigDict(
         json_schema_extra={
@@ -95,6 +162,7 @@ class AnalyzeUrlRequest(BaseModel):
     url: str
     title: str = "URL Analysis"
     custom_prompt: str = None
+    extract_text: bool = False
 
     model_config = ConfigDict(
         json_schema_extra={
@@ -107,11 +175,42 @@ class AnalyzeUrlRequest(BaseModel):
     )
 
 
+class AnalyzeUploadedRequest(BaseModel):
+    upload_id: str
+    custom_prompt: str | None = None
+    preprocess: bool = False
+    chunk_pages: int | None = None
+    chunk_max_mb: float | None = None
+    extract_text: bool = False
+
+
+class CreateUploadRequest(BaseModel):
+    file_name: str
+    size: int
+    chunk_size: int | None = None
+    sha256: str | None = None
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "file_name": "lecture.mp4",
+                "size": 1073741824,
+                "chunk_size": 8388608
+            }
+        }
+    )
+
+
 class CreateSessionFromUrlRequest(BaseModel):
     url: str
     title: str = "Chat Session"
 
 
+class CreateSessionFromUploadRequest(BaseModel):
+    upload_id: str
+    title: str | None = None
+
+
 class AskRequest(BaseModel):
     question: str
 
@@ -133,15 +232,24 @@ class AskResponse(BaseModel):
     is_follow_up: bool
 
 
-def _session_to_info(s: ChatSession) -> dict:
-    return {
-        "session_id": s.session_id,
-        "notebook_id": s.notebook_id,
-        "title": s.title,
-        "source_type": s.source_type,
-        "created_at": s.created_at.isoformat(),
-        "turn_count": s.turn_count,
-    }
+def _error_status(e: Exception) -> int:
+    """503 while the NotebookLM circuit breaker is open, 500 otherwise."""
+    return 503 if isinstance(e, CircuitOpenError) else 500
+
+
+def _upload_error_status(e: UploadError) -> int:
+    if isinstance(e, UploadNotFoundError):
+        return 404
+    if isinstance(e, UploadStateError):
+        return 409
+    return 400
+
+
+async def _completed_upload(upload_id: str) -> tuple[str, str, str]:
+    try:
+        return await asyncio.to_thread(_uploads.completed_file, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=_upload_error_status(e), detail=f"上傳 {upload_id} 無法使用: {e}")
 
 
 def _get_session(session_id: str) -> ChatSession:
@@ -152,133 +260,182 @@ def _get_session(session_id: str) -> ChatSession:
 
 
 # ---------------------------------------------------------------------------
-# Existing analyze endpoints (unchanged)
+# Analyze endpoints
 # ---------------------------------------------------------------------------
 
-@app.post("/analyze/remote-file")
-async def analyze_remote_file(request: AnalyzeFileRequest):
-    """
-    透過 HTTP URL 下載檔案並使用 Google NotebookLM 深度分析。
-    """
-    parsed_url = urlparse(request.file_url)
-    file_name = os.path.basename(parsed_url.path)
+def _upload_file_name(file: UploadFile) -> str:
+    file_name = file.filename
     if not file_name or "." not in file_name:
-        file_name = "downloaded_file.pdf"
+        file_name = "uploaded_file.pdf"
+    return os.path.basename(file_name)
 
-    temp_dir = tempfile.gettempdir()
-    temp_file_path = os.path.join(temp_dir, file_name)
 
-    try:
-        await asyncio.to_thread(urllib.request.urlretrieve, request.file_url, temp_file_path)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"下載遠端檔案時發生錯誤 {e}")
+def _upload_sha256(file: UploadFile) -> str:
+    digest = hashlib.sha256()
+    file.file.seek(0)
+    for block in iter(lambda: file.file.read(1024 * 1024), b""):
+        digest.update(block)
+    file.file.seek(0)
+    return digest.hexdigest()
+
+
+def _file_source_key(digest: str, preprocess: bool = False, chunk_pages: int | None = None,
+                     chunk_max_mb: float | None = None, extract_text: bool = False) -> tuple:
+    # Ingestion options change what ends up in the notebook, so they are part of the key.
+    return ("file", digest, preprocess, chunk_pages, chunk_max_mb, extract_text)
 
-    prompt = request.custom_prompt or (
-        f"請針對這份檔案 ({file_name}) 進行深度分析，並以繁體中文與 Markdown 格式輸出詳細報告。內容應包含：\n"
-        "1. **核心摘要**：這份檔案的主要內容目的與結論。\n"
-        "2. **關鍵觀點與發現**：列出內容中最重要的數據、論點或洞察（Golden Nuggets）。\n"
-        "3. **作者/講者立場**：分析作者或講者的觀點與潛在意圖。\n"
-        "4. **問題與解決方案**：提到的主要挑戰及其對應解法。\n"
-        "5. **行動建議**：基於內容，讀者接下來可以採取的具體行動。\n"
-    )
 
+def _url_source_key(url: str, extract_text: bool = False) -> tuple:
+    return ("url", canonical_url(url), extract_text)
+
+
+async def _ingest_file(nb_title: str, file_name: str, spool, **options):
+    """Create a notebook holding one file, using its own spool dir.
+
+    `spool(dest)` returns the awaitable that writes the file to `dest`. This
+    runs inside the source registry's shared ingest, not the request.
+    """
+    spool_dir = new_spool_dir()
     try:
-        async with await NotebookLMClient.from_storage() as client:
-            nb_title = f"API Remote File: {file_name}"
-            nb = await client.notebooks.create(nb_title)
+        async with _clients.use() as client:
+            # 寫入暫存檔與建立筆記本同時進行
+            return await create_notebook_with_file(
+                client, nb_title, spool(os.path.join(spool_dir, file_name)), **options
+            )
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+async def _ingest_url(nb_title: str, url: str, extract_text: bool = False):
+    async with _clients.use() as client:
+        return await create_notebook_with_url(client, nb_title, url, extract_text=extract_text)
+
 
-            await client.sources.add_file(nb.id, temp_file_path)
-            await asyncio.sleep(15)
+async def _ask_source(source_key: tuple, create, prompt: str) -> str:
+    """Ask against the shared notebook for `source_key`; `create()` ingests it on a miss."""
+    async with _clients.use() as client:
+        return await ask_shared_source(client, _sources, source_key, create, prompt)
 
-            result = await client.chat.ask(nb.id, prompt)
-            await client.notebooks.delete(nb.id)
 
-            return {"status": "success", "result": result.answer}
+@app.post("/analyze/remote-file")
+async def analyze_remote_file(request: AnalyzeFileRequest):
+    """
+    透過 HTTP URL 下載檔案並使用 Google NotebookLM 深度分析。
+    """
+    file_name = remote_file_name(request.file_url)
+    prompt = request.custom_prompt or file_prompt(file_name)
+    options = dict(preprocess=request.preprocess, chunk_pages=request.chunk_pages, chunk_max_mb=request.chunk_max_mb,
+                   extract_text=request.extract_text)
+    source_key = ("remote-file", canonical_url(request.file_url), *options.values())
+
+    try:
+        # 下載與建立筆記本同時進行
+        answer = await _flights.do((source_key, prompt), lambda: _ask_source(
+            source_key,
+            lambda: _ingest_file(
+                f"API Remote File: {file_name}",
+                file_name,
+                lambda dest: download_file(request.file_url, dest),
+                **options,
+            ),
+            prompt,
+        ))
+        return {"status": "success", "result": answer}
+    except SpoolError as e:
+        raise HTTPException(status_code=400, detail=f"下載遠端檔案時發生錯誤 {e}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"分析檔案時發生錯誤: {e}\n請確認您已正確設定 notebooklm 的登入狀態。")
-    finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        raise HTTPException(status_code=_error_status(e), detail=f"分析檔案時發生錯誤: {e}\n請確認您已正確設定 notebooklm 的登入狀態。")
 
 
 @app.post("/analyze/upload")
-async def analyze_uploaded_file(file: UploadFile = File(...), custom_prompt: str = Form(None)):
+async def analyze_uploaded_file(
+    file: UploadFile = File(...),
+    custom_prompt: str = Form(None),
+    preprocess: bool = Form(False),
+    chunk_pages: int = Form(None),
+    chunk_max_mb: float = Form(None),
+    extract_text: bool = Form(False),
+):
     """
     上傳本地檔案並使用 Google NotebookLM 深度分析。
-    """
-    file_name = file.filename
-    if not file_name or "." not in file_name:
-        file_name = "uploaded_file.pdf"
 
-    temp_dir = tempfile.gettempdir()
-    temp_file_path = os.path.join(temp_dir, file_name)
+    preprocess=true 時會先以 ffmpeg 將影音檔轉為精簡的單聲道音訊再上傳。
+    chunk_pages / chunk_max_mb 會將 PDF 依頁數或大小切成多個來源平行上傳。
+    extract_text=true 時會在本機擷取 PDF / HTML / 文字檔的文字並以文字來源送出，
+    掃描檔或無法擷取時改為上傳原檔。
+    內容與參數相同的同時請求會共用同一次分析；相同內容已上傳過時直接沿用該筆記本。
+    """
+    file_name = _upload_file_name(file)
+    prompt = custom_prompt or file_prompt(file_name)
+    options = dict(preprocess=preprocess, chunk_pages=chunk_pages, chunk_max_mb=chunk_max_mb,
+                   extract_text=extract_text)
 
     try:
-        content = await file.read()
-        with open(temp_file_path, "wb") as f:
-            f.write(content)
-    except Exception as e:
+        # The upload is already on local disk/memory, so hashing it is cheap
+        # compared to the NotebookLM round trips it may save.
+        digest = await asyncio.to_thread(_upload_sha256, file)
+        source_key = _file_source_key(digest, **options)
+        answer = await _flights.do((source_key, prompt), lambda: _ask_source(
+            source_key,
+            lambda: _ingest_file(
+                f"API Uploaded File: {file_name}",
+                file_name,
+                lambda dest: spool_upload(file, dest),
+                **options,
+            ),
+            prompt,
+        ))
+        return {"status": "success", "result": answer}
+    except SpoolError as e:
         raise HTTPException(status_code=400, detail=f"儲存上傳檔案時發生錯誤 {e}")
+    except Exception as e:
+        raise HTTPException(status_code=_error_status(e), detail=f"分析檔案時發生錯誤: {e}\n請確認您已正確設定 notebooklm 的登入狀態。")
 
-    prompt = custom_prompt or (
-        f"請針對這份檔案 ({file_name}) 進行深度分析，並以繁體中文與 Markdown 格式輸出詳細報告。內容應包含：\n"
-        "1. **核心摘要**：這份檔案的主要內容目的與結論。\n"
-        "2. **關鍵觀點與發現**：列出內容中最重要的數據、論點或洞察（Golden Nuggets）。\n"
-        "3. **作者/講者立場**：分析作者或講者的觀點與潛在意圖。\n"
-        "4. **問題與解決方案**：提到的主要挑戰及其對應解法。\n"
-        "5. **行動建議**：基於內容，讀者接下來可以採取的具體行動。\n"
-    )
 
-    try:
-        async with await NotebookLMClient.from_storage() as client:
-            nb_title = f"API Uploaded File: {file_name}"
-            nb = await client.notebooks.create(nb_title)
-
-            source = await client.sources.add_file(
-                nb.id,
-                temp_file_path,
-                wait=True,
-                wait_timeout=120.0,
-            )
-            result = await client.chat.ask(nb.id, prompt)
-            await client.notebooks.delete(nb.id)
+@app.post("/analyze/uploaded")
+async def analyze_chunked_upload(request: AnalyzeUploadedRequest):
+    """
+    分析已透過 /uploads 分段上傳完成的檔案，不需重新傳送檔案內容。
+    """
+    path, digest, file_name = await _completed_upload(request.upload_id)
+    prompt = request.custom_prompt or file_prompt(file_name)
+    options = dict(preprocess=request.preprocess, chunk_pages=request.chunk_pages, chunk_max_mb=request.chunk_max_mb,
+                   extract_text=request.extract_text)
 
-            return {"status": "success", "result": result.answer}
+    try:
+        # Same keys as /analyze/upload, so identical content shares the flight and the notebook.
+        source_key = _file_source_key(digest, **options)
+        answer = await _flights.do((source_key, prompt), lambda: _ask_source(
+            source_key,
+            # The stored bytes have a fixed name; link them under the client's file name.
+            lambda: _ingest_file(f"API Uploaded File: {file_name}", file_name, lambda dest: link_file(path, dest),
+                                 **options),
+            prompt,
+        ))
+        return {"status": "success", "result": answer}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"分析檔案時發生錯誤: {e}\n請確認您已正確設定 notebooklm 的登入狀態。")
-    finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        raise HTTPException(status_code=_error_status(e), detail=f"分析檔案時發生錯誤: {e}\n請確認您已正確設定 notebooklm 的登入狀態。")
 
 
 @app.post("/analyze/url")
 async def analyze_url(request: AnalyzeUrlRequest):
     """
     使用 Google NotebookLM 深度分析網頁 URL 或 YouTube 影片連結。
+
+    extract_text=true 時會在本機抓取網頁並擷取正文，以文字來源送出 (YouTube 除外)。
     """
-    prompt = request.custom_prompt or (
-        "請針對這個網頁或影片進行深度分析，並以繁體中文與 Markdown 格式輸出詳細報告。內容應包含：\n"
-        "1. **講者個人想法**：分析講者/作者對主題的主觀看法、立場與態度。\n"
-        "2. **關鍵重要觀念**：列出內容中強調的核心理念或獨特見解（Golden Nuggets）。\n"
-        "3. **專案規劃與行動**：是否提到具體的專案、未來計畫或行動步驟？\n"
-        "4. **問題與解決方案**：討論中提到的挑戰及其對應解法。\n"
-        "5. **總結**：整部內容的精華摘要。"
-    )
+    prompt = request.custom_prompt or URL_PROMPT
+    source_key = _url_source_key(request.url, request.extract_text)
 
     try:
-        async with await NotebookLMClient.from_storage() as client:
-            nb_title = f"API URL Analysis: {request.title}"
-            nb = await client.notebooks.create(nb_title)
-
-            await client.sources.add_url(nb.id, request.url)
-            await asyncio.sleep(5)
-
-            result = await client.chat.ask(nb.id, prompt)
-            await client.notebooks.delete(nb.id)
-
-            return {"status": "success", "result": result.answer}
+        answer = await _flights.do((source_key, prompt), lambda: _ask_source(
+            source_key,
+            lambda: _ingest_url(f"API URL Analysis: {request.title}", request.url, request.extract_text),
+            prompt,
+        ))
+        return {"status": "success", "result": answer}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"分析 URL 時發生錯誤: {e}\n請確認您已正確設定 notebooklm 的登入狀態。")
+        raise HTTPException(status_code=_error_status(e), detail=f"分析 URL 時發生錯誤: {e}\n請確認您已正確設定 notebooklm 的登入狀態。")
 
 
 # ---------------------------------------------------------------------------
@@ -291,72 +448,57 @@ async def create_chat_session_upload(
     title: str = Form(None),
 ):
     """上傳檔案並建立對話 session，之後可透過 /chat/sessions/{id}/ask 多輪提問。"""
-    file_name = file.filename
-    if not file_name or "." not in file_name:
-        file_name = "uploaded_file.pdf"
-
+    file_name = _upload_file_name(file)
     session_title = title or file_name
 
-    temp_dir = tempfile.gettempdir()
-    temp_file_path = os.path.join(temp_dir, file_name)
-
     try:
-        content = await file.read()
-        with open(temp_file_path, "wb") as f:
-            f.write(content)
-    except Exception as e:
+        source_key = _file_source_key(await asyncio.to_thread(_upload_sha256, file))
+        notebook_id = await _sources.acquire(source_key, lambda: _ingest_file(
+            f"Chat: {session_title}", file_name, lambda dest: spool_upload(file, dest)
+        ))
+
+        session = _sessions.add(notebook_id, session_title, "file_upload", source_key=source_key)
+
+        return {"status": "success", "session": _session_to_info(session)}
+    except SpoolError as e:
         raise HTTPException(status_code=400, detail=f"儲存上傳檔案時發生錯誤: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=_error_status(e), detail=f"建立 session 時發生錯誤: {e}")
+
+
+@app.post("/chat/sessions/uploaded")
+async def create_chat_session_uploaded(request: CreateSessionFromUploadRequest):
+    """以 /uploads 分段上傳完成的檔案建立對話 session。"""
+    path, digest, file_name = await _completed_upload(request.upload_id)
+    session_title = request.title or file_name
 
     try:
-        async with await NotebookLMClient.from_storage() as client:
-            nb = await client.notebooks.create(f"Chat: {session_title}")
-            await client.sources.add_file(
-                nb.id,
-                temp_file_path,
-                wait=True,
-                wait_timeout=120.0,
-            )
+        source_key = _file_source_key(digest)
+        notebook_id = await _sources.acquire(source_key, lambda: _ingest_file(
+            f"Chat: {session_title}", file_name, lambda dest: link_file(path, dest)
+        ))
 
-        session_id = str(uuid.uuid4())
-        session = ChatSession(
-            session_id=session_id,
-            notebook_id=nb.id,
-            title=session_title,
-            source_type="file_upload",
-            created_at=datetime.now(timezone.utc),
-        )
-        _sessions[session_id] = session
+        session = _sessions.add(notebook_id, session_title, "file_upload", source_key=source_key)
 
         return {"status": "success", "session": _session_to_info(session)}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"建立 session 時發生錯誤: {e}")
-    finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        raise HTTPException(status_code=_error_status(e), detail=f"建立 session 時發生錯誤: {e}")
 
 
 @app.post("/chat/sessions/url")
 async def create_chat_session_url(request: CreateSessionFromUrlRequest):
     """透過 URL（網頁或 YouTube）建立對話 session。"""
     try:
-        async with await NotebookLMClient.from_storage() as client:
-            nb = await client.notebooks.create(f"Chat: {request.title}")
-            await client.sources.add_url(nb.id, request.url)
-            await asyncio.sleep(5)
-
-        session_id = str(uuid.uuid4())
-        session = ChatSession(
-            session_id=session_id,
-            notebook_id=nb.id,
-            title=request.title,
-            source_type="url",
-            created_at=datetime.now(timezone.utc),
+        source_key = _url_source_key(request.url)
+        notebook_id = await _sources.acquire(
+            source_key, lambda: _ingest_url(f"Chat: {request.title}", request.url)
         )
-        _sessions[session_id] = session
+
+        session = _sessions.add(notebook_id, request.title, "url", source_key=source_key)
 
         return {"status": "success", "session": _session_to_info(session)}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"建立 session 時發生錯誤: {e}")
+        raise HTTPException(status_code=_error_status(e), detail=f"建立 session 時發生錯誤: {e}")
 
 
 @app.post("/chat/sessions/{session_id}/ask")
@@ -365,30 +507,9 @@ async def chat_ask(session_id: str, request: AskRequest):
     session = _get_session(session_id)
 
     try:
-        async with await NotebookLMClient.from_storage() as client:
-            # Populate client-side conversation cache for follow-ups
-            if session.conversation_id and session.turns:
-                for turn in session.turns:
-                    client._core.cache_conversation_turn(
-                        session.conversation_id,
-                        turn["query"],
-                        turn["answer"],
-                        turn["turn_number"],
-                    )
-
-            result = await client.chat.ask(
-                session.notebook_id,
-                request.question,
-                conversation_id=session.conversation_id,
-            )
-
-        session.conversation_id = result.conversation_id
-        session.turn_count = result.turn_number
-        session.turns.append({
-            "query": request.question,
-            "answer": result.answer,
-            "turn_number": result.turn_number,
-        })
+        async with _clients.use() as client:
+            with priority("interactive"):
+                result = await _sessions.ask(client, session, request.question)
 
         return AskResponse(
             answer=result.answer,
@@ -397,7 +518,7 @@ async def chat_ask(session_id: str, request: AskRequest):
             is_follow_up=result.is_follow_up,
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"提問時發生錯誤: {e}")
+        raise HTTPException(status_code=_error_status(e), detail=f"提問時發生錯誤: {e}")
 
 
 @app.get("/chat/sessions")
@@ -418,19 +539,122 @@ async def get_chat_session(session_id: str):
 
 @app.delete("/chat/sessions/{session_id}")
 async def delete_chat_session(session_id: str):
-    """結束對話 session 並刪除對應的 NotebookLM 筆記本。"""
-    session = _get_session(session_id)
+    """結束對話 session；共用的 NotebookLM 筆記本在無人使用並閒置一段時間後才會刪除。"""
+    _get_session(session_id)
 
     try:
-        async with await NotebookLMClient.from_storage() as client:
-            await client.notebooks.delete(session.notebook_id)
+        async with _clients.use() as client:
+            await _sessions.close(client, session_id)
     except Exception as e:
-        logger.warning("Failed to delete notebook %s: %s", session.notebook_id, e)
-
-    _sessions.pop(session_id, None)
+        logger.warning("Failed to delete session %s: %s", session_id, e)
+        _sessions.discard(session_id)
     return {"status": "success", "message": f"Session {session_id} 已刪除"}
 
 
+@app.get("/sources")
+async def list_shared_sources():
+    """列出目前共用中的來源筆記本與其參照數。"""
+    now = time.time()
+    return {
+        "status": "success",
+        "sources": [
+            {
+                "key": list(e.key),
+                "notebook_id": e.notebook_id,
+                "refcount": e.refcount,
+                "idle_seconds": round(now - e.last_used) if e.refcount == 0 else 0,
+            }
+            for e in _sources.values()
+        ],
+    }
+
+
+@app.get("/scheduler")
+async def scheduler_status():
+    """各優先等級 (interactive / analysis / bulk) 的排隊數、執行中數量與排隊延遲。"""
+    return {"status": "success", "scheduler": scheduler.snapshot()}
+
+
+@app.get("/healthz")
+async def healthz():
+    """存活檢查：只要伺服器能回應即為 200，不會呼叫 NotebookLM。"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """就緒檢查：啟動暖機 (驗證登入狀態、建立連線、預熱快取) 完成前回傳 503。"""
+    info = _readiness.snapshot()
+    if not _readiness.ready:
+        return JSONResponse(status_code=503, content={"status": "starting", **info})
+    return {"status": "ready", **info}
+
+
+# ---------------------------------------------------------------------------
+# Chunked upload endpoints
+# ---------------------------------------------------------------------------
+
+@app.post("/uploads")
+async def create_upload(request: CreateUploadRequest):
+    """
+    建立可續傳的分段上傳。回傳 upload_id 與伺服器採用的 chunk_size，
+    之後以 PUT /uploads/{upload_id}/chunks/{index} 上傳各段 (可平行)。
+    sha256 (選填) 為整個檔案的雜湊，完成時會一併驗證。
+    """
+    try:
+        info = await asyncio.to_thread(
+            _uploads.create, request.file_name, request.size, request.chunk_size, request.sha256
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=_upload_error_status(e), detail=f"建立上傳時發生錯誤: {e}")
+    return {"status": "success", "upload": info}
+
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """查詢上傳進度：已收到的段落、缺少的段落與可續傳的 offset。"""
+    try:
+        info = await asyncio.to_thread(_uploads.get, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=_upload_error_status(e), detail=f"上傳 {upload_id} 不存在")
+    return {"status": "success", "upload": info}
+
+
+@app.put("/uploads/{upload_id}/chunks/{index}")
+async def put_upload_chunk(upload_id: str, index: int, request: Request,
+                           x_chunk_sha256: str = Header(...)):
+    """
+    上傳第 index 段 (0 起算) 的原始位元組，X-Chunk-Sha256 標頭為該段的 SHA-256。
+    同一段可重複上傳；資料直接寫入伺服器上檔案的對應位置。
+    """
+    data = await request.body()
+    try:
+        info = await asyncio.to_thread(_uploads.write_chunk, upload_id, index, data, x_chunk_sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=_upload_error_status(e), detail=f"寫入第 {index} 段時發生錯誤: {e}")
+    return {"status": "success", "received": len(info["received"]), "total_chunks": info["total_chunks"]}
+
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    """確認所有段落皆已收到並驗證檔案，之後即可用於 /analyze/uploaded 與 /chat/sessions/uploaded。"""
+    try:
+        info = await asyncio.to_thread(_uploads.complete, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=_upload_error_status(e), detail=f"完成上傳時發生錯誤: {e}")
+    return {"status": "success", "upload": info}
+
+
+@app.delete("/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    """刪除上傳及伺服器上的暫存檔。"""
+    try:
+        await asyncio.to_thread(_uploads.delete, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=_upload_error_status(e), detail=f"上傳 {upload_id} 不存在")
+    return {"status": "success", "message": f"Upload {upload_id} 已刪除"}
+
+
 # ---------------------------------------------------------------------------
 # Entry point
 # ---------------------------------------------------------------------------
@@ -2,13 +2,13 @@
 import asyncio
 import json
 import os
-from notebooklm import NotebookLMClient
+from nlm_resilience import ResilientClient
 
 async def get_all_notebook_data():
     all_data = []
     
     print("Connecting to NotebookLM...")
-    async with await NotebookLMClient.from_storage() as client:
+    async with await ResilientClient.from_storage() as client:
         print("Fetching notebooks...")
         notebooks = await client.notebooks.list()
         print(f"Found {len(notebooks)} notebooks.")
@@ -0,0 +1,398 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import statistics
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+
+# ---------------------------------------------------------------------------
+# Async load generator shared by fastapi_client.py and mcp_http_client.py
+#
+# A client supplies `send(op, target, prompt)`; this module schedules calls
+# from a corpus of files and URLs, applies concurrency / rate limits and a
+# warm-up period, and reports latency percentiles, throughput, an error
+# breakdown and a per-second time series (JSON and CSV).
+#
+# With --rate the load is open-loop: arrivals follow a Poisson process and
+# latency is measured from the scheduled arrival, so time spent waiting for a
+# free concurrency slot counts (no coordinated omission). Without --rate it is
+# closed-loop: --concurrency workers send back to back.
+# ---------------------------------------------------------------------------
+
+FILE_OPS = {"upload", "file"}      # ops that take a local path
+URL_OPS = {"url", "remote-file"}   # ops that take an http(s) URL
+LOAD_PROMPT = "請用三點摘要這份內容的重點。"
+PERCENTILES = (50, 90, 95, 99)
+
+
+class LoadError(Exception):
+    """A failed request, with a short `kind` used for the error breakdown."""
+
+    def __init__(self, kind: str, message: str = ""):
+        super().__init__(message or kind)
+        self.kind = kind
+
+
+@dataclass
+class Sample:
+    op: str
+    target: str
+    step: int
+    start: float      # scheduled start, seconds since the run began
+    latency: float
+    ok: bool
+    error: str | None = None
+    warmup: bool = False
+
+
+# ---------------------------------------------------------------------------
+# Corpus & mix
+# ---------------------------------------------------------------------------
+
+def load_corpus(path: str) -> dict[str, list[str]]:
+    """Read one file path or URL per line (`#` comments allowed)."""
+    corpus = {"files": [], "urls": []}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            entry = line.strip()
+            if not entry or entry.startswith("#"):
+                continue
+            if entry.startswith(("http://", "https://")):
+                corpus["urls"].append(entry)
+            else:
+                corpus["files"].append(os.path.expanduser(entry))
+    return corpus
+
+
+def parse_mix(spec: str, supported: list[str]) -> dict[str, float]:
+    """'url:3,upload:1' -> {'url': 3.0, 'upload': 1.0}."""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition(":")
+        if name not in supported:
+            raise ValueError(f"unknown op '{name}' (supported: {', '.join(supported)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def op_targets(mix: dict[str, float], corpus: dict[str, list[str]]) -> dict[str, list[str]]:
+    """Map every op in the mix to the corpus entries it can use; drop ops with none."""
+    targets = {}
+    for op in mix:
+        entries = corpus["files"] if op in FILE_OPS else corpus["urls"]
+        if entries:
+            targets[op] = entries
+        else:
+            print(f"Skipping op '{op}': no {'files' if op in FILE_OPS else 'URLs'} in corpus")
+    if not targets:
+        raise ValueError("corpus has no entries for any op in the mix")
+    return targets
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+class LoadGenerator:
+    def __init__(self, send, mix: dict[str, float], targets: dict[str, list[str]], *,
+                 concurrency: int, rates: list[float | None], duration: float,
+                 max_requests: int | None = None, warmup: float = 0.0, timeout: float = 600.0,
+                 prompt: str | None = None, unique_prompts: bool = False, seed: int | None = None):
+        self.send = send
+        self.ops = list(targets)
+        self.weights = [mix[op] for op in self.ops]
+        self.targets = targets
+        self.concurrency = max(1, concurrency)
+        self.rates = rates
+        self.duration = duration
+        self.max_requests = max_requests
+        self.warmup = warmup
+        self.timeout = timeout
+        self.prompt = prompt
+        self.unique_prompts = unique_prompts
+        self.random = random.Random(seed)
+        self.samples: list[Sample] = []
+        self.steps: list[dict] = []
+        self._sent = 0
+        self._step_started = 0
+        self._t0 = 0.0
+
+    def _next_request(self) -> tuple[str, str, str | None]:
+        op = self.random.choices(self.ops, self.weights)[0]
+        target = self.random.choice(self.targets[op])
+        self._sent += 1
+        prompt = self.prompt
+        if self.unique_prompts:
+            # The servers coalesce identical in-flight requests; a unique
+            # prompt makes every request ask NotebookLM. The ingested notebook
+            # is still shared per source, so only a corpus entry's first
+            # request pays for ingestion.
+            prompt = f"{prompt or LOAD_PROMPT} (#{self._sent})"
+        return op, target, prompt
+
+    async def _one(self, step: int, scheduled: float, semaphore: asyncio.Semaphore):
+        op, target, prompt = self._next_request()
+        async with semaphore:
+            error = None
+            try:
+                await asyncio.wait_for(self.send(op, target, prompt), self.timeout)
+            except LoadError as e:
+                error = e.kind
+            except asyncio.TimeoutError:
+                error = "timeout"
+            except Exception as e:
+                error = type(e).__name__
+        now = time.perf_counter() - self._t0
+        self.samples.append(Sample(
+            op=op, target=target, step=step, start=scheduled, latency=now - scheduled,
+            ok=error is None, error=error, warmup=scheduled < self.warmup,
+        ))
+
+    async def _closed_loop(self, step: int, deadline: float, semaphore):
+        async def worker():
+            while time.perf_counter() - self._t0 < deadline and not self._step_full():
+                self._step_started += 1
+                await self._one(step, time.perf_counter() - self._t0, semaphore)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    async def _open_loop(self, step: int, rate: float, deadline: float, semaphore):
+        tasks = []
+        scheduled = time.perf_counter() - self._t0
+        while scheduled < deadline and not self._step_full():
+            delay = scheduled - (time.perf_counter() - self._t0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._step_started += 1
+            tasks.append(asyncio.create_task(self._one(step, scheduled, semaphore)))
+            scheduled += self.random.expovariate(rate)
+        await asyncio.gather(*tasks)
+
+    def _step_full(self) -> bool:
+        return bool(self.max_requests) and self._step_started >= self.max_requests
+
+    async def run(self) -> list[Sample]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._t0 = time.perf_counter()
+        for step, rate in enumerate(self.rates):
+            # Warm-up happens once, at the start of the first step.
+            step_start = time.perf_counter() - self._t0
+            self._step_started = 0
+            deadline = step_start + self.duration + (self.warmup if step == 0 else 0)
+            label = f"{rate:g} req/s" if rate else f"closed loop x{self.concurrency}"
+            print(f"[step {step + 1}/{len(self.rates)}] {label} for {deadline - step_start:.0f}s ...")
+            if rate:
+                await self._open_loop(step, rate, deadline, semaphore)
+            else:
+                await self._closed_loop(step, deadline, semaphore)
+            step_end = time.perf_counter() - self._t0
+            self.steps.append({
+                "step": step,
+                "rate": rate,
+                "concurrency": self.concurrency,
+                "start": max(step_start, self.warmup) if step == 0 else step_start,
+                "end": step_end,
+            })
+        return self.samples
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Linear-interpolated percentile of `values` (q in 0-100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_stats(samples: list[Sample]) -> dict:
+    latencies = [s.latency for s in samples if s.ok]
+    stats = {f"p{q}": percentile(latencies, q) for q in PERCENTILES}
+    stats["mean"] = statistics.fmean(latencies) if latencies else None
+    stats["max"] = max(latencies) if latencies else None
+    return stats
+
+
+def summarize_step(step: dict, samples: list[Sample]) -> dict:
+    measured = [s for s in samples if s.step == step["step"] and not s.warmup]
+    ok = [s for s in measured if s.ok]
+    elapsed = max(step["end"] - step["start"], 1e-9)
+    return {
+        **step,
+        "requests": len(measured),
+        "ok": len(ok),
+        "errors": len(measured) - len(ok),
+        "error_rate": (len(measured) - len(ok)) / len(measured) if measured else 0.0,
+        "throughput_rps": len(ok) / elapsed,
+        "latency_s": latency_stats(measured),
+        "errors_by_kind": dict(Counter(s.error for s in measured if not s.ok)),
+        "by_op": {
+            op: {
+                "requests": sum(1 for s in measured if s.op == op),
+                "errors": sum(1 for s in measured if s.op == op and not s.ok),
+                "latency_s": latency_stats([s for s in measured if s.op == op]),
+            }
+            for op in sorted({s.op for s in measured})
+        },
+    }
+
+
+def timeseries(samples: list[Sample], bucket: float = 1.0) -> list[dict]:
+    """Per-bucket counts of requests started/completed/failed, in-flight and latency."""
+    if not samples:
+        return []
+    end = max(s.start + s.latency for s in samples)
+    rows = []
+    for i in range(int(end // bucket) + 1):
+        lo, hi = i * bucket, (i + 1) * bucket
+        done = [s for s in samples if lo <= s.start + s.latency < hi]
+        rows.append({
+            "t": lo,
+            "started": sum(1 for s in samples if lo <= s.start < hi),
+            "completed": sum(1 for s in done if s.ok),
+            "errors": sum(1 for s in done if not s.ok),
+            "in_flight": sum(1 for s in samples if s.start <= hi < s.start + s.latency),
+            "p50_s": percentile([s.latency for s in done if s.ok], 50),
+            "p95_s": percentile([s.latency for s in done if s.ok], 95),
+        })
+    return rows
+
+
+def saturation_step(steps: list[dict]) -> dict | None:
+    """First sweep step where extra offered load stopped buying throughput.
+
+    That is: throughput grew by less than 5%, the error rate passed 1%, or
+    p95 latency more than doubled compared to the previous step.
+    """
+    for prev, cur in zip(steps, steps[1:]):
+        prev_p95, cur_p95 = prev["latency_s"]["p95"], cur["latency_s"]["p95"]
+        if (cur["throughput_rps"] < prev["throughput_rps"] * 1.05
+                or cur["error_rate"] > 0.01
+                or (prev_p95 and cur_p95 and cur_p95 > 2 * prev_p95)):
+            return prev
+    return None
+
+
+def build_report(generator: LoadGenerator, bucket: float = 1.0) -> dict:
+    steps = [summarize_step(step, generator.samples) for step in generator.steps]
+    report = {
+        "config": {
+            "ops": dict(zip(generator.ops, generator.weights)),
+            "concurrency": generator.concurrency,
+            "rates": generator.rates,
+            "duration_s": generator.duration,
+            "warmup_s": generator.warmup,
+            "timeout_s": generator.timeout,
+        },
+        "steps": steps,
+        "timeseries": timeseries(generator.samples, bucket),
+    }
+    if len(steps) > 1:
+        knee = saturation_step(steps)
+        report["saturation"] = {"step": knee["step"], "rate": knee["rate"],
+                                "throughput_rps": knee["throughput_rps"]} if knee else None
+    return report
+
+
+def _fmt(value: float | None) -> str:
+    return f"{value:7.2f}" if value is not None else "      -"
+
+
+def print_report(report: dict):
+    print(f"\n{'step':>4} | {'offered':>9} | {'reqs':>5} | {'err%':>5} | {'rps':>6} | "
+          f"{'p50':>7} | {'p90':>7} | {'p95':>7} | {'p99':>7} | {'max':>7}")
+    for step in report["steps"]:
+        lat = step["latency_s"]
+        offered = f"{step['rate']:g}/s" if step["rate"] else f"x{step['concurrency']}"
+        print(f"{step['step'] + 1:>4} | {offered:>9} | {step['requests']:>5} | {step['error_rate'] * 100:5.1f} | "
+              f"{step['throughput_rps']:6.3f} | {_fmt(lat['p50'])} | {_fmt(lat['p90'])} | "
+              f"{_fmt(lat['p95'])} | {_fmt(lat['p99'])} | {_fmt(lat['max'])}")
+        for kind, count in step["errors_by_kind"].items():
+            print(f"       error {kind}: {count}")
+    if "saturation" in report:
+        knee = report["saturation"]
+        if knee:
+            offered = f"{knee['rate']:g} req/s" if knee["rate"] else "closed loop"
+            print(f"\nSaturation: throughput levels off after step {knee['step'] + 1} "
+                  f"({offered}, {knee['throughput_rps']:.3f} req/s)")
+        else:
+            print("\nSaturation: not reached within the sweep")
+
+
+def write_outputs(generator: LoadGenerator, report: dict, json_path: str | None,
+                  csv_path: str | None, requests_csv: str | None):
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Saved report to: {json_path}")
+    if csv_path and report["timeseries"]:
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(report["timeseries"][0]))
+            writer.writeheader()
+            writer.writerows(report["timeseries"])
+        print(f"Saved time series to: {csv_path}")
+    if requests_csv and generator.samples:
+        with open(requests_csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(asdict(generator.samples[0])))
+            writer.writeheader()
+            writer.writerows(asdict(s) for s in generator.samples)
+        print(f"Saved per-request samples to: {requests_csv}")
+
+
+# ---------------------------------------------------------------------------
+# CLI glue
+# ---------------------------------------------------------------------------
+
+def add_load_arguments(parser: argparse.ArgumentParser, ops: list[str], default_mix: str):
+    group = parser.add_argument_group("load generation (--load)")
+    group.add_argument("--load", action="store_true", help="Run in load-generation mode")
+    group.add_argument("--corpus", help="Text file with one local file path or http(s) URL per line")
+    group.add_argument("--mix", default=default_mix,
+                       help=f"Weighted op mix, e.g. '{default_mix}' (ops: {', '.join(ops)})")
+    group.add_argument("--concurrency", type=int, default=4, help="Max requests in flight")
+    group.add_argument("--rate", default=None,
+                       help="Open-loop arrival rate in req/s; a comma list runs a sweep (e.g. 0.05,0.1,0.2)")
+    group.add_argument("--duration", type=float, default=300, help="Seconds per rate step")
+    group.add_argument("--max-requests", type=int, default=None, help="Cap on requests per step")
+    group.add_argument("--warmup", type=float, default=0, help="Seconds of traffic excluded from the report")
+    group.add_argument("--timeout", type=float, default=600, help="Per-request timeout in seconds")
+    group.add_argument("--unique-prompts", action="store_true",
+                       help="Make every prompt unique so the server cannot coalesce identical requests. "
+                            "Sources are still shared, so ingestion is measured once per corpus entry; "
+                            "use a corpus larger than the run to load ingestion")
+    group.add_argument("--seed", type=int, default=None, help="Random seed for the op/target choice")
+    group.add_argument("--bucket", type=float, default=1.0, help="Time-series bucket size in seconds")
+    group.add_argument("--report-json", help="Write the full report (steps + time series) as JSON")
+    group.add_argument("--timeseries-csv", help="Write the time series as CSV")
+    group.add_argument("--requests-csv", help="Write every request sample as CSV")
+
+
+async def run_load(args, send, ops: list[str], prompt: str | None = None) -> dict:
+    """Build a LoadGenerator from parsed `add_load_arguments` flags, run it and report."""
+    if not args.corpus:
+        raise SystemExit("--load requires --corpus")
+    mix = parse_mix(args.mix, ops)
+    targets = op_targets(mix, load_corpus(args.corpus))
+    rates = [float(r) for r in args.rate.split(",")] if args.rate else [None]
+
+    generator = LoadGenerator(
+        send, mix, targets,
+        concurrency=args.concurrency, rates=rates, duration=args.duration,
+        max_requests=args.max_requests, warmup=args.warmup, timeout=args.timeout,
+        prompt=prompt, unique_prompts=args.unique_prompts, seed=args.seed,
+    )
+    await generator.run()
+    report = build_report(generator, args.bucket)
+    print_report(report)
+    write_outputs(generator, report, args.report_json, args.timeseries_csv, args.requests_csv)
+    return report
@@ -1,21 +1,76 @@
+import argparse
 import asyncio
+import itertools
 import sys
+from contextlib import AsyncExitStack
 
-# 嘗試導入 MCP 相關模組
-try:
-    from mcp import ClientSession
-    from mcp.client.sse import sse_client
-except ImportError:
-    print("錯誤: 找不到 'mcp' 模組。請確保已安裝 'mcp' 套件。")
-    print("你可以執行: pip install mcp[sse]") # SSE 支援通常需要額外依賴
-    sys.exit(1)
-
-async def main():
-    # 這裡假設你的 MCP Server 運行在 http://localhost:8000/sse
+def _import_mcp():
+    """
+    導入 MCP 相關模組。延後到真正連線時才導入，--help 不必付出約 1 秒的載入時間。
+    """
+    try:
+        from mcp import ClientSession
+        from mcp.client.sse import sse_client
+    except ImportError:
+        print("錯誤: 找不到 'mcp' 模組。請確保已安裝 'mcp' 套件。")
+        print("你可以執行: pip install mcp[sse]") # SSE 支援通常需要額外依賴
+        sys.exit(1)
+    return ClientSession, sse_client
+
+SSE_URL = "http://localhost:52500/sse"
+
+# 負載測試的 op 與對應的 MCP 工具；file 的路徑必須存在於 Server 端
+LOAD_TOOLS = {
+    "url": "analyze_url_with_notebooklm",
+    "file": "analyze_file_with_notebooklm",
+    "remote-file": "analyze_remote_file_with_notebooklm",
+}
+
+def tool_error(result) -> str | None:
+    """工具以字串回報錯誤 (例如「分析檔案時發生錯誤」)，統一轉為錯誤類型。"""
+    if result.isError:
+        return "tool_error"
+    for content in result.content:
+        if content.type == "text" and (content.text.startswith("錯誤") or "發生錯誤" in content.text):
+            return "tool_error"
+    return None
+
+async def run_load_test(args):
+    """
+    以 --corpus 中的檔案與網址對 MCP Server 產生並行負載，量測延遲與吞吐量。
+    請求會輪流分配到 --sessions 個 MCP session 上。
+    """
+    from load_generator import LoadError, run_load
+    ClientSession, sse_client = _import_mcp()
+
+    async with AsyncExitStack() as stack:
+        sessions = []
+        for _ in range(max(1, args.sessions)):
+            read, write = await stack.enter_async_context(sse_client(args.sse_url))
+            session = await stack.enter_async_context(ClientSession(read, write))
+            await session.initialize()
+            sessions.append(session)
+        print(f"已建立 {len(sessions)} 個 MCP session: {args.sse_url}")
+        next_session = itertools.cycle(sessions)
+
+        async def send(op, target, prompt):
+            target_arg = {"url": "url", "file": "file_path", "remote-file": "file_url"}[op]
+            tool_args = {target_arg: target}
+            if prompt:
+                tool_args["custom_prompt"] = prompt
+            result = await next(next_session).call_tool(LOAD_TOOLS[op], tool_args)
+            error = tool_error(result)
+            if error:
+                raise LoadError(error)
+
+        await run_load(args, send, list(LOAD_TOOLS), args.prompt)
+
+async def main(sse_url: str = SSE_URL):
+    # 這裡假設你的 MCP Server 運行在 http://localhost:52500/sse
     # 你可以使用 fastmcp 命令來啟動 server: 
-    # fastmcp run scripts/mcp_server.py --transport sse --port 8000
-    sse_url = "http://localhost:52500/sse"
+    # fastmcp run scripts/mcp_server.py --transport sse --port 52500
 
+    ClientSession, sse_client = _import_mcp()
     print(f"正在連接 MCP SSE 伺服器: {sse_url} ...")
 
     try:
@@ -83,4 +138,16 @@ if __name__ == "__main__":
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
         
-    asyncio.run(main())
+    from load_generator import add_load_arguments
+
+    parser = argparse.ArgumentParser(description="MCP (SSE) NotebookLM 客戶端 (工具呼叫範例與負載測試)")
+    parser.add_argument("--sse-url", default=SSE_URL, help=f"MCP Server 的 SSE 端點 (預設 {SSE_URL})")
+    parser.add_argument("--prompt", "-p", default=None, help="負載測試使用的自訂分析指令 (選填)")
+    parser.add_argument("--sessions", type=int, default=4, help="負載測試開啟的 MCP session 數量")
+    add_load_arguments(parser, list(LOAD_TOOLS), default_mix="url:1")
+    args = parser.parse_args()
+
+    if args.load:
+        asyncio.run(run_load_test(args))
+    else:
+        asyncio.run(main(args.sse_url))
@@ -1,113 +1,220 @@
 import asyncio
+import logging
 import os
-import tempfile
-import urllib.request
-from urllib.parse import urlparse
-from fastmcp import FastMCP
-from notebooklm import NotebookLMClient
+import shutil
+import sys
+from contextlib import asynccontextmanager
+from fastmcp import Context, FastMCP
+from fastmcp.server.middleware import Middleware
+from starlette.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from analysis_pipeline import (
+    URL_PROMPT,
+    SpoolError,
+    ask_shared_source,
+    create_notebook_with_file,
+    create_notebook_with_url,
+    download_file,
+    file_prompt,
+    local_file,
+    new_spool_dir,
+    remote_file_name,
+)
+from chat_sessions import CLEANUP_INTERVAL_SECONDS, SESSION_TTL_SECONDS, SessionRegistry, session_to_info
+from nlm_scheduler import priority
+from nlm_tracing import span, trace
+from server_warmup import Readiness, SharedClient, warm_up
+from singleflight import SingleFlight
+from source_registry import SourceRegistry, canonical_url, file_digest
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Shared client & session state (managed by the server lifespan)
+# ---------------------------------------------------------------------------
+
+MAX_SESSIONS = 20
+
+# One NotebookLM client for the whole process, opened by the startup warm-up.
+_clients = SharedClient()
+_readiness = Readiness()
+# Notebooks are shared by source (content hash / canonical URL) across
+# sessions and analyses; sessions release their reference when closed.
+_sources = SourceRegistry()
+_sessions = SessionRegistry(ttl_seconds=SESSION_TTL_SECONDS, max_sessions=MAX_SESSIONS, sources=_sources)
+# Concurrent identical analyses (single tools and batch items) share one pipeline.
+_flights = SingleFlight()
+
+async def _cleanup_expired_sessions():
+    """Background task: close sessions past their TTL or beyond MAX_SESSIONS,
+    then delete shared notebooks that have been unreferenced for the idle TTL."""
+    while True:
+        await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
+        if not _sessions.expired() and not _sources.idle():
+            continue
+        try:
+            client = await _clients.get()
+            await _sessions.cleanup(client)
+            await _sources.reclaim(client)
+        except Exception as e:
+            logger.warning("Failed to cleanup sessions: %s", e)
+
+@asynccontextmanager
+async def lifespan(_server):
+    tasks = [
+        asyncio.create_task(warm_up(_clients, _readiness)),
+        asyncio.create_task(_cleanup_expired_sessions()),
+    ]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        client = _clients.client
+        if client is not None:
+            # Sessions live only in memory, so their notebooks would be orphaned.
+            for session in _sessions.values():
+                await _sessions.close(client, session.session_id)
+            await _sources.close_all(client)
+            await _clients.close()
+
+async def _local_file_source(client, nb_title: str, file_path: str, preprocess: bool = False,
+                             chunk_pages: int = None, extract_text: bool = False) -> tuple[tuple, object]:
+    """(source key, ingest function) for a local file, keyed by content hash."""
+    digest = await asyncio.to_thread(file_digest, file_path)
+    key = ("file", digest, preprocess, chunk_pages, extract_text)
+    return key, lambda: create_notebook_with_file(
+        client, nb_title, local_file(file_path), preprocess=preprocess, chunk_pages=chunk_pages,
+        extract_text=extract_text,
+    )
+
+async def _analyze_local_file(client, nb_title: str, file_path: str, prompt: str, preprocess: bool = False,
+                              chunk_pages: int = None, extract_text: bool = False) -> str:
+    key, create = await _local_file_source(client, nb_title, file_path, preprocess, chunk_pages, extract_text)
+    return await _flights.do((key, prompt), lambda: ask_shared_source(client, _sources, key, create, prompt))
+
+async def _analyze_remote_file(client, nb_title: str, file_url: str, prompt: str, preprocess: bool = False,
+                               chunk_pages: int = None, extract_text: bool = False) -> str:
+    async def create():
+        # 每次下載使用獨立的暫存目錄，避免同名檔案互相覆蓋
+        file_name = remote_file_name(file_url)
+        spool_dir = new_spool_dir()
+        try:
+            return await create_notebook_with_file(
+                client, nb_title, download_file(file_url, os.path.join(spool_dir, file_name)),
+                preprocess=preprocess, chunk_pages=chunk_pages, extract_text=extract_text,
+            )
+        finally:
+            # 無論成功或失敗，一定要刪除 Server 上的這份暫存檔，避免塞爆硬碟
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+    key = ("remote-file", canonical_url(file_url), preprocess, chunk_pages, extract_text)
+    return await _flights.do((key, prompt), lambda: ask_shared_source(client, _sources, key, create, prompt))
+
+async def _analyze_url(client, nb_title: str, url: str, prompt: str, extract_text: bool = False) -> str:
+    key = ("url", canonical_url(url), extract_text)
+    create = lambda: create_notebook_with_url(client, nb_title, url, extract_text=extract_text)
+    return await _flights.do((key, prompt), lambda: ask_shared_source(client, _sources, key, create, prompt))
 
 # 初始化 FastMCP 伺服器
-mcp = FastMCP("NotebookLM Analyzer")
+mcp = FastMCP("NotebookLM Analyzer", lifespan=lifespan)
+
+
+class TraceToolCalls(Middleware):
+    """每次工具呼叫建立一個 trace，期間的 NotebookLM 呼叫記錄為子 span。"""
+
+    async def on_call_tool(self, context, call_next):
+        with trace(f"tool {context.message.name}", tool=context.message.name):
+            return await call_next(context)
+
+
+mcp.add_middleware(TraceToolCalls())
+
+@mcp.custom_route("/healthz", methods=["GET"])
+async def healthz(_request):
+    """存活檢查 (SSE / HTTP 傳輸)：只要伺服器能回應即為 200。"""
+    return JSONResponse({"status": "ok"})
+
+@mcp.custom_route("/readyz", methods=["GET"])
+async def readyz(_request):
+    """就緒檢查：啟動暖機 (驗證登入狀態、建立連線、預熱快取) 完成前回傳 503。"""
+    info = _readiness.snapshot()
+    if not _readiness.ready:
+        return JSONResponse({"status": "starting", **info}, status_code=503)
+    return JSONResponse({"status": "ready", **info})
 
 @mcp.tool()
-async def analyze_file_with_notebooklm(file_path: str, custom_prompt: str = None) -> str:
+async def analyze_file_with_notebooklm(file_path: str, custom_prompt: str = None, preprocess: bool = False,
+                                       chunk_pages: int = None, extract_text: bool = False) -> str:
     """
     使用 Google NotebookLM 深度分析本地檔案 (支援 PDF, MP4, MP3, etc.)。
     
     Args:
         file_path: 本地檔案的絕對路徑。
         custom_prompt: (可選) 自訂的分析指令。若未提供，將使用預設的深度分析指令。
+        preprocess: (可選) 先以 ffmpeg 將影音檔轉為精簡的單聲道音訊再上傳，可大幅減少上傳量。
+        chunk_pages: (可選) 將大型 PDF 依此頁數切成多個來源平行上傳。
+        extract_text: (可選) 在本機擷取 PDF / HTML / 文字檔的文字並以文字來源送出，可縮短 NotebookLM 的處理時間；掃描檔或無法擷取時改為上傳原檔。
     """
     if not os.path.exists(file_path):
         return f"錯誤：找不到檔案 {file_path}"
     
     file_name = os.path.basename(file_path)
-
-    prompt = custom_prompt or (
-        f"請針對這份檔案 ({file_name}) 進行深度分析，並以繁體中文與 Markdown 格式輸出詳細報告。內容應包含：\n"
-        "1. **核心摘要**：這份檔案的主要內容目的與結論。\n"
-        "2. **關鍵觀點與發現**：列出內容中最重要的數據、論點或洞察（Golden Nuggets）。\n"
-        "3. **作者/講者立場**：分析作者或講者的觀點與潛在意圖。\n"
-        "4. **問題與解決方案**：提到的主要挑戰及其對應解法。\n"
-        "5. **行動建議**：基於內容，讀者接下來可以採取的具體行動。\n"
-    )
+    prompt = custom_prompt or file_prompt(file_name)
         
     try:
-        async with await NotebookLMClient.from_storage() as client:
-            nb_title = f"MCP File Analysis: {file_name}"
-            nb = await client.notebooks.create(nb_title)
-            
-            await client.sources.add_file(nb.id, file_path)
-            await asyncio.sleep(15) # 等待 NotebookLM 處理檔案 (影片可能需要更久)
-            
-            result = await client.chat.ask(nb.id, prompt)
-            
-            # 清理：分析完後刪除筆記本
-            await client.notebooks.delete(nb.id)
-            
-            return result.answer
+        async with _clients.use() as client:
+            # 建立筆記本與 (可選的) 前處理同時進行，上傳後等待來源處理完成再提問，
+            # 分析完後刪除筆記本
+            return await _analyze_local_file(
+                client,
+                f"MCP File Analysis: {file_name}",
+                file_path,
+                prompt,
+                preprocess=preprocess,
+                chunk_pages=chunk_pages,
+                extract_text=extract_text,
+            )
     except Exception as e:
         return f"分析檔案時發生錯誤: {e}\n請確認您已正確設定 notebooklm 的登入狀態。"
 
 @mcp.tool()
-async def analyze_remote_file_with_notebooklm(file_url: str, custom_prompt: str = None) -> str:
+async def analyze_remote_file_with_notebooklm(file_url: str, custom_prompt: str = None, preprocess: bool = False,
+                                              chunk_pages: int = None, extract_text: bool = False) -> str:
     """
     透過 HTTP URL 下載檔案並使用 Google NotebookLM 深度分析 (支援遠端 Client)。
     
     Args:
         file_url: 檔案的公開可下載網址 (例如 S3 pre-signed URL)。
         custom_prompt: (可選) 自訂的分析指令。若未提供，將使用預設的深度分析指令。
+        preprocess: (可選) 先以 ffmpeg 將影音檔轉為精簡的單聲道音訊再上傳，可大幅減少上傳量。
+        chunk_pages: (可選) 將大型 PDF 依此頁數切成多個來源平行上傳。
+        extract_text: (可選) 在本機擷取 PDF / HTML / 文字檔的文字並以文字來源送出，可縮短 NotebookLM 的處理時間；掃描檔或無法擷取時改為上傳原檔。
     """
-    # 1. 準備暫存檔路徑
-    parsed_url = urlparse(file_url)
-    file_name = os.path.basename(parsed_url.path)
-    if not file_name or "." not in file_name:
-        file_name = "downloaded_file.pdf" # 給個預設名稱
+    file_name = remote_file_name(file_url)
+    prompt = custom_prompt or file_prompt(file_name)
         
-    temp_dir = tempfile.gettempdir()
-    temp_file_path = os.path.join(temp_dir, file_name)
-    
-    # 2. 下載檔案 (使用 asyncio.to_thread 防止下載過程阻塞 Server 的非同步迴圈)
+    # 下載檔案與建立筆記本同時進行，下載完成後立即上傳並執行分析流程
     try:
-        await asyncio.to_thread(urllib.request.urlretrieve, file_url, temp_file_path)
-    except Exception as e:
+        async with _clients.use() as client:
+            return await _analyze_remote_file(
+                client,
+                f"MCP Remote File: {file_name}",
+                file_url,
+                prompt,
+                preprocess=preprocess,
+                chunk_pages=chunk_pages,
+                extract_text=extract_text,
+            )
+    except SpoolError as e:
         return f"錯誤：下載遠端檔案時發生錯誤 {e}"
-
-    # 3. 準備 Prompt 分析文字
-    prompt = custom_prompt or (
-        f"請針對這份檔案 ({file_name}) 進行深度分析，並以繁體中文與 Markdown 格式輸出詳細報告。內容應包含：\n"
-        "1. **核心摘要**：這份檔案的主要內容目的與結論。\n"
-        "2. **關鍵觀點與發現**：列出內容中最重要的數據、論點或洞察（Golden Nuggets）。\n"
-        "3. **作者/講者立場**：分析作者或講者的觀點與潛在意圖。\n"
-        "4. **問題與解決方案**：提到的主要挑戰及其對應解法。\n"
-        "5. **行動建議**：基於內容，讀者接下來可以採取的具體行動。\n"
-    )
-        
-    # 4. 上傳至 NotebookLM 並執行分析流程
-    try:
-        async with await NotebookLMClient.from_storage() as client:
-            nb_title = f"MCP Remote File: {file_name}"
-            nb = await client.notebooks.create(nb_title)
-            
-            # 使用我們下載下來的「暫存檔路徑」上傳給 NotebookLM
-            await client.sources.add_file(nb.id, temp_file_path)
-            await asyncio.sleep(15) # 等待 NotebookLM 處理檔案
-            
-            result = await client.chat.ask(nb.id, prompt)
-            
-            # 清理：分析完後刪除筆記本
-            await client.notebooks.delete(nb.id)
-            
-            return result.answer
     except Exception as e:
         return f"分析檔案時發生錯誤: {e}\n請確認您已正確設定 notebooklm 的登入狀態。"
-    finally:
-        # 5. 無論成功或失敗，一定要刪除 Server 上的這份暫存檔，避免塞爆硬碟
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
 
 @mcp.tool()
-async def analyze_url_with_notebooklm(url: str, title: str = "URL Analysis", custom_prompt: str = None) -> str:
+async def analyze_url_with_notebooklm(url: str, title: str = "URL Analysis", custom_prompt: str = None,
+                                      extract_text: bool = False) -> str:
     """
     使用 Google NotebookLM 深度分析網頁 URL 或 YouTube 影片連結。
     
@@ -115,32 +222,223 @@ async def analyze_url_with_notebooklm(url: str, title: str = "URL Analysis", cus
         url: 欲分析的目標網址 (支援 YouTube 影片)。
         title: (可選) 該網址的標題，用於建立暫存筆記本名稱。
         custom_prompt: (可選) 自訂的分析指令。若未提供，將使用預設的深度分析指令。
+        extract_text: (可選) 在本機抓取網頁並擷取正文，以文字來源送出 (YouTube 除外)。
     """
-    prompt = custom_prompt or (
-        "請針對這個網頁或影片進行深度分析，並以繁體中文與 Markdown 格式輸出詳細報告。內容應包含：\n"
-        "1. **講者個人想法**：分析講者/作者對主題的主觀看法、立場與態度。\n"
-        "2. **關鍵重要觀念**：列出內容中強調的核心理念或獨特見解（Golden Nuggets）。\n"
-        "3. **專案規劃與行動**：是否提到具體的專案、未來計畫或行動步驟？\n"
-        "4. **問題與解決方案**：討論中提到的挑戰及其對應解法。\n"
-        "5. **總結**：整部內容的精華摘要。"
-    )
+    prompt = custom_prompt or URL_PROMPT
         
     try:
-        async with await NotebookLMClient.from_storage() as client:
-            nb_title = f"MCP URL Analysis: {title}"
-            nb = await client.notebooks.create(nb_title)
-            
-            await client.sources.add_url(nb.id, url)
-            await asyncio.sleep(5) # 等待 NotebookLM 處理 URL
-            
-            result = await client.chat.ask(nb.id, prompt)
-            
-            # 清理：分析完後刪除筆記本
-            await client.notebooks.delete(nb.id)
-            
-            return result.answer
+        async with _clients.use() as client:
+            return await _analyze_url(client, f"MCP URL Analysis: {title}", url, prompt, extract_text)
     except Exception as e:
         return f"分析 URL 時發生錯誤: {e}\n請確認您已正確設定 notebooklm 的登入狀態。"
 
+# ---------------------------------------------------------------------------
+# Chat session tools: ingest a source once, then ask follow-ups against it.
+# ---------------------------------------------------------------------------
+
+@mcp.tool()
+async def open_chat_session(
+    file_path: str = None,
+    url: str = None,
+    title: str = None,
+    preprocess: bool = False,
+) -> dict:
+    """
+    以本地檔案或網址建立對話 session，之後可用 ask_chat_session 多輪提問，不需重新上傳。
+
+    file_path 與 url 擇一提供。使用完畢請呼叫 close_chat_session；閒置的 session
+    會在 TTL 到期後自動刪除。
+
+    Args:
+        file_path: 本地檔案的絕對路徑 (PDF, MP4, MP3, etc.)。
+        url: 網頁或 YouTube 影片網址。
+        title: (可選) session 標題。
+        preprocess: (可選) 先以 ffmpeg 將影音檔轉為精簡的單聲道音訊再上傳。
+    """
+    if bool(file_path) == bool(url):
+        return {"status": "error", "message": "請提供 file_path 或 url 其中一個"}
+    if file_path and not os.path.exists(file_path):
+        return {"status": "error", "message": f"找不到檔案 {file_path}"}
+
+    session_title = title or (os.path.basename(file_path) if file_path else url)
+    try:
+        async with _clients.use() as client:
+            # 相同內容或網址已有筆記本時直接共用，不重新上傳
+            if file_path:
+                key, create = await _local_file_source(
+                    client, f"MCP Chat: {session_title}", file_path, preprocess=preprocess
+                )
+            else:
+                key = ("url", canonical_url(url), False)
+                create = lambda: create_notebook_with_url(client, f"MCP Chat: {session_title}", url)
+            notebook_id = await _sources.acquire(key, create)
+    except Exception as e:
+        return {"status": "error", "message": f"建立 session 時發生錯誤: {e}"}
+
+    session = _sessions.add(notebook_id, session_title, "file" if file_path else "url", source_key=key)
+    return {"status": "success", "session": session_to_info(session)}
+
+@mcp.tool()
+async def ask_chat_session(session_id: str, question: str) -> dict:
+    """
+    在既有的對話 session 中提問，支援追問 (保留前文)。
+
+    Args:
+        session_id: open_chat_session 回傳的 session_id。
+        question: 要詢問的問題。
+    """
+    session = _sessions.get(session_id)
+    if session is None:
+        return {"status": "error", "message": f"Session {session_id} 不存在或已過期"}
+    try:
+        async with _clients.use() as client:
+            with priority("interactive"):
+                result = await _sessions.ask(client, session, question)
+    except Exception as e:
+        return {"status": "error", "message": f"提問時發生錯誤: {e}"}
+    return {
+        "status": "success",
+        "answer": result.answer,
+        "turn_number": result.turn_number,
+        "is_follow_up": result.is_follow_up,
+    }
+
+@mcp.tool()
+async def close_chat_session(session_id: str) -> dict:
+    """
+    結束對話 session。共用的 NotebookLM 筆記本在沒有任何 session 或分析使用、
+    並閒置一段時間後才會刪除。
+
+    Args:
+        session_id: open_chat_session 回傳的 session_id。
+    """
+    if _sessions.get(session_id) is None:
+        return {"status": "error", "message": f"Session {session_id} 不存在或已過期"}
+    async with _clients.use() as client:
+        await _sessions.close(client, session_id)
+    return {"status": "success", "message": f"Session {session_id} 已刪除"}
+
+@mcp.tool()
+async def list_chat_sessions() -> dict:
+    """列出所有進行中的對話 session。"""
+    return {"status": "success", "sessions": [session_to_info(s) for s in _sessions.values()]}
+
+# ---------------------------------------------------------------------------
+# Batch tools: fan out inside the server with bounded concurrency, report MCP
+# progress as items finish and return partial results on timeout.
+# ---------------------------------------------------------------------------
+
+BATCH_MAX_CONCURRENCY = 3
+BATCH_TIMEOUT_SECONDS = 900
+
+async def _run_batch(ctx: Context, labels: list[str], run_item, max_concurrency: int, timeout_seconds: float) -> dict:
+    """Run `run_item(label)` for every label and collect per-item outcomes in input order."""
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    results = [{"input": label, "status": "timeout", "result": None} for label in labels]
+    completed = 0
+
+    async def run(index: int, label: str):
+        nonlocal completed
+        async with semaphore:
+            try:
+                with span("batch.item", index=index, input=label):
+                    results[index].update(status="success", result=await run_item(label))
+            except Exception as e:
+                results[index].update(status="error", result=str(e))
+        completed += 1
+        if ctx is not None:
+            try:
+                await ctx.report_progress(completed, len(labels), f"{label}: {results[index]['status']}")
+            except Exception:
+                pass  # 進度通知失敗不影響分析
+
+    tasks = [asyncio.create_task(run(i, label)) for i, label in enumerate(labels)]
+    _, pending = await asyncio.wait(tasks, timeout=timeout_seconds) if tasks else (set(), set())
+    for task in pending:
+        task.cancel()
+    if pending:
+        # 取消時分析流程會刪除各自的暫存筆記本；等它們全部結束後再回傳，
+        # 避免工具回傳後仍有工作佔用共用連線與排程名額
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    return {
+        "total": len(labels),
+        "completed": completed,
+        "timed_out": bool(pending),
+        "results": results,
+    }
+
+@mcp.tool()
+async def analyze_urls_batch(
+    urls: list[str],
+    custom_prompt: str = None,
+    extract_text: bool = False,
+    max_concurrency: int = BATCH_MAX_CONCURRENCY,
+    timeout_seconds: float = BATCH_TIMEOUT_SECONDS,
+    ctx: Context = None,
+) -> dict:
+    """
+    批次分析多個網頁 URL 或 YouTube 影片連結，於伺服器內以有限並行數同時處理。
+
+    每完成一項會送出 MCP 進度通知；超過 timeout_seconds 時回傳已完成的部分結果，
+    未完成的項目狀態為 "timeout"。
+
+    Args:
+        urls: 欲分析的網址清單。
+        custom_prompt: (可選) 套用在每個網址的自訂分析指令。
+        extract_text: (可選) 在本機抓取網頁並擷取正文，以文字來源送出 (YouTube 除外)。
+        max_concurrency: (可選) 同時分析的最大數量。
+        timeout_seconds: (可選) 整批的時間上限 (秒)。
+    """
+    prompt = custom_prompt or URL_PROMPT
+
+    async with _clients.use() as client:
+        async def run_item(url: str) -> str:
+            return await _analyze_url(client, f"MCP URL Batch: {url}", url, prompt, extract_text)
+
+        with priority("bulk"):
+            return await _run_batch(ctx, urls, run_item, max_concurrency, timeout_seconds)
+
+@mcp.tool()
+async def analyze_files_batch(
+    file_paths: list[str],
+    custom_prompt: str = None,
+    preprocess: bool = False,
+    extract_text: bool = False,
+    max_concurrency: int = BATCH_MAX_CONCURRENCY,
+    timeout_seconds: float = BATCH_TIMEOUT_SECONDS,
+    ctx: Context = None,
+) -> dict:
+    """
+    批次分析多個本地檔案 (PDF, MP4, MP3, etc.)，於伺服器內以有限並行數同時處理。
+
+    每完成一項會送出 MCP 進度通知；超過 timeout_seconds 時回傳已完成的部分結果，
+    未完成的項目狀態為 "timeout"。
+
+    Args:
+        file_paths: 本地檔案的絕對路徑清單。
+        custom_prompt: (可選) 套用在每個檔案的自訂分析指令。若未提供，將使用預設的深度分析指令。
+        preprocess: (可選) 先以 ffmpeg 將影音檔轉為精簡的單聲道音訊再上傳。
+        extract_text: (可選) 在本機擷取 PDF / HTML / 文字檔的文字並以文字來源送出，掃描檔或無法擷取時改為上傳原檔。
+        max_concurrency: (可選) 同時分析的最大數量。
+        timeout_seconds: (可選) 整批的時間上限 (秒)。
+    """
+    async with _clients.use() as client:
+        async def run_item(file_path: str) -> str:
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"找不到檔案 {file_path}")
+            file_name = os.path.basename(file_path)
+            return await _analyze_local_file(
+                client,
+                f"MCP File Batch: {file_name}",
+                file_path,
+                custom_prompt or file_prompt(file_name),
+                preprocess=preprocess,
+                extract_text=extract_text,
+            )
+
+        with priority("bulk"):
+            return await _run_batch(ctx, file_paths, run_item, max_concurrency, timeout_seconds)
+
 if __name__ == "__main__":
     mcp.run()
@@ -0,0 +1,192 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Optional ffmpeg pre-processing for media uploads
+#
+# NotebookLM only uses the audio track of a video, so uploading the full MP4
+# wastes bandwidth and source-processing time. preprocess_media() extracts
+# the first audio stream, downmixes it to mono speech-quality MP3 (same
+# settings as the "notebooklm" preset in utils/youtube/download_videos.py)
+# and drops video/subtitle/data streams. Outputs are cached by input hash.
+# ---------------------------------------------------------------------------
+
+CACHE_DIR = os.environ.get("NOTEBOOKLM_MEDIA_CACHE", os.path.join(tempfile.gettempdir(), "notebooklm-media-cache"))
+CACHE_MAX_BYTES = 5 * 1024 ** 3
+# Entries used more recently than this are never pruned: the caller may still
+# be uploading an output it was just handed.
+CACHE_GRACE_SECONDS = 3600
+
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".mkv", ".webm", ".avi", ".m4v", ".flv", ".wmv"}
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".flac", ".m4a", ".aac", ".ogg", ".opus", ".wma"}
+# Audio already smaller than this is uploaded untouched.
+AUDIO_MIN_BYTES = 20 * 1024 ** 2
+
+AUDIO_ARGS = ["-vn", "-sn", "-dn", "-ac", "1", "-ar", "22050", "-c:a", "libmp3lame", "-b:a", "48k"]
+# Inputs longer than this are transcoded as parallel time segments.
+SEGMENT_MIN_SECONDS = 20 * 60
+
+
+def is_media(path: str) -> bool:
+    ext = os.path.splitext(path)[1].lower()
+    return ext in VIDEO_EXTENSIONS or ext in AUDIO_EXTENSIONS
+
+
+@functools.cache
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _probe_duration(path: str) -> float | None:
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True, text=True,
+    )
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return None
+
+
+def _ffmpeg(*args: str):
+    subprocess.run(["ffmpeg", "-nostdin", "-loglevel", "error", "-y", *args], check=True)
+
+
+def _transcode_segmented(src: str, dest: str, duration: float, workers: int):
+    """Transcode `src` as `workers` time slices in parallel, then concatenate losslessly."""
+    segment = math.ceil(duration / workers)
+    work_dir = tempfile.mkdtemp(dir=os.path.dirname(dest))
+    try:
+        parts = []
+        for i in range(workers):
+            start = i * segment
+            if start >= duration:
+                break
+            parts.append((start, os.path.join(work_dir, f"part{i:03d}.mp3")))
+
+        def encode(part):
+            start, out = part
+            # -ss before -i seeks on the input, so each worker only decodes its slice.
+            _ffmpeg("-ss", str(start), "-t", str(segment), "-i", src, "-map", "0:a:0", *AUDIO_ARGS, out)
+
+        with ThreadPoolExecutor(max_workers=len(parts)) as pool:
+            list(pool.map(encode, parts))
+
+        list_file = os.path.join(work_dir, "parts.txt")
+        with open(list_file, "w", encoding="utf-8") as f:
+            for _, out in parts:
+                f.write(f"file '{out}'\n")
+        _ffmpeg("-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", dest)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# Cache entries this process is transcoding into.
+_in_flight: set[str] = set()
+_in_flight_lock = threading.Lock()
+
+
+def _prune_cache():
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        entry = os.path.join(CACHE_DIR, name)
+        try:
+            stats = [os.stat(os.path.join(entry, f)) for f in os.listdir(entry)]
+        except (NotADirectoryError, FileNotFoundError):
+            continue
+        if stats:
+            entries.append((max(st.st_mtime for st in stats), sum(st.st_size for st in stats), entry))
+    total = sum(size for _, size, _ in entries)
+    now = time.time()
+    for used, size, entry in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        with _in_flight_lock:
+            # A fresh mtime also covers .part files another process is writing.
+            if entry in _in_flight or now - used < CACHE_GRACE_SECONDS:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def preprocess_media(path: str) -> str:
+    """Return a compact audio-only version of `path`, or `path` itself if not applicable.
+
+    Non-media files, small audio files and hosts without ffmpeg are passed
+    through unchanged. The output keeps the original file stem so the
+    NotebookLM source title stays readable.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if not is_media(path):
+        return path
+    if ext in AUDIO_EXTENSIONS and os.path.getsize(path) < AUDIO_MIN_BYTES:
+        return path
+    if not ffmpeg_available():
+        logger.warning("ffmpeg/ffprobe not found; uploading %s unprocessed", path)
+        return path
+
+    entry = os.path.join(CACHE_DIR, file_sha256(path))
+    dest = os.path.join(entry, f"{os.path.splitext(os.path.basename(path))[0]}.mp3")
+    with _in_flight_lock:
+        try:
+            os.utime(dest)
+            return dest
+        except FileNotFoundError:
+            pass
+        _in_flight.add(entry)
+
+    # Write to a unique temporary name so a crash or a concurrent request for
+    # the same input never leaves a truncated cache hit.
+    partial = f"{dest}.{uuid.uuid4().hex}.part.mp3"
+    try:
+        os.makedirs(entry, exist_ok=True)
+        duration = _probe_duration(path)
+        workers = os.cpu_count() or 1
+        if duration and duration >= SEGMENT_MIN_SECONDS and workers > 1:
+            _transcode_segmented(path, partial, duration, workers)
+        else:
+            _ffmpeg("-i", path, "-map", "0:a:0", *AUDIO_ARGS, partial)
+        os.replace(partial, dest)
+    except (subprocess.CalledProcessError, OSError) as e:
+        # e.g. a video without an audio track, or the entry pruned by another
+        # process: let NotebookLM have the original.
+        logger.warning("Pre-processing failed on %s (%s); uploading unprocessed", path, e)
+        if os.path.exists(partial):
+            os.remove(partial)
+        return path
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(entry)
+
+    logger.info("Pre-processed %s: %d -> %d bytes", path, os.path.getsize(path), os.path.getsize(dest))
+    try:
+        _prune_cache()
+    except OSError as e:
+        logger.warning("Media cache prune failed: %s", e)
+    return dest
+
+
+async def preprocess_media_async(path: str) -> str:
+    """preprocess_media() off the event loop."""
+    return await asyncio.to_thread(preprocess_media, path)
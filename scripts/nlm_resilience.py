@@ -0,0 +1,328 @@
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from nlm_scheduler import current_priority, scheduler
+from nlm_tracing import span
+
+if TYPE_CHECKING:
+    from notebooklm import NotebookLMClient
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Resilience layer for NotebookLM calls
+#
+# Every entry point opens its client through ResilientClient.from_storage()
+# instead of NotebookLMClient.from_storage(). Calls made through
+# client.notebooks / client.sources / client.chat then get a per-operation
+# timeout, jittered retries (only where a retry cannot duplicate work),
+# optional hedged asks and a process-wide circuit breaker. Each attempt also
+# waits for a slot from the priority scheduler (nlm_scheduler.py), and the
+# whole call is one span of the current trace (nlm_tracing.py).
+#
+# notebooklm and httpx are imported on first use, so CLI scripts answer
+# --help or exit on a manifest/cache hit without paying for them.
+# ---------------------------------------------------------------------------
+
+BREAKER_FAILURE_THRESHOLD = 5    # consecutive transient failures before opening
+BREAKER_COOLDOWN_SECONDS = 30    # how long to fail fast before a probe call
+BREAKER_PROBE_RETRY_SECONDS = 5  # retry hint while the half-open probe is outstanding
+
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 20.0
+
+# Hedged asks: if a fresh chat.ask has not answered by the observed p95 latency,
+# send a duplicate and take whichever answers first. Off unless enabled.
+HEDGE_ASKS = os.environ.get("NOTEBOOKLM_HEDGE_ASKS", "").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = 60.0       # used until enough latency samples exist
+
+
+@dataclass(frozen=True)
+class OperationPolicy:
+    timeout: float | None = 60.0
+    retries: int = 0
+    # True when repeating the call cannot create a duplicate notebook/source.
+    idempotent: bool = False
+    hedge: bool = False
+
+
+POLICIES = {
+    "notebooks.create": OperationPolicy(timeout=60.0, retries=2),
+    "notebooks.delete": OperationPolicy(timeout=60.0, retries=3, idempotent=True),
+    "notebooks.list": OperationPolicy(timeout=60.0, retries=3, idempotent=True),
+    "notebooks.get": OperationPolicy(timeout=60.0, retries=3, idempotent=True),
+    "sources.add_url": OperationPolicy(timeout=120.0, retries=2),
+    "sources.add_text": OperationPolicy(timeout=120.0, retries=2),
+    "sources.add_file": OperationPolicy(timeout=600.0, retries=2),
+    "sources.list": OperationPolicy(timeout=60.0, retries=3, idempotent=True),
+    "sources.get": OperationPolicy(timeout=60.0, retries=3, idempotent=True),
+    "sources.wait_until_ready": OperationPolicy(timeout=None, retries=2, idempotent=True),
+    "sources.wait_for_sources": OperationPolicy(timeout=None, retries=2, idempotent=True),
+    "chat.ask": OperationPolicy(timeout=180.0, retries=2, idempotent=True, hedge=True),
+}
+DEFAULT_POLICY = OperationPolicy(timeout=120.0)
+# Their wait=True readiness wait runs as a separate sources.wait_until_ready call.
+_ADD_SOURCE_OPS = {"sources.add_url", "sources.add_text", "sources.add_file"}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling NotebookLM while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"NotebookLM 暫時無法使用，請於 {retry_after:.0f} 秒後重試 (circuit breaker open)")
+        self.retry_after = retry_after
+
+
+@functools.cache
+def _transient_errors() -> tuple[type[BaseException], ...]:
+    import httpx
+    from notebooklm import NetworkError, RateLimitError, ServerError
+    return (NetworkError, RateLimitError, ServerError, httpx.TransportError, TimeoutError)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Errors that say the backend (or the path to it) is struggling, not the request."""
+    return isinstance(error, _transient_errors())
+
+
+def is_not_found(error: BaseException) -> bool:
+    """The notebook / source no longer exists (e.g. it was deleted outside this process)."""
+    import notebooklm
+    # Older notebooklm-py releases have no NotFoundError.
+    not_found = getattr(notebooklm, "NotFoundError", None)
+    return not_found is not None and isinstance(error, not_found)
+
+
+def _retryable(policy: OperationPolicy, error: BaseException) -> bool:
+    if policy.idempotent:
+        return is_transient(error)
+    from notebooklm import RateLimitError
+    # A rate-limited call was rejected before doing anything, so even
+    # non-idempotent operations can safely be sent again.
+    return isinstance(error, RateLimitError)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError unless the call may proceed; True if it is the half-open probe."""
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half-open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        if state == "half-open":
+            # The cooldown is over; the probe's outcome decides, so never say "retry in 0 s".
+            retry_after = BREAKER_PROBE_RETRY_SECONDS
+        else:
+            retry_after = max(1.0, self.cooldown - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(retry_after)
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("NotebookLM circuit breaker closed")
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probe_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("NotebookLM circuit breaker opened after %d failure(s)", self.failures)
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def abandon_probe(self):
+        # A cancelled probe says nothing about the backend; let the next call probe.
+        self._probe_in_flight = False
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one operation."""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# Shared by every client in the process: FastAPI and MCP build a client per
+# request, and breaker state/latency history must survive across them.
+breaker = CircuitBreaker()
+latencies: dict[str, LatencyTracker] = {}
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+async def _hedged(op: str, fn, args, kwargs, timeout: float | None):
+    tracker = latencies.get(op)
+    p95 = tracker.percentile(HEDGE_PERCENTILE) if tracker and len(tracker.samples) >= HEDGE_MIN_SAMPLES else None
+    delay = p95 or HEDGE_DEFAULT_DELAY
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    primary = asyncio.ensure_future(fn(*args, **kwargs))
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay if deadline is None else min(delay, timeout))
+        if done:
+            return primary.result()
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"{op} timed out after {timeout:.0f}s")
+
+        logger.info("Hedging %s after %.1fs", op, delay)
+        pending.add(asyncio.ensure_future(fn(*args, **kwargs)))
+        last_error = None
+        while pending:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"{op} timed out after {timeout:.0f}s")
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call(op: str, fn, *args, **kwargs):
+    """Invoke one NotebookLM coroutine method under the policy registered for `op`."""
+    if op in _ADD_SOURCE_OPS and kwargs.get("wait"):
+        # Split off the readiness wait: it is unscheduled polling and must not hold
+        # the upload's slot, and a retried wait should not upload the source again.
+        kwargs.pop("wait")
+        wait_timeout = kwargs.pop("wait_timeout", 120.0)
+        source = await call(op, fn, *args, **kwargs)
+        notebook_id = args[0] if args else kwargs["notebook_id"]
+        return await call("sources.wait_until_ready", fn.__self__.wait_until_ready,
+                          notebook_id, source.id, timeout=wait_timeout)
+    with span(op, priority=current_priority(), wait=kwargs.get("wait")) as current:
+        return await _call(op, fn, args, kwargs, current)
+
+
+async def _call(op: str, fn, args, kwargs, current):
+    policy = POLICIES.get(op, DEFAULT_POLICY)
+    timeout = policy.timeout
+    # Follow-up asks extend a conversation, so only fresh questions are hedged.
+    hedge = HEDGE_ASKS and policy.hedge and kwargs.get("conversation_id") is None
+
+    attempt = 0
+    while True:
+        probe = False
+        try:
+            # Retries re-queue, so a backing-off call does not hold a slot.
+            enqueued = time.monotonic()
+            async with scheduler.slot(op):
+                current.set(attempts=attempt + 1, queued_s=round(time.monotonic() - enqueued, 3))
+                probe = breaker.before_call()
+                started = time.monotonic()
+                if hedge:
+                    result = await _hedged(op, fn, args, kwargs, timeout)
+                else:
+                    result = await asyncio.wait_for(fn(*args, **kwargs), timeout)
+        except CircuitOpenError:
+            raise
+        except asyncio.CancelledError:
+            if probe:
+                breaker.abandon_probe()
+            raise
+        except Exception as e:
+            if is_transient(e):
+                breaker.record_failure()
+            else:
+                # The backend answered (e.g. validation error): it is healthy.
+                breaker.record_success()
+            if attempt >= policy.retries or not _retryable(policy, e):
+                raise
+            attempt += 1
+            delay = _backoff(attempt)
+            logger.warning("%s failed (%s); retry %d/%d in %.1fs", op, e, attempt, policy.retries, delay)
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        latencies.setdefault(op, LatencyTracker()).add(time.monotonic() - started)
+        return result
+
+
+class _Namespace:
+    """Proxy for client.notebooks / .sources / .chat that routes coroutines through call()."""
+
+    def __init__(self, name: str, target):
+        self._name = name
+        self._target = target
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if not inspect.iscoroutinefunction(value):
+            return value
+        op = f"{self._name}.{attr}"
+
+        @functools.wraps(value)
+        async def wrapper(*args, **kwargs):
+            return await call(op, value, *args, **kwargs)
+
+        return wrapper
+
+
+class ResilientClient:
+    """Drop-in wrapper for NotebookLMClient; unknown attributes pass through."""
+
+    def __init__(self, client: "NotebookLMClient"):
+        self._client = client
+        self.notebooks = _Namespace("notebooks", client.notebooks)
+        self.sources = _Namespace("sources", client.sources)
+        self.chat = _Namespace("chat", client.chat)
+
+    @classmethod
+    async def from_storage(cls, *args, **kwargs) -> "ResilientClient":
+        from notebooklm import NotebookLMClient
+        return cls(await NotebookLMClient.from_storage(*args, **kwargs))
+
+    async def __aenter__(self) -> "ResilientClient":
+        await self._client.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return await self._client.__aexit__(exc_type, exc_val, exc_tb)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -0,0 +1,196 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Priority scheduling for NotebookLM operations
+#
+# nlm_resilience.call() takes a slot from the process-wide `scheduler` before
+# every attempt, so interactive chat, one-shot analyses and bulk jobs share
+# the account's capacity by class instead of first come, first served:
+#
+#   - each class has a weight (share of dispatches under contention) and a
+#     concurrency cap of its own, under a global cap. The class caps are
+#     work-conserving: when no class within its cap is waiting, a class may
+#     borrow idle global slots beyond its cap. Borrowed slots are not
+#     preempted; as they are released, classes within their cap go first;
+#   - queued operations are ordered by start-time fair queuing tags, so a
+#     class gets roughly weight / sum(weights) of the slots while it is busy;
+#   - aging credits waiting time against the tag, so a low class still makes
+#     progress behind a steady stream of higher-class work.
+#
+# Callers pick the class with `with priority("interactive"): ...`; the value
+# is a context variable, so it follows tasks spawned inside the block.
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class PriorityClass:
+    weight: float
+    max_concurrency: int
+
+
+DEFAULT_CLASSES = {
+    "interactive": PriorityClass(weight=8, max_concurrency=4),
+    "analysis": PriorityClass(weight=3, max_concurrency=3),
+    "bulk": PriorityClass(weight=1, max_concurrency=2),
+}
+DEFAULT_CLASS = "analysis"
+MAX_CONCURRENCY = 6           # NotebookLM operations in flight per process; 0 disables
+AGING_RATE = 0.05             # virtual time credited per second spent queued
+
+# Source-readiness polling mostly sleeps; holding a slot for it would starve others.
+UNSCHEDULED_OPS = {"sources.wait_until_ready", "sources.wait_for_sources"}
+
+_current_class = contextvars.ContextVar("nlm_priority", default=DEFAULT_CLASS)
+
+
+def parse_classes(spec: str) -> dict[str, PriorityClass]:
+    """'interactive=8:4,analysis=3:3,bulk=1:2' -> {name: PriorityClass(weight, max_concurrency)}."""
+    classes = {}
+    for part in spec.split(","):
+        name, _, value = part.strip().partition("=")
+        weight, _, cap = value.partition(":")
+        classes[name] = PriorityClass(weight=float(weight), max_concurrency=int(cap))
+        if classes[name].max_concurrency <= 0:
+            # The class would never be dispatched and its callers would queue forever.
+            raise ValueError(f"priority class {name!r} needs max_concurrency >= 1, got {cap!r}")
+    return classes
+
+
+@contextmanager
+def priority(name: str):
+    """Run the enclosed NotebookLM calls (and tasks started inside) in class `name`."""
+    token = _current_class.set(name)
+    try:
+        yield
+    finally:
+        _current_class.reset(token)
+
+
+def current_priority() -> str:
+    return _current_class.get()
+
+
+class _Waiter:
+    __slots__ = ("cls", "tag", "enqueued", "future")
+
+    def __init__(self, cls: str, tag: float):
+        self.cls = cls
+        self.tag = tag
+        self.enqueued = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class PriorityScheduler:
+    def __init__(self, classes: dict[str, PriorityClass] = DEFAULT_CLASSES,
+                 max_concurrency: int = MAX_CONCURRENCY, aging_rate: float = AGING_RATE):
+        self.classes = dict(classes)
+        self.max_concurrency = max_concurrency
+        self.aging_rate = aging_rate
+        self._queues = {name: deque() for name in self.classes}
+        self._running = {name: 0 for name in self.classes}
+        self._finish = {name: 0.0 for name in self.classes}
+        self._vtime = 0.0
+        self._total = 0
+        self._dispatched = {name: 0 for name in self.classes}
+        self._waits = {name: deque(maxlen=200) for name in self.classes}
+
+    @classmethod
+    def from_env(cls) -> "PriorityScheduler":
+        spec = os.environ.get("NOTEBOOKLM_PRIORITY_CLASSES")
+        return cls(
+            classes=parse_classes(spec) if spec else DEFAULT_CLASSES,
+            max_concurrency=int(os.environ.get("NOTEBOOKLM_MAX_CONCURRENCY", MAX_CONCURRENCY)),
+            aging_rate=float(os.environ.get("NOTEBOOKLM_PRIORITY_AGING", AGING_RATE)),
+        )
+
+    def _resolve(self, cls: str | None) -> str:
+        cls = cls or _current_class.get()
+        if cls in self.classes:
+            return cls
+        return DEFAULT_CLASS if DEFAULT_CLASS in self.classes else next(iter(self.classes))
+
+    def _pick(self, borrow: bool = False) -> str | None:
+        now = time.monotonic()
+        best, best_key = None, None
+        for name, queue in self._queues.items():
+            if not queue or (not borrow and self._running[name] >= self.classes[name].max_concurrency):
+                continue
+            head = queue[0]
+            key = head.tag - self.aging_rate * (now - head.enqueued)
+            if best_key is None or key < best_key:
+                best, best_key = name, key
+        return best
+
+    def _dispatch(self):
+        while self._total < self.max_concurrency:
+            name = self._pick() or self._pick(borrow=True)
+            if name is None:
+                return
+            waiter = self._queues[name].popleft()
+            self._running[name] += 1
+            self._total += 1
+            self._vtime = max(self._vtime, waiter.tag)
+            self._dispatched[name] += 1
+            self._waits[name].append(time.monotonic() - waiter.enqueued)
+            waiter.future.set_result(None)
+
+    def _release(self, name: str):
+        self._running[name] -= 1
+        self._total -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, op: str = "", cls: str | None = None):
+        """Hold one NotebookLM concurrency slot for the duration of the block."""
+        if self.max_concurrency <= 0 or op in UNSCHEDULED_OPS:
+            yield
+            return
+
+        name = self._resolve(cls)
+        # Start-time fair queuing: a class that was idle restarts at the
+        # current virtual time instead of cashing in its idle period.
+        tag = max(self._vtime, self._finish[name]) + 1 / self.classes[name].weight
+        self._finish[name] = tag
+        waiter = _Waiter(name, tag)
+        self._queues[name].append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(name)     # granted just as we were cancelled
+            else:
+                self._queues[name].remove(waiter)
+            raise
+        try:
+            yield
+        finally:
+            self._release(name)
+
+    def snapshot(self) -> dict:
+        """Per-class queue depth, in-flight count, dispatches and p95 queueing delay."""
+        classes = {}
+        for name, spec in self.classes.items():
+            waits = sorted(self._waits[name])
+            classes[name] = {
+                "weight": spec.weight,
+                "max_concurrency": spec.max_concurrency,
+                "queued": len(self._queues[name]),
+                "running": self._running[name],
+                "dispatched": self._dispatched[name],
+                "wait_p95_s": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 3) if waits else None,
+            }
+        return {"max_concurrency": self.max_concurrency, "running": self._total, "classes": classes}
+
+
+# One scheduler per process, shared by every client (see nlm_resilience.call).
+scheduler = PriorityScheduler.from_env()
@@ -0,0 +1,253 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Lightweight request tracing
+#
+# `trace(name)` starts one trace per request / batch item; `span(name)` times
+# a stage inside it (nlm_resilience.call() opens a span for every NotebookLM
+# operation, analysis_pipeline for download / spool / preprocess). The
+# current span is a context variable, so spans opened in tasks spawned
+# inside a trace attach to it.
+#
+# Finished traces are written as OTLP/JSON (one ExportTraceServiceRequest per
+# line) to NOTEBOOKLM_TRACE_FILE and/or POSTed to NOTEBOOKLM_OTLP_ENDPOINT
+# (e.g. http://localhost:4318 for an OpenTelemetry collector), keeping a
+# NOTEBOOKLM_TRACE_SAMPLE fraction of them. Independently of sampling, any
+# trace slower than NOTEBOOKLM_SLOW_TRACE_SECONDS is dumped as a span tree
+# to the `nlm_tracing` logger and, if set, NOTEBOOKLM_SLOW_LOG.
+# ---------------------------------------------------------------------------
+
+SERVICE_NAME = os.environ.get("NOTEBOOKLM_SERVICE_NAME", "gy-notebooklm")
+TRACE_FILE = os.environ.get("NOTEBOOKLM_TRACE_FILE")
+OTLP_ENDPOINT = os.environ.get("NOTEBOOKLM_OTLP_ENDPOINT")
+SAMPLE_RATE = float(os.environ.get("NOTEBOOKLM_TRACE_SAMPLE", "1.0"))
+SLOW_TRACE_SECONDS = float(os.environ.get("NOTEBOOKLM_SLOW_TRACE_SECONDS", "60"))
+SLOW_LOG = os.environ.get("NOTEBOOKLM_SLOW_LOG")
+MAX_SPANS_PER_TRACE = 2000     # batch tools can open many spans; drop the rest
+
+_current_span = contextvars.ContextVar("nlm_span", default=None)
+
+
+class Trace:
+    def __init__(self, sampled: bool):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.sampled = sampled
+        self.spans: list[Span] = []
+        self.dropped = 0
+
+
+class Span:
+    def __init__(self, trace: Trace, name: str, parent: "Span | None", attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.error: str | None = None
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+
+class _NoSpan:
+    """Returned by span() outside any trace, so callers can always call .set()."""
+
+    def set(self, **attributes):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+@contextmanager
+def _run(span: Span):
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time one stage of the current trace; a no-op outside a trace."""
+    parent = _current_span.get()
+    if parent is None:
+        yield _NO_SPAN
+        return
+    trace = parent.trace
+    if len(trace.spans) >= MAX_SPANS_PER_TRACE:
+        trace.dropped += 1
+        yield _NO_SPAN
+        return
+    child = Span(trace, name, parent, attributes)
+    trace.spans.append(child)
+    with _run(child):
+        yield child
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """Start a trace for one request / batch item (a child span if one is already active)."""
+    if _current_span.get() is not None:
+        with span(name, **attributes) as child:
+            yield child
+        return
+    root_trace = Trace(sampled=random.random() < SAMPLE_RATE)
+    root = Span(root_trace, name, None, attributes)
+    root_trace.spans.append(root)
+    try:
+        with _run(root):
+            yield root
+    finally:
+        _finish(root_trace, root)
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace) -> dict:
+    """One trace as an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for s in trace.spans:
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+            "name": s.name,
+            "kind": 2 if s.parent_id is None else 1,    # SERVER for the root, INTERNAL below
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns or s.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "nlm_tracing"}, "spans": spans}],
+    }]}
+
+
+def format_tree(trace: Trace) -> str:
+    """Indented span tree: start offset from the root, duration, name, attributes, error."""
+    root = trace.spans[0]
+    children: dict[str | None, list[Span]] = {}
+    for s in trace.spans[1:]:
+        children.setdefault(s.parent_id, []).append(s)
+
+    lines = [f"trace {trace.trace_id} {root.name} {root.duration:.2f}s"]
+
+    def walk(s: Span, depth: int):
+        offset = (s.start_ns - root.start_ns) / 1e9
+        attrs = " ".join(f"{k}={v}" for k, v in s.attributes.items())
+        error = f" ERROR {s.error}" if s.error else ""
+        lines.append(f"{'  ' * depth}+{offset:7.2f}s {s.duration:8.2f}s  {s.name}  {attrs}{error}".rstrip())
+        for child in sorted(children.get(s.span_id, []), key=lambda c: c.start_ns):
+            walk(child, depth + 1)
+
+    walk(root, 1)
+    if trace.dropped:
+        lines.append(f"  ({trace.dropped} span(s) dropped over the {MAX_SPANS_PER_TRACE}-span limit)")
+    return "\n".join(lines)
+
+
+class _Exporter:
+    """Background thread that writes / POSTs finished traces off the request path."""
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=10000)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, payload):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="nlm-trace-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        try:
+            self._queue.put_nowait((kind, payload))
+        except queue.Full:
+            logger.warning("Trace export queue full; dropping a trace")
+
+    def flush(self, timeout: float = 5.0):
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _work(self):
+        while True:
+            kind, payload = self._queue.get()
+            try:
+                if kind == "file":
+                    _append(TRACE_FILE, json.dumps(payload, ensure_ascii=False))
+                elif kind == "otlp":
+                    request = urllib.request.Request(
+                        f"{OTLP_ENDPOINT.rstrip('/')}/v1/traces", data=json.dumps(payload).encode("utf-8"),
+                        headers={"Content-Type": "application/json"}, method="POST",
+                    )
+                    urllib.request.urlopen(request, timeout=10).close()
+                elif kind == "slow":
+                    _append(SLOW_LOG, payload)
+            except Exception as e:
+                logger.warning("Trace export (%s) failed: %s", kind, e)
+            finally:
+                self._queue.task_done()
+
+
+def _append(path: str, text: str):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text + "\n")
+
+
+_exporter = _Exporter()
+
+
+def _finish(trace: Trace, root: Span):
+    if trace.sampled and (TRACE_FILE or OTLP_ENDPOINT):
+        payload = to_otlp(trace)
+        if TRACE_FILE:
+            _exporter.submit("file", payload)
+        if OTLP_ENDPOINT:
+            _exporter.submit("otlp", payload)
+    if root.duration >= SLOW_TRACE_SECONDS:
+        tree = format_tree(trace)
+        logger.warning("Slow trace (over %.0fs):\n%s", SLOW_TRACE_SECONDS, tree)
+        if SLOW_LOG:
+            _exporter.submit("slow", f"{time.strftime('%Y-%m-%d %H:%M:%S')} {tree}")
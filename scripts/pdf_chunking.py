@@ -0,0 +1,56 @@
+import math
+import os
+
+# Splits large PDFs into page-range chunks that are uploaded as separate
+# NotebookLM sources (see analysis_pipeline.create_notebook_with_file).
+# Smaller sources ingest in parallel and stay under the per-source limits.
+
+MAX_SOURCES_PER_NOTEBOOK = 50
+
+
+def is_pdf(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() == ".pdf"
+
+
+def plan_chunks(num_pages: int, file_size: int, pages_per_chunk: int | None = None,
+                max_chunk_bytes: int | None = None) -> list[tuple[int, int]]:
+    """Return 0-based, end-exclusive page ranges.
+
+    `max_chunk_bytes` is turned into a page count from the average page size,
+    which avoids re-serializing the document just to measure it. The result is
+    capped at MAX_SOURCES_PER_NOTEBOOK chunks.
+    """
+    if num_pages <= 0 or (pages_per_chunk is None and max_chunk_bytes is None):
+        return [(0, num_pages)]
+    size_pages = num_pages
+    if max_chunk_bytes:
+        size_pages = max(1, math.floor(num_pages * max_chunk_bytes / max(file_size, 1)))
+    per_chunk = min(pages_per_chunk or num_pages, size_pages)
+    per_chunk = max(per_chunk, math.ceil(num_pages / MAX_SOURCES_PER_NOTEBOOK))
+    return [(start, min(start + per_chunk, num_pages)) for start in range(0, num_pages, per_chunk)]
+
+
+def split_pdf(path: str, out_dir: str, pages_per_chunk: int | None = None,
+              max_chunk_bytes: int | None = None) -> list[str]:
+    """Write `path` as one PDF per page range into `out_dir` and return their paths.
+
+    Returns [path] unchanged when the document fits in a single chunk.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(path)
+    ranges = plan_chunks(len(reader.pages), os.path.getsize(path), pages_per_chunk, max_chunk_bytes)
+    if len(ranges) <= 1:
+        return [path]
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    chunks = []
+    for start, end in ranges:
+        writer = PdfWriter()
+        for page in reader.pages[start:end]:
+            writer.add_page(page)
+        chunk_path = os.path.join(out_dir, f"{stem}_p{start + 1}-{end}.pdf")
+        with open(chunk_path, "wb") as f:
+            writer.write(f)
+        chunks.append(chunk_path)
+    return chunks
@@ -0,0 +1,206 @@
+import asyncio
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils", "youtube"))
+
+import analyze_urls
+import download_videos
+from analyze_urls import RetryBudget, analyze_with_retries, cleanup_orphaned_notebooks, register_videos, write_report
+from batch_manifest import DONE, Manifest, video_key
+from collect_urls import PLAYLIST_URL, iter_playlist_entries
+from nlm_resilience import ResilientClient
+from nlm_scheduler import priority
+from nlm_tracing import span, trace
+
+# Streaming playlist pipeline: collect -> [download] -> analyze -> report.
+# Stages are joined by bounded queues, so video #1 is analyzed while the
+# playlist is still being enumerated and later items are still downloading.
+
+_DONE = object()
+STAGES = ("collect", "download", "analyze", "report")
+
+
+class Progress:
+    """End-to-end counters per stage, printed as one status line per event."""
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.done = {s: 0 for s in stages}
+        self.failed = {s: 0 for s in stages}
+        self.started = time.monotonic()
+
+    def ok(self, stage, video):
+        self.done[stage] += 1
+        self._print(f"{stage} ok: {video['title']}")
+
+    def fail(self, stage, video, error):
+        self.failed[stage] += 1
+        self._print(f"{stage} FAILED: {video['title']}: {error}")
+
+    def _print(self, event):
+        counts = " | ".join(
+            f"{s} {self.done[s]}" + (f" ({self.failed[s]} failed)" if self.failed[s] else "")
+            for s in self.stages
+        )
+        print(f"[{time.monotonic() - self.started:7.1f}s] {counts} :: {event}")
+
+
+async def _collect(playlist_url, limit, outbox, progress):
+    """Enumerate the playlist in a thread and stream entries into the pipeline."""
+    entries = iter_playlist_entries(playlist_url, limit)
+    try:
+        while True:
+            entry = await asyncio.to_thread(next, entries, None)
+            if entry is None:
+                break
+            if entry['id'] is None:
+                continue
+            progress.ok("collect", entry)
+            await outbox.put(entry)
+    finally:
+        await outbox.put(_DONE)
+
+
+async def _stage(name, fn, inbox, outbox, concurrency, progress):
+    """Run `concurrency` workers that apply `fn` to items from `inbox`.
+
+    Results that are not None are forwarded to `outbox`. A failed item is
+    reported and dropped; it does not stop the rest of the pipeline.
+    """
+    async def worker():
+        while True:
+            video = await inbox.get()
+            if video is _DONE:
+                # Put the sentinel back so sibling workers also stop.
+                await inbox.put(_DONE)
+                return
+            try:
+                result = await fn(video)
+            except Exception as e:
+                progress.fail(name, video, e)
+                continue
+            if result is None:
+                continue
+            progress.ok(name, result)
+            if outbox is not None:
+                await outbox.put(result)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    if outbox is not None:
+        await outbox.put(_DONE)
+
+
+async def run_pipeline(playlist_url, limit=60, download=False, preset="notebooklm",
+                       download_workers=4, analyze_workers=3, queue_size=8):
+    os.makedirs(analyze_urls.OUTPUT_DIR, exist_ok=True)
+    manifest = Manifest(analyze_urls.MANIFEST_FILE)
+    manifest.reset_interrupted()
+    budget = RetryBudget(analyze_urls.RETRY_BUDGET)
+    stages = STAGES if download else tuple(s for s in STAGES if s != "download")
+    progress = Progress(stages)
+    loop = asyncio.get_running_loop()
+
+    collected = asyncio.Queue(maxsize=queue_size)
+    to_analyze = asyncio.Queue(maxsize=queue_size) if download else collected
+    analyzed = asyncio.Queue(maxsize=queue_size)
+
+    print("Connecting to NotebookLM...")
+    async with await ResilientClient.from_storage() as client:
+        await cleanup_orphaned_notebooks(client, manifest)
+
+        async def skip_or_pass(video):
+            register_videos(manifest, [video])
+            if manifest.get(video_key(video))['status'] == DONE:
+                print(f"Skipping {video['title']} (already done)")
+                return None
+            return video
+
+        async def analyze(video):
+            if await skip_or_pass(video) is None:
+                return None
+            return {**video, "answer": await analyze_with_retries(client, manifest, video, budget)}
+
+        async def report(video):
+            output_file = await asyncio.to_thread(write_report, video, video["answer"])
+            manifest.finish(video_key(video), output_file)
+            return video
+
+        tasks = [
+            _collect(playlist_url, limit, collected, progress),
+            _stage("analyze", analyze, to_analyze, analyzed, analyze_workers, progress),
+            _stage("report", report, analyzed, None, 1, progress),
+        ]
+
+        if download:
+            os.makedirs(download_videos.DOWNLOAD_DIR, exist_ok=True)
+            staging_dir = os.path.join(download_videos.DOWNLOAD_DIR, ".staging")
+            os.makedirs(staging_dir, exist_ok=True)
+            download_pool = ProcessPoolExecutor(max_workers=download_workers)
+            transcode_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+            archived = download_videos.read_archive(download_videos.ARCHIVE_FILE)
+
+            async def fetch(video):
+                if await skip_or_pass(video) is None:
+                    return None
+                key = download_videos.archive_id(video)
+                if key in archived:
+                    # The archive does not record where the audio went; analyze from the URL instead.
+                    print(f"Not downloading {video['title']} (already in download archive)")
+                    return video
+                with trace("video.download", video_id=video_key(video), title=video['title']):
+                    with span("download"):
+                        raw_path = await loop.run_in_executor(
+                            download_pool, download_videos.fetch_audio, video['url'], staging_dir)
+                    with span("transcode", preset=preset):
+                        audio_path = await loop.run_in_executor(
+                            transcode_pool, download_videos.transcode, raw_path, download_videos.DOWNLOAD_DIR, preset)
+                download_videos.record_archive(download_videos.ARCHIVE_FILE, key)
+                archived.add(key)
+                return {**video, "audio_path": audio_path}
+
+            tasks.append(_stage("download", fetch, collected, to_analyze, download_workers, progress))
+
+        try:
+            # A stage that dies cancels the others instead of leaving them blocked on its queue.
+            async with asyncio.TaskGroup() as group:
+                for task in tasks:
+                    group.create_task(task)
+        finally:
+            if download:
+                download_pool.shutdown(cancel_futures=True)
+                transcode_pool.shutdown(cancel_futures=True)
+            manifest.close()
+
+    elapsed = time.monotonic() - progress.started
+    print(f"\nPipeline finished in {elapsed:.1f}s: "
+          f"{progress.done['report']} report(s) written, "
+          f"{sum(progress.failed.values())} failure(s).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect, (optionally) download, analyze and report a playlist as one streaming pipeline.")
+    parser.add_argument("playlist_url", nargs="?", default=PLAYLIST_URL, help="Playlist URL")
+    parser.add_argument("--limit", type=int, default=60, help="Number of playlist items (default: 60)")
+    parser.add_argument("--download", action="store_true",
+                        help="Download audio locally and upload it instead of adding the URL")
+    parser.add_argument("--preset", choices=sorted(download_videos.PRESETS), default="notebooklm", help="Audio preset for --download (default: notebooklm)")
+    parser.add_argument("--download-workers", type=int, default=4, help="Concurrent downloads (default: 4)")
+    parser.add_argument("--analyze-workers", type=int, default=3, help="Concurrent NotebookLM analyses (default: 3)")
+    parser.add_argument("--queue-size", type=int, default=8, help="Bound of each inter-stage queue (default: 8)")
+    args = parser.parse_args()
+
+    with priority("bulk"):
+        asyncio.run(run_pipeline(
+            args.playlist_url,
+            limit=args.limit,
+            download=args.download,
+            preset=args.preset,
+            download_workers=args.download_workers,
+            analyze_workers=args.analyze_workers,
+            queue_size=args.queue_size,
+        ))
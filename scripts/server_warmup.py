@@ -0,0 +1,120 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from media_preprocess import CACHE_DIR, ffmpeg_available
+from nlm_resilience import ResilientClient
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Shared client, startup warm-up and readiness for fastapi_server.py and
+# mcp_server.py
+#
+# The server lifespan starts warm_up() in the background: it imports the
+# NotebookLM stack and the lazily loaded parsers, loads and validates the
+# stored auth state by opening the process-wide client, then makes one
+# cheap authenticated call so the connection pool is open before traffic
+# arrives. /healthz answers as soon as the process serves HTTP; /readyz
+# answers 503 until warm-up has finished, so an autoscaler only routes to
+# replicas that will not pay the cold path on their first request.
+# A failed warm-up (e.g. expired login) is retried until it succeeds.
+# ---------------------------------------------------------------------------
+
+WARMUP_RETRY_SECONDS = 30
+# Imported lazily on the request path (nlm_resilience, pdf_chunking).
+WARM_IMPORTS = ("notebooklm", "httpx", "pypdf")
+
+
+class SharedClient:
+    """Process-wide ResilientClient, opened on first use (normally by warm_up) and closed at shutdown."""
+
+    def __init__(self):
+        self.client: ResilientClient | None = None
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> ResilientClient:
+        async with self._lock:
+            if self.client is None:
+                client = await ResilientClient.from_storage()
+                await client.__aenter__()
+                self.client = client
+        return self.client
+
+    @asynccontextmanager
+    async def use(self):
+        # Same shape as `async with await ResilientClient.from_storage()`,
+        # but the shared connection stays open.
+        yield await self.get()
+
+    async def close(self):
+        client, self.client = self.client, None
+        if client is not None:
+            await client.__aexit__(None, None, None)
+
+
+class Readiness:
+    """Warm-up progress reported by /readyz."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.ready_at: float | None = None
+        self.attempts = 0
+        self.error: str | None = None
+        self.steps: dict[str, float] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "attempts": self.attempts,
+            "error": self.error,
+            "steps_s": {name: round(seconds, 3) for name, seconds in self.steps.items()},
+            "warmup_s": round(self.ready_at - self.started_at, 3) if self.ready else None,
+            "uptime_s": round(time.monotonic() - self.started_at, 1),
+        }
+
+
+def prime_caches():
+    """Blocking part of warm-up: imports and probes that requests would otherwise pay for."""
+    for name in WARM_IMPORTS:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            logger.info("Skipping warm import of %s (not installed)", name)
+    ffmpeg_available()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+
+async def _step(readiness: Readiness, name: str, awaitable):
+    started = time.monotonic()
+    result = await awaitable
+    readiness.steps[name] = time.monotonic() - started
+    return result
+
+
+async def warm_up(clients: SharedClient, readiness: Readiness, retry_seconds: float = WARMUP_RETRY_SECONDS):
+    """Background task: prime caches, open and validate the shared client; retry until ready."""
+    while True:
+        readiness.attempts += 1
+        try:
+            # In a thread, so /healthz keeps answering while modules import.
+            await _step(readiness, "imports", asyncio.to_thread(prime_caches))
+            client = await _step(readiness, "auth", clients.get())
+            await _step(readiness, "connect", client.notebooks.list())
+        except Exception as e:
+            readiness.error = f"{type(e).__name__}: {e}"
+            logger.warning("Warm-up attempt %d failed (%s); retrying in %.0fs",
+                           readiness.attempts, readiness.error, retry_seconds)
+            await asyncio.sleep(retry_seconds)
+            continue
+        readiness.error = None
+        readiness.ready_at = time.monotonic()
+        logger.info("Warm-up finished in %.2fs", readiness.ready_at - readiness.started_at)
+        return
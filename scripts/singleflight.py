@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Hashable
+
+from nlm_tracing import span
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Request coalescing ("single-flight") for the analysis endpoints
+#
+# Concurrent identical requests (an agent retrying, several dashboards
+# refreshing at once) share one in-flight NotebookLM pipeline instead of each
+# running their own. Nothing is cached: once the shared call finishes, the
+# next request for the same key starts a fresh one.
+# ---------------------------------------------------------------------------
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run at most one `fn()` per key at a time; concurrent callers await the same result.
+
+    The work runs in its own task, so one caller being cancelled (e.g. a client
+    disconnect) does not cancel it for the others. Only when every caller for
+    a key has gone away is the work itself cancelled, which lets the analysis
+    pipeline delete its temporary notebook. Exceptions propagate to every
+    caller of that flight.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, _Call] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight(), "started": self.started, "coalesced": self.coalesced}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        call = self._calls.get(key)
+        # The work task is created inside the span, so its spans nest under the
+        # first caller's trace; coalesced callers see only the wait.
+        with span("singleflight", coalesced=call is not None):
+            if call is None:
+                call = _Call(asyncio.ensure_future(fn()))
+                call.task.add_done_callback(lambda task: self._forget(key, call))
+                self._calls[key] = call
+                self.started += 1
+            else:
+                self.coalesced += 1
+                logger.info("Coalesced duplicate request for %r", key)
+
+            call.waiters += 1
+            try:
+                return await asyncio.shield(call.task)
+            finally:
+                call.waiters -= 1
+                if call.waiters == 0 and not call.task.done():
+                    # Everyone left: stop the work, and let the next request for
+                    # this key start over rather than join a cancelled flight.
+                    self._forget(key, call)
+                    call.task.cancel()
+                    # Wait for the work's own cleanup (e.g. deleting its
+                    # notebook), so nothing is left running once we return.
+                    await asyncio.wait({call.task})
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if call.task.done() and not call.task.cancelled():
+            call.task.exception()   # mark retrieved; callers already received it
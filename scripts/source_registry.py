@@ -0,0 +1,170 @@
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from media_preprocess import file_sha256
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Ref-counted source reuse for fastapi_server.py and mcp_server.py
+#
+# A notebook holding an ingested source is registered under a key (content
+# hash for files, canonical URL for web pages / videos). Chat sessions and
+# one-shot analyses acquire the notebook instead of uploading their own copy
+# and release it when done; each ask runs in its own conversation, so users
+# sharing a notebook do not see each other's turns. Notebooks are deleted
+# only after their refcount has been zero for the idle TTL.
+# ---------------------------------------------------------------------------
+
+SOURCE_IDLE_TTL_SECONDS = 1800   # 30 minutes
+
+# Query parameters that never change what a URL points at: any `utm_*`
+# parameter plus these exact names, and YouTube's share / referrer markers.
+_TRACKING_PREFIX = "utm_"
+_TRACKING_PARAMS = {"fbclid", "gclid"}
+_YOUTUBE_TRACKING_PARAMS = {"si", "feature"}
+_YOUTUBE_HOSTS = {"youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com"}
+
+
+def canonical_url(url: str) -> str:
+    """Normalize `url` so equivalent spellings map to the same source key.
+
+    YouTube links (watch, youtu.be, shorts, embed) collapse to the video id;
+    other URLs get a lowercase scheme/host, no fragment or default port and
+    sorted query parameters without tracking parameters.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    youtube = host == "youtu.be" or host in _YOUTUBE_HOSTS
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not (k.startswith(_TRACKING_PREFIX) or k in _TRACKING_PARAMS
+                     or (youtube and k in _YOUTUBE_TRACKING_PARAMS))]
+
+    video_id = None
+    if host == "youtu.be":
+        video_id = parts.path.strip("/").split("/")[0]
+    elif host in _YOUTUBE_HOSTS:
+        if parts.path == "/watch":
+            video_id = dict(query).get("v")
+        elif parts.path.startswith(("/shorts/", "/embed/", "/live/")):
+            video_id = parts.path.split("/")[2]
+    if video_id:
+        return f"youtube:{video_id}"
+
+    netloc = host
+    if parts.port and (parts.scheme, parts.port) not in (("http", 80), ("https", 443)):
+        netloc = f"{host}:{parts.port}"
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path or "/", urlencode(sorted(query)), ""))
+
+
+_digests: dict[tuple, str] = {}
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a local file, memoized by (path, size, mtime) so repeat calls skip the read."""
+    st = os.stat(path)
+    stat_key = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+    if stat_key not in _digests:
+        _digests[stat_key] = file_sha256(path)
+    return _digests[stat_key]
+
+
+@dataclass
+class SharedSource:
+    key: tuple
+    notebook_id: str
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    refcount: int = 0
+
+
+class SourceRegistry:
+    """Map source keys to ingested notebooks, shared by refcount."""
+
+    def __init__(self, idle_ttl_seconds: float = SOURCE_IDLE_TTL_SECONDS):
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._entries: dict[tuple, SharedSource] = {}
+        # Concurrent first requests for one key ingest it once.
+        self._ingest = SingleFlight()
+
+    def values(self) -> list[SharedSource]:
+        return list(self._entries.values())
+
+    async def acquire(self, key: tuple, create) -> str:
+        """Return the notebook id for `key`, ingesting it with `create()` on a miss.
+
+        `create` is a zero-argument coroutine function returning a notebook.
+        Every successful acquire must be paired with release(key, notebook_id).
+        """
+        async def ingest():
+            # Register inside the shared task, so a notebook is never lost
+            # even if every caller is cancelled right after it is created.
+            nb = await create()
+            self._entries[key] = SharedSource(key, nb.id)
+            logger.info("Registered shared source %r -> notebook %s", key, nb.id)
+
+        while (entry := self._entries.get(key)) is None:
+            await self._ingest.do(key, ingest)
+        entry.refcount += 1
+        entry.last_used = time.time()
+        return entry.notebook_id
+
+    def release(self, key: tuple, notebook_id: str):
+        """Drop one reference to the notebook `acquire` returned.
+
+        A no-op once `key` maps to another notebook: the reference was to an
+        entry that has since been discarded and ingested again.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry.notebook_id != notebook_id:
+            return
+        entry.refcount = max(0, entry.refcount - 1)
+        entry.last_used = time.time()
+
+    def discard(self, key: tuple, notebook_id: str | None = None) -> SharedSource | None:
+        """Forget `key` without deleting its notebook (e.g. it no longer exists).
+
+        With `notebook_id`, only if `key` still maps to that notebook, so a
+        caller never drops an entry another caller has already re-ingested.
+        """
+        entry = self._entries.get(key)
+        if entry is None or (notebook_id is not None and entry.notebook_id != notebook_id):
+            return None
+        return self._entries.pop(key)
+
+    def idle(self) -> list[SharedSource]:
+        now = time.time()
+        return [
+            e for e in self._entries.values()
+            if e.refcount == 0 and now - e.last_used > self.idle_ttl_seconds
+        ]
+
+    async def _delete(self, client, entry: SharedSource):
+        self._entries.pop(entry.key, None)
+        try:
+            await client.notebooks.delete(entry.notebook_id)
+        except Exception as e:
+            logger.warning("Failed to delete notebook %s: %s", entry.notebook_id, e)
+
+    async def reclaim(self, client) -> int:
+        """Delete notebooks that have been unreferenced for the idle TTL."""
+        removed = 0
+        for entry in self.idle():
+            # Re-check: an earlier delete yielded, and the entry may have been acquired since.
+            if entry.refcount == 0 and self._entries.get(entry.key) is entry:
+                await self._delete(client, entry)
+                removed += 1
+        if removed:
+            logger.info("Reclaimed %d idle shared source(s)", removed)
+        return removed
+
+    async def close_all(self, client) -> int:
+        """Delete every registered notebook (server shutdown)."""
+        entries = self.values()
+        for entry in entries:
+            await self._delete(client, entry)
+        return len(entries)
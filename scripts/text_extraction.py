@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import os
+import re
+import tempfile
+import urllib.request
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from media_preprocess import file_sha256
+from source_registry import canonical_url
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Optional local text extraction for text-based inputs
+#
+# NotebookLM parses uploaded PDFs / HTML itself, which dominates ingestion
+# time for large documents. extract_text() pulls the PDF text layer or the
+# readable part of an HTML page locally so the pipeline can submit it with
+# sources.add_text() instead. It runs in a process pool, so parsing scales
+# across cores and never blocks the event loop. Inputs that give too little
+# text (scanned PDFs, script-rendered pages) or too much for one source
+# return None and are uploaded as files as before. Results, including "not
+# extractable", are cached by content hash.
+# ---------------------------------------------------------------------------
+
+CACHE_DIR = os.environ.get("NOTEBOOKLM_TEXT_CACHE", os.path.join(tempfile.gettempdir(), "notebooklm-text-cache"))
+CACHE_MAX_BYTES = 1024 ** 3
+EXTRACTOR_VERSION = 1          # bump when extraction output changes, to skip stale cache entries
+MAX_WORKERS = int(os.environ.get("NOTEBOOKLM_EXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+
+PDF_EXTENSIONS = {".pdf"}
+HTML_EXTENSIONS = {".html", ".htm", ".xhtml"}
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown", ".rst", ".csv"}
+
+# A PDF averaging fewer extracted characters per page is treated as scanned.
+MIN_CHARS_PER_PAGE = 100
+# Shorter results (e.g. a page shell filled in by JavaScript) are not worth a text source.
+MIN_TEXT_CHARS = 200
+# NotebookLM's per-source word limit; longer documents are uploaded as files.
+MAX_SOURCE_WORDS = 500_000
+
+FETCH_TIMEOUT = 30
+FETCH_MAX_BYTES = 50 * 1024 ** 2
+FETCH_USER_AGENT = "Mozilla/5.0 (compatible; gy-notebooklm)"
+_FETCH_TYPES = {
+    "text/html": ".html",
+    "application/xhtml+xml": ".html",
+    "application/pdf": ".pdf",
+    "text/plain": ".txt",
+}
+
+
+def is_extractable(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in PDF_EXTENSIONS | HTML_EXTENSIONS | TEXT_EXTENSIONS
+
+
+def is_fetchable_url(url: str) -> bool:
+    """Web pages only: NotebookLM ingests YouTube links from the transcript, which we cannot fetch."""
+    return urlsplit(url).scheme in ("http", "https") and not canonical_url(url).startswith("youtube:")
+
+
+# ---------------------------------------------------------------------------
+# Extractors (run in worker processes)
+# ---------------------------------------------------------------------------
+
+def _pdf_text(path: str) -> str | None:
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    if reader.is_encrypted and not reader.decrypt(""):
+        return None
+    pages = [(page.extract_text() or "").strip() for page in reader.pages]
+    text = "\n\n".join(page for page in pages if page)
+    if len(text) < MIN_CHARS_PER_PAGE * len(reader.pages):
+        return None
+    return text
+
+
+class _ReadableText(HTMLParser):
+    """Rough readability: drop scripts and page chrome, prefer <article>/<main> when present."""
+
+    SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "nav", "header", "footer",
+                 "aside", "form", "button"}
+    MAIN_TAGS = {"article", "main"}
+    BLOCK_TAGS = {"p", "div", "section", "article", "main", "br", "li", "tr", "pre", "blockquote", "table",
+                  "ul", "ol", "dl", "dt", "dd", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title: list[str] = []
+        self.body: list[str] = []
+        self.main: list[str] = []
+        self._skip = 0
+        self._main = 0
+        self._in_title = False
+
+    def _emit(self, text: str):
+        self.body.append(text)
+        if self._main:
+            self.main.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+        elif tag == "title":
+            self._in_title = True
+        elif not self._skip:
+            if tag in self.MAIN_TAGS:
+                self._main += 1
+            if tag in self.BLOCK_TAGS:
+                self._emit("\n")
+            if re.fullmatch(r"h[1-6]", tag):
+                self._emit("#" * int(tag[1]) + " ")
+            elif tag == "li":
+                self._emit("- ")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif not self._skip:
+            if tag in self.BLOCK_TAGS:
+                self._emit("\n")
+            if tag in self.MAIN_TAGS:
+                self._main = max(0, self._main - 1)
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title.append(data)
+        elif not self._skip:
+            self._emit(data)
+
+    def text(self) -> str:
+        lines = []
+        for line in "".join(self.main or self.body).splitlines():
+            line = " ".join(line.split())
+            if line and not re.fullmatch(r"[#\- ]*", line):
+                lines.append(line)
+        title = " ".join("".join(self.title).split())
+        if title and (not lines or lines[0].lstrip("# ") != title):
+            lines.insert(0, f"# {title}")
+        return "\n".join(lines)
+
+
+def _read_text(path: str) -> str | None:
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return None
+
+
+def _html_text(path: str) -> str | None:
+    source = _read_text(path)
+    if source is None:
+        return None
+    parser = _ReadableText()
+    parser.feed(source)
+    parser.close()
+    return parser.text()
+
+
+def _plain_text(path: str) -> str | None:
+    text = _read_text(path)
+    return text.strip() if text is not None else None
+
+
+def _extractor(path: str):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in PDF_EXTENSIONS:
+        return _pdf_text
+    if ext in HTML_EXTENSIONS:
+        return _html_text
+    if ext in TEXT_EXTENSIONS:
+        return _plain_text
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+
+def _cache_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}-v{EXTRACTOR_VERSION}.txt")
+
+
+def _cache_get(key: str) -> str | None:
+    path = _cache_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    os.utime(path)
+    return text
+
+
+def _cache_put(key: str, text: str):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_path(key)
+    # Unique temporary name, so concurrent workers never expose a partial file.
+    partial = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(partial, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(partial, path)
+
+
+def _prune_cache():
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def extract_text(path: str) -> str | None:
+    """Text of `path` to submit as a text source, or None to upload the file itself.
+
+    Blocking and CPU-bound; use extract_text_async() from the event loop.
+    An empty cache entry records an input that gave no usable text, so a
+    scanned PDF is only parsed once.
+    """
+    extract = _extractor(path)
+    if extract is None:
+        return None
+    # Same bytes under another extension go through another extractor.
+    key = f"{file_sha256(path)}{extract.__name__}"
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached or None
+    try:
+        text = extract(path)
+    except ImportError as e:
+        logger.warning("Text extraction unavailable for %s (%s); uploading as a file", path, e)
+        return None
+    except Exception as e:
+        logger.warning("Text extraction failed on %s (%s); uploading as a file", path, e)
+        text = None
+    if text is not None and (len(text) < MIN_TEXT_CHARS or len(text.split()) > MAX_SOURCE_WORDS):
+        text = None
+
+    _cache_put(key, text or "")
+    try:
+        _prune_cache()
+    except OSError as e:
+        logger.warning("Text cache prune failed: %s", e)
+    return text
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+    return _pool
+
+
+async def extract_text_async(path: str) -> str | None:
+    """extract_text() in the worker process pool."""
+    if not is_extractable(path):
+        return None
+    return await asyncio.get_running_loop().run_in_executor(_executor(), extract_text, path)
+
+
+def fetch_page(url: str, dest_dir: str) -> str | None:
+    """Download `url` into `dest_dir` if it is an HTML page, PDF or plain text; None otherwise.
+
+    Non-UTF-8 pages are re-encoded so the extractors only deal with UTF-8.
+    """
+    request = urllib.request.Request(url, headers={"User-Agent": FETCH_USER_AGENT})
+    with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+        ext = _FETCH_TYPES.get(response.headers.get_content_type())
+        if ext is None:
+            return None
+        data = response.read(FETCH_MAX_BYTES + 1)
+        charset = response.headers.get_content_charset()
+    if len(data) > FETCH_MAX_BYTES:
+        return None
+    if ext != ".pdf" and charset and charset.lower().replace("-", "") != "utf8":
+        try:
+            data = data.decode(charset).encode("utf-8")
+        except (LookupError, UnicodeDecodeError):
+            pass
+    path = os.path.join(dest_dir, f"page{ext}")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
@@ -3,33 +3,41 @@ import sys
 sys.path.append("/home/barai/.local/lib/python3.12/site-packages")
 
 import os
-import yt_dlp
 import json
 
 PLAYLIST_URL = "https://www.youtube.com/playlist?list=PLnaQkVsMNAvCFj1C7C_NJEimhvS1-DUVN"
 URLS_FILE = "video_urls.json"
 
-def collect_urls(playlist_url, limit=240):
-    print(f"Collecting top {limit} video URLs from playlist: {playlist_url}")
-    
+def iter_playlist_entries(playlist_url, limit=240):
+    """Yield flat playlist entries (title, url, id, ie_key) without downloading."""
     ydl_opts = {
         'extract_flat': True,
         'quiet': True,
-        'playlist_items': f'1-240',
+        'playlist_items': f'1-{limit}',
         'ignoreerrors': True,
     }
-    
-    video_data = []
-    
+
+    import yt_dlp  # slow to import; only needed once we actually talk to YouTube
+
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
         result = ydl.extract_info(playlist_url, download=False)
-        if 'entries' in result:
+        if result and 'entries' in result:
             for entry in result['entries']:
                 if entry:
-                    video_data.append({
+                    yield {
                         'title': entry.get('title'),
-                        'url': entry.get('url') if entry.get('url') else f"https://www.youtube.com/watch?v={entry.get('id')}"
-                    })
+                        'url': entry.get('url') if entry.get('url') else f"https://www.youtube.com/watch?v={entry.get('id')}",
+                        'id': entry.get('id'),
+                        'ie_key': entry.get('ie_key') or 'Youtube',
+                    }
+
+def collect_urls(playlist_url, limit=240):
+    print(f"Collecting top {limit} video URLs from playlist: {playlist_url}")
+    
+    video_data = [
+        {'title': entry['title'], 'url': entry['url'], 'id': entry['id']}
+        for entry in iter_playlist_entries(playlist_url, limit)
+    ]
         
     print(f"Components found: {len(video_data)}")
     
@@ -1,38 +1,137 @@
-
 import os
-import yt_dlp
 import sys
+import argparse
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 # Ensure site-packages are in path
 sys.path.append("/home/barai/.local/lib/python3.12/site-packages")
 
+from collect_urls import iter_playlist_entries
+
 PLAYLIST_URL = "https://www.youtube.com/playlist?list=PLnaQkVsMNAvCFj1C7C_NJEimhvS1-DUVN"
 DOWNLOAD_DIR = "downloads"
+ARCHIVE_FILE = os.path.join(DOWNLOAD_DIR, "download_archive.txt")
 
-def download_videos(playlist_url, limit=10):
-    if not os.path.exists(DOWNLOAD_DIR):
-        os.makedirs(DOWNLOAD_DIR)
+# ffmpeg output settings per preset.
+# "notebooklm" is mono speech-quality audio: ~21 MB per hour, well under the
+# per-source upload limit, and transcription quality is unaffected.
+PRESETS = {
+    'mp3': {'ext': 'mp3', 'args': ['-vn', '-c:a', 'libmp3lame', '-b:a', '192k']},
+    'notebooklm': {'ext': 'mp3', 'args': ['-vn', '-ac', '1', '-ar', '22050', '-c:a', 'libmp3lame', '-b:a', '48k']},
+}
 
-    print(f"Downloading top {limit} videos from playlist: {playlist_url}")
-    
+def archive_id(entry):
+    """Return the yt-dlp download-archive key ("<extractor> <id>") for an entry."""
+    return f"{entry['ie_key'].lower()} {entry['id']}"
+
+def read_archive(archive_file):
+    if not os.path.exists(archive_file):
+        return set()
+    with open(archive_file, 'r', encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+def record_archive(archive_file, key):
+    # Single short O_APPEND write, so concurrent writers do not interleave lines.
+    with open(archive_file, 'a', encoding='utf-8') as f:
+        f.write(key + "\n")
+
+def fetch_audio(url, staging_dir):
+    """Download the best audio stream for one video (runs in a worker process).
+
+    Returns the path of the raw downloaded file; transcoding happens separately
+    so downloads are never blocked behind CPU-bound ffmpeg work.
+    """
     ydl_opts = {
         'format': 'bestaudio/best',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
-        'outtmpl': os.path.join(DOWNLOAD_DIR, '%(upload_date)s_%(title)s.%(ext)s'),
-        'quiet': False,
-        'ignoreerrors': True,
-        'playlist_items': f'1-{limit}', # Download first 10 items directly
-        'sleep_interval': 1, # Polite delay
+        'outtmpl': os.path.join(staging_dir, '%(upload_date)s_%(title)s_%(id)s.%(ext)s'),
+        'quiet': True,
+        'noprogress': True,
+        'noplaylist': True,
     }
-    
+    import yt_dlp  # slow to import; only needed once we actually talk to YouTube
+
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([playlist_url])
-        
-    print("Download process finished.")
+        info = ydl.extract_info(url, download=True)
+        downloads = info.get('requested_downloads') or []
+        if downloads and downloads[0].get('filepath'):
+            return downloads[0]['filepath']
+        return ydl.prepare_filename(info)
+
+def transcode(raw_path, output_dir, preset='mp3'):
+    """Transcode a raw download with ffmpeg according to `preset` and remove the original."""
+    spec = PRESETS[preset]
+    base = os.path.splitext(os.path.basename(raw_path))[0]
+    output_path = os.path.join(output_dir, f"{base}.{spec['ext']}")
+    cmd = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', raw_path, *spec['args'], output_path]
+    subprocess.run(cmd, check=True)
+    os.remove(raw_path)
+    return output_path
+
+def download_videos(playlist_url, limit=10, workers=4, preset='mp3', archive_file=ARCHIVE_FILE):
+    """Download and transcode a playlist concurrently.
+
+    Downloads run in a process pool of `workers` yt-dlp instances; each finished
+    download is handed to an ffmpeg pool sized to the CPU count. Entries already
+    listed in `archive_file` (yt-dlp --download-archive format) are skipped, and
+    an entry is only recorded once its transcode succeeded, so an interrupted run
+    can simply be restarted.
+    """
+    if not os.path.exists(DOWNLOAD_DIR):
+        os.makedirs(DOWNLOAD_DIR)
+    if shutil.which('ffmpeg') is None:
+        print("Error: ffmpeg not found in PATH.")
+        return
+
+    staging_dir = os.path.join(DOWNLOAD_DIR, ".staging")
+    os.makedirs(staging_dir, exist_ok=True)
+
+    print(f"Downloading top {limit} videos from playlist: {playlist_url}")
+
+    done = read_archive(archive_file)
+    entries = [e for e in iter_playlist_entries(playlist_url, limit) if e['id']]
+    pending = [e for e in entries if archive_id(e) not in done]
+    print(f"{len(entries) - len(pending)} already in archive, {len(pending)} to download "
+          f"({workers} download workers, {os.cpu_count()} transcode workers, preset={preset}).")
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as download_pool, \
+            ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as transcode_pool:
+        downloads = {download_pool.submit(fetch_audio, e['url'], staging_dir): e for e in pending}
+        transcodes = {}
+        for future in as_completed(downloads):
+            entry = downloads[future]
+            try:
+                raw_path = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Download failed: {entry['title']}: {e}")
+                continue
+            # ffmpeg runs as its own process, so a thread per job keeps all cores busy.
+            transcodes[transcode_pool.submit(transcode, raw_path, DOWNLOAD_DIR, preset)] = entry
+
+        for future in as_completed(transcodes):
+            entry = transcodes[future]
+            try:
+                output_path = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Transcode failed: {entry['title']}: {e}")
+                continue
+            record_archive(archive_file, archive_id(entry))
+            print(f"Saved: {output_path}")
+
+    print(f"Download process finished ({len(pending) - failed} ok, {failed} failed).")
 
 if __name__ == "__main__":
-    download_videos(PLAYLIST_URL)
+    parser = argparse.ArgumentParser(description="Download a YouTube playlist as audio, in parallel and resumable.")
+    parser.add_argument("playlist_url", nargs="?", default=PLAYLIST_URL, help="Playlist URL")
+    parser.add_argument("--limit", type=int, default=10, help="Number of playlist items to fetch (default: 10)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent yt-dlp download processes (default: 4)")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="mp3",
+                        help="Output preset; 'notebooklm' is low-bitrate mono audio for upload (default: mp3)")
+    parser.add_argument("--archive", default=ARCHIVE_FILE, help=f"Download archive file (default: {ARCHIVE_FILE})")
+    args = parser.parse_args()
+
+    download_videos(args.playlist_url, args.limit, args.workers, args.preset, args.archive)